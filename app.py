@@ -1,43 +1,75 @@
-from flask import Flask, render_template, request, jsonify, redirect, url_for, session, flash
+from flask import (Blueprint, Flask, Response, current_app, make_response, render_template, request, jsonify, redirect, url_for,
+                   session, flash, abort, send_from_directory)
+from flask.cli import with_appcontext
 from config import Config
-from scheduler import SchedulerManager
-from services.database import upsert_subscription, get_db_connection, get_recent_papers
+from services.database import (upsert_subscription, get_db_connection, mark_primary_write, get_topics,
+                               get_user_preferences)
 from services.auth import authenticate_user
-from services.content_generator import generate_email_content
-from services.email import EmailService
+from services.passwords import PasswordHasherBusy, hash_password
+from services.subscribers import EMAIL_REGEX, decode_lines, import_subscribers, export_subscribers, stream_subscribers
+from services.digest_jobs import enqueue_send_now, get_job_status
 from services.kakao import KakaoService
-from werkzeug.security import generate_password_hash
+from services.metrics import render_metrics
+from services.tracing import init_tracing
+from services import profiler
+from services import invalidation
+from services import assets
+import os
+import hmac
+import json
+import time
+import hashlib
+import csv
+import click
 import logging
 import re
 from datetime import datetime, timedelta
-from i18n import get_translation
+from i18n import get_translation, TIME_ZONES
 
-app = Flask(__name__)
-app.config.from_object(Config)
-
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger('INSTWAVE')
 
-scheduler_manager = SchedulerManager(app)
-scheduler_manager.start()
-
-EMAIL_REGEX = r'^[a-zA-Z0-9_.+-]+@[a-zA-Z0-9-]+\.[a-zA-Z0-9-.]+$'
+web = Blueprint('web', __name__)
 
 
-@app.context_processor
+@web.app_context_processor
 def inject_translations():
     lang = session.get('user_language', 'en')
-    return dict(_=lambda key: get_translation(key, lang))
-
-
-@app.route('/')
+    return dict(_=lambda key: get_translation(key, lang), asset_url=assets.asset_url)
+
+
+@web.route('/assets/<digest>/<path:filename>')
+def asset(digest, filename):
+    current = assets.static_digest(filename)
+    if current is None:
+        abort(404)
+    if digest != current:
+        # An old page asking for a superseded version gets the current one, briefly cacheable.
+        return redirect(assets.asset_url(filename))
+    response = send_from_directory(current_app.static_folder, filename, max_age=assets.IMMUTABLE_MAX_AGE,
+                                   conditional=True)
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+
+def _dashboard_etag(user_id, user, all_topics, next_tuesday):
+    """Changes whenever anything the dashboard shows changes: the user's preferences,
+    the topic list, the UI language, the next digest date or the templates and assets."""
+    topics_version = hashlib.sha256(json.dumps(all_topics, sort_keys=True).encode()).hexdigest()[:16]
+    updated = user['preferences_updated_at'].timestamp() if user['preferences_updated_at'] else 0
+    version = (f"{user_id}-{updated:.6f}-{topics_version}-{session.get('user_language', 'en')}-"
+               f"{next_tuesday}-{assets.build_digest()}")
+    return hashlib.sha256(version.encode()).hexdigest()[:32]
+
+
+@web.route('/')
 def home():
     if 'user_id' in session:
-        return redirect(url_for('dashboard'))
-    return redirect(url_for('login'))
+        return redirect(url_for('web.dashboard'))
+    return redirect(url_for('web.login'))
 
 
-@app.route('/register', methods=['GET', 'POST'])
+@web.route('/register', methods=['GET', 'POST'])
 def register():
     if request.method == 'POST':
         email = request.form.get('email')
@@ -59,7 +91,7 @@ def register():
                 flash('Email already exists. Please log in.', 'error')
                 return render_template('register.html')
 
-            password_hash = generate_password_hash(password)
+            password_hash = hash_password(password)
             user_id = upsert_subscription(
                 name=email.split('@')[0],
                 email=email,
@@ -75,7 +107,10 @@ def register():
             session['user_language'] = 'en'
 
             flash('Registration successful! Set your preferences below.', 'success')
-            return redirect(url_for('dashboard'))
+            return redirect(url_for('web.dashboard'))
+        except PasswordHasherBusy:
+            flash('Too many sign-ins right now. Please try again in a moment.', 'error')
+            return render_template('register.html'), 503
         except Exception as e:
             logger.exception("Registration failed")
             flash('Registration failed. Please try again.', 'error')
@@ -84,19 +119,24 @@ def register():
     return render_template('register.html')
 
 
-@app.route('/login', methods=['GET', 'POST'])
+@web.route('/login', methods=['GET', 'POST'])
 def login():
     if request.method == 'POST':
         email = request.form.get('email')
         password = request.form.get('password')
 
-        user = authenticate_user(email, password)
+        try:
+            user = authenticate_user(email, password)
+        except PasswordHasherBusy:
+            logger.warning("Password hashing pool saturated, refusing login")
+            flash('Too many sign-ins right now. Please try again in a moment.', 'error')
+            return render_template('login.html'), 503
         if user:
             session['user_id'] = user['id']
             session['user_email'] = user['email']
             session['user_language'] = user.get('language', 'en')
             flash('Login successful!', 'success')
-            return redirect(url_for('dashboard'))
+            return redirect(url_for('web.dashboard'))
         else:
             flash('Invalid email or password', 'error')
             return render_template('login.html')
@@ -104,7 +144,7 @@ def login():
     return render_template('login.html')
 
 
-@app.route('/change_language/<lang>')
+@web.route('/change_language/<lang>')
 def change_language(lang):
     if lang in ['en', 'ko']:
         session['user_language'] = lang
@@ -114,29 +154,36 @@ def change_language(lang):
                 cur = conn.cursor()
                 cur.execute("""
                     UPDATE users 
-                    SET language = %s
+                    SET language = %s, preferences_updated_at = NOW()
                     WHERE id = %s
                 """, (lang, session['user_id']))
+                invalidation.publish(cur, invalidation.USER, session['user_id'])
                 conn.commit()
+                mark_primary_write()
             except Exception as e:
                 logger.error(f"Failed to update language: {str(e)}")
             finally:
                 if cur: cur.close()
                 if conn: conn.close()
-    return redirect(request.referrer or url_for('dashboard'))
+    return redirect(request.referrer or url_for('web.dashboard'))
 
 
-@app.route('/dashboard', methods=['GET', 'POST'])
+@web.route('/dashboard', methods=['GET', 'POST'])
 def dashboard():
     if 'user_id' not in session:
         flash('Please login first', 'error')
-        return redirect(url_for('login'))
+        return redirect(url_for('web.login'))
     user_id = session['user_id']
     if request.method == 'POST':
         topics = request.form.getlist('topics')
         language = request.form.get('language', 'en')
         notification_method = request.form.get('notification_method', 'email')
         active = 'active' in request.form
+        preferred_hour = request.form.get('preferred_hour', '')
+        preferred_hour = int(preferred_hour) if preferred_hour.isdigit() and int(preferred_hour) < 24 else None
+        timezone = request.form.get('timezone')
+        # Asia/Seoul is the scheduler's own zone; store NULL so the user is sharded freely.
+        timezone = timezone if timezone in TIME_ZONES and timezone != 'Asia/Seoul' else None
         try:
             conn = get_db_connection()
             cur = conn.cursor()
@@ -144,16 +191,21 @@ def dashboard():
                 UPDATE users 
                 SET language = %s, 
                     notification_method = %s,
-                    active = %s
+                    active = %s,
+                    preferred_hour = %s,
+                    timezone = %s,
+                    preferences_updated_at = NOW()
                 WHERE id = %s
-            """, (language, notification_method, active, user_id))
+            """, (language, notification_method, active, preferred_hour, timezone, user_id))
             cur.execute("DELETE FROM user_topics WHERE user_id = %s", (user_id,))
             for topic_id in topics:
                 cur.execute(
                     "INSERT INTO user_topics (user_id, topic_id) VALUES (%s, %s)",
                     (user_id, topic_id)
                 )
+            invalidation.publish(cur, invalidation.USER, user_id)
             conn.commit()
+            mark_primary_write()
             flash('Preferences updated successfully!', 'success')
             session['user_language'] = language
         except Exception as e:
@@ -167,142 +219,363 @@ def dashboard():
     next_tuesday = today + timedelta(days=days_until_tuesday)
     next_tuesday_str = next_tuesday.strftime('%Y-%m-%d')
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        cur.execute("""
-            SELECT id, email, language, notification_method, active
-            FROM users
-            WHERE id = %s
-        """, (user_id,))
-        user = cur.fetchone()
+        user = get_user_preferences(user_id)
         if not user:
             flash('User not found', 'error')
-            return redirect(url_for('login'))
-        cur.execute("""
-            SELECT 1 FROM kakao_tokens WHERE user_id = %s
-        """, (user_id,))
-        kakao_connected = cur.fetchone() is not None
-        cur.execute("""
-            SELECT topic_id FROM user_topics WHERE user_id = %s
-        """, (user_id,))
-        user_topics = [row[0] for row in cur.fetchall()]
-        cur.execute("SELECT id, label FROM topics")
-        all_topics = [{'id': row[0], 'label': row[1]} for row in cur.fetchall()]
-        return render_template('dashboard.html',
-                               email=user[1],
-                               language=user[2],
-                               notification_method=user[3],
-                               active=user[4],
-                               user_topics=user_topics,
-                               all_topics=all_topics,
-                               next_tuesday=next_tuesday_str,
-                               kakao_connected=kakao_connected)
+            return redirect(url_for('web.login'))
+        all_topics = get_topics()
+        etag = _dashboard_etag(user_id, user, all_topics, next_tuesday_str)
+        # Pending flash messages are part of the page, so such a page is neither revalidated
+        # nor given validators a later visit could match.
+        cacheable = request.method == 'GET' and '_flashes' not in session
+        if cacheable and request.if_none_match.contains(etag):
+            response = Response(status=304)
+        else:
+            response = make_response(render_template('dashboard.html',
+                                                     email=user['email'],
+                                                     language=user['language'],
+                                                     notification_method=user['notification_method'],
+                                                     active=user['active'],
+                                                     preferred_hour=user['preferred_hour'],
+                                                     timezone=user['timezone'],
+                                                     time_zones=TIME_ZONES,
+                                                     user_topics=user['topics'],
+                                                     all_topics=all_topics,
+                                                     next_tuesday=next_tuesday_str,
+                                                     kakao_connected=user['kakao_connected']))
+        if cacheable:
+            response.set_etag(etag)
+            if user['preferences_updated_at']:
+                response.last_modified = user['preferences_updated_at']
+        # Browsers may keep the page but must revalidate it; shared caches must not store it.
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+        response.vary.add('Cookie')
+        return response
     except Exception as e:
         logger.error(f"Failed to fetch user preferences: {str(e)}")
         flash('Failed to load preferences', 'error')
         return render_template('dashboard.html')
-    finally:
-        if cur: cur.close()
-        if conn: conn.close()
 
 
-@app.route('/auth/kakao')
+@web.route('/auth/kakao')
 def kakao_auth():
     if 'user_id' not in session:
         flash('Please login first', 'error')
-        return redirect(url_for('login'))
+        return redirect(url_for('web.login'))
     try:
         auth_url = KakaoService.generate_auth_url(str(session['user_id']))
         return redirect(auth_url)
     except Exception as e:
         logger.error(f"Kakao auth failed: {str(e)}")
         flash('Failed to start Kakao authorization', 'error')
-        return redirect(url_for('dashboard'))
+        return redirect(url_for('web.dashboard'))
 
 
-@app.route('/auth/kakao/callback')
+@web.route('/auth/kakao/callback')
 def kakao_callback():
     code = request.args.get('code')
     state = request.args.get('state')
     error = request.args.get('error')
     if error:
         flash(f'Kakao authorization denied: {error}', 'error')
-        return redirect(url_for('dashboard'))
+        return redirect(url_for('web.dashboard'))
     if not code or not state:
         flash('Invalid Kakao callback request', 'error')
-        return redirect(url_for('dashboard'))
+        return redirect(url_for('web.dashboard'))
     try:
         if KakaoService.handle_authorization(code, state):
+            mark_primary_write()
             flash('Kakao account connected successfully!', 'success')
         else:
             flash('Failed to connect Kakao account', 'error')
     except Exception as e:
         logger.error(f"Kakao callback error: {str(e)}")
         flash('An error occurred during Kakao authorization', 'error')
-    return redirect(url_for('dashboard'))
+    return redirect(url_for('web.dashboard'))
 
 
-@app.route('/send_weekly_digest_now', methods=['POST'])
+@web.route('/send_weekly_digest_now', methods=['POST'])
 def send_weekly_digest_now():
+    wants_json = request.accept_mimetypes.best == 'application/json'
     if 'user_id' not in session:
+        if wants_json:
+            return jsonify({'error': 'login required'}), 401
         flash('Please login first', 'error')
-        return redirect(url_for('login'))
-    conn = None
-    cur = None
+        return redirect(url_for('web.login'))
     try:
-        user_id = session['user_id']
-        conn = get_db_connection()
-        cur = conn.cursor()
-        cur.execute("""
-            SELECT u.id, u.email, u.name, u.language, u.notification_method,
-                   array_agg(ut.topic_id) AS topics
-            FROM users u
-            JOIN user_topics ut ON u.id = ut.user_id
-            WHERE u.id = %s
-            GROUP BY u.id
-        """, (user_id,))
-        user_row = cur.fetchone()
-        if not user_row:
-            flash('User not found', 'error')
-            return redirect(url_for('dashboard'))
-        user = {
-            'id': user_row[0],
-            'email': user_row[1],
-            'name': user_row[2],
-            'language': user_row[3],
-            'notification_method': user_row[4],
-            'topics': user_row[5]
-        }
-        papers = get_recent_papers()
-        email_content = generate_email_content(papers, user)
-        if user['notification_method'] in ['email', 'both']:
-            success = EmailService.send_research_digest(user, email_content)
-            if success:
-                flash('Weekly digest sent to your email!', 'success')
-            else:
-                flash('Failed to send email. Please try again later.', 'error')
-        if user['notification_method'] in ['kakao', 'both']:
-            success = KakaoService.send_research_digest(user, email_content)
-            if success:
-                flash('Weekly digest sent via Kakao!', 'success')
-            else:
-                flash('Failed to send Kakao notification.', 'error')
-        return redirect(url_for('dashboard'))
+        job_id, state = enqueue_send_now(session['user_id'])
+        mark_primary_write()
     except Exception as e:
-        logger.error(f"Error sending weekly digest: {str(e)}")
+        logger.error(f"Error queueing weekly digest: {str(e)}")
+        if wants_json:
+            return jsonify({'error': 'An error occurred. Please try again.'}), 500
         flash('An error occurred. Please try again.', 'error')
-        return redirect(url_for('dashboard'))
+        return redirect(url_for('web.dashboard'))
+    if state == 'cooldown':
+        message = 'A digest was sent recently. Please wait a few minutes before requesting another.'
+        if wants_json:
+            return jsonify({'job_id': job_id, 'state': state, 'message': message}), 429
+        flash(message, 'info')
+        return redirect(url_for('web.dashboard'))
+    if wants_json:
+        return jsonify({'job_id': job_id, 'state': state,
+                        'status_url': url_for('web.send_weekly_digest_status', job_id=job_id)}), 202
+    flash('Your weekly digest is being prepared and will arrive shortly.', 'info')
+    return redirect(url_for('web.dashboard'))
+
+
+@web.route('/metrics')
+def metrics():
+    if not current_app.config['METRICS_ENABLED']:
+        abort(404)
+    if not _bearer_authorized(current_app.config['METRICS_TOKEN']):
+        return jsonify({'error': 'unauthorized'}), 401
+    payload, content_type = render_metrics()
+    return Response(payload, content_type=content_type)
+
+
+@web.route('/send_weekly_digest_now/<int:job_id>')
+def send_weekly_digest_status(job_id):
+    if 'user_id' not in session:
+        return jsonify({'error': 'login required'}), 401
+    try:
+        job = get_job_status(job_id, session['user_id'])
+    except Exception as e:
+        logger.error(f"Error fetching digest job {job_id}: {str(e)}")
+        return jsonify({'error': 'An error occurred. Please try again.'}), 500
+    if not job:
+        return jsonify({'error': 'not found'}), 404
+    return jsonify(job)
+
+
+def _bearer_authorized(token):
+    if not token:
+        abort(404)
+    return hmac.compare_digest(request.headers.get('Authorization', ''), f"Bearer {token}")
+
+
+def _admin_authorized():
+    return _bearer_authorized(current_app.config['ADMIN_TOKEN'])
+
+
+@web.route('/admin/profiler', methods=['GET', 'POST', 'DELETE'])
+def admin_profiler():
+    if not _admin_authorized():
+        return jsonify({'error': 'unauthorized'}), 401
+    if request.method == 'POST':
+        body = request.get_json(silent=True) or {}
+        try:
+            runs = int(body.get('runs', 1))
+            profiler.arm(job=body.get('job'), request_filter=body.get('request_filter'), runs=runs)
+        except (ValueError, re.error) as e:
+            return jsonify({'error': str(e)}), 400
+    elif request.method == 'DELETE':
+        profiler.disarm()
+    return jsonify(profiler.status())
+
+
+@web.route('/admin/profiler/<name>')
+def admin_profile_download(name):
+    if not _admin_authorized():
+        return jsonify({'error': 'unauthorized'}), 401
+    if name not in profiler.list_profiles():
+        abort(404)
+    return send_from_directory(os.path.abspath(current_app.config['PROFILE_DIR']), name, mimetype='text/plain')
+
+
+@web.route('/admin/subscribers/import', methods=['POST'])
+def admin_subscribers_import():
+    """Bulk import from a CSV request body; ?validate_only=1 reports without writing."""
+    if not _admin_authorized():
+        return jsonify({'error': 'unauthorized'}), 401
+    validate_only = request.args.get('validate_only', '').lower() in ('1', 'true')
+    try:
+        report = import_subscribers(decode_lines(request.stream), validate_only=validate_only)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(report)
+
+
+@web.route('/admin/subscribers/export')
+def admin_subscribers_export():
+    if not _admin_authorized():
+        return jsonify({'error': 'unauthorized'}), 401
+    return Response(stream_subscribers(), mimetype='text/csv',
+                    headers={'Content-Disposition': 'attachment; filename=subscribers.csv'})
+
+
+@click.command('invalidate-summary-cache')
+@click.argument('prompt_version')
+@click.option('--model', default=None, help='Only invalidate entries produced by this model')
+@with_appcontext
+def invalidate_summary_cache_command(prompt_version, model):
+    from services.ai_summary import invalidate_summary_cache
+    deleted = invalidate_summary_cache(prompt_version, model)
+    click.echo(f"Removed {deleted} cached summaries for prompt version {prompt_version}")
+
+
+@click.command('build-dedup-index')
+@with_appcontext
+def build_dedup_index_command():
+    from services.dedup import index_new_papers
+    indexed, duplicates = index_new_papers()
+    click.echo(f"Indexed {indexed} papers, {duplicates} near-duplicates")
+
+
+@click.command('publish-invalidation')
+@click.argument('kind', type=click.Choice(invalidation.KINDS))
+@click.argument('key', required=False, type=int)
+@with_appcontext
+def publish_invalidation_command(kind, key):
+    """Evict cached data in every process, e.g. after editing topics or category mappings by hand."""
+    conn = get_db_connection()
+    cur = conn.cursor()
+    try:
+        invalidation.publish(cur, kind, key)
+        conn.commit()
+    finally:
+        cur.close()
+        conn.close()
+    click.echo(f"Published {kind} invalidation" + (f" for {key}" if key is not None else ""))
+
+
+@click.command('rebuild-topic-index')
+@click.option('--week', type=click.DateTime(formats=['%Y-%m-%d']), default=None,
+              help='Tuesday of the digest week (default: the current one)')
+@with_appcontext
+def rebuild_topic_index_command(week):
+    """Recompute a week's per-topic paper lists, e.g. after editing arxiv_category_mapping."""
+    from services.topic_index import current_week, rebuild_week
+    week = week.date() if week else current_week()
+    if week.weekday() != 1:
+        raise click.BadParameter('digest weeks start on a Tuesday', param_hint='--week')
+    conn = get_db_connection()
+    cur = conn.cursor()
+    try:
+        entries = rebuild_week(cur, week, current_app.config['TOPIC_INDEX_SIZE'])
+        invalidation.publish(cur, invalidation.PAPERS)
+        conn.commit()
+    finally:
+        cur.close()
+        conn.close()
+    click.echo(f"Rebuilt topic index for {week}: {entries} entries")
+
+
+@click.command('dry-run-dispatch')
+@click.option('--transport', 'kind', type=click.Choice(['simulate', 'record']), default='simulate',
+              help='simulate waits like the providers would; record only accepts')
+@click.option('--limit', type=int, default=None, help='Send only the first N active users')
+@click.option('--latency-ms', type=float, default=None, help='Simulated latency for every provider')
+@click.option('--jitter-ms', type=float, default=None, help='Simulated latency varies by up to this much')
+@click.option('--error-rate', type=float, default=None, help='Fraction of simulated sends that fail')
+@click.option('--record', 'record_path', type=click.Path(dir_okay=False), default=None,
+              help='Append every message to this JSON lines file')
+@with_appcontext
+def dry_run_dispatch_command(kind, limit, latency_ms, jitter_ms, error_rate, record_path):
+    """Rehearse this week's digest dispatch without sending anything and report stage timings."""
+    from scheduler import SchedulerManager
+    from services.transports import build_transport
+    transport = build_transport(kind, latency_ms=latency_ms, jitter_ms=jitter_ms, error_rate=error_rate,
+                                path=record_path)
+    try:
+        scheduler_manager = SchedulerManager(current_app._get_current_object())
+        report = scheduler_manager.dry_run_weekly_notifications(transport, limit=limit)
     finally:
-        if cur: cur.close()
-        if conn: conn.close()
+        transport.close()
+    click.echo(json.dumps(report, indent=2))
+
+
+@click.command('prerender-digests')
+@with_appcontext
+def prerender_digests_command():
+    """Render this week's digests ahead of delivery, e.g. after summarizing more papers."""
+    from services.prerender import prerender_digests
+    rendered, failed = prerender_digests()
+    click.echo(f"Pre-rendered {rendered} digests, {failed} failed")
+
+
+@click.command('import-subscribers')
+@click.argument('source', type=click.File('rb'))
+@click.option('--validate-only', is_flag=True, help='Report rejected rows without writing anything')
+@click.option('--errors', 'errors_file', type=click.File('w'), default=None,
+              help='Write rejected rows (line, email, error) to this CSV file')
+@with_appcontext
+def import_subscribers_command(source, validate_only, errors_file):
+    """Import or update subscribers from a CSV file ('-' reads stdin)."""
+    try:
+        report = import_subscribers(decode_lines(source), validate_only=validate_only)
+    except ValueError as e:
+        raise click.BadParameter(str(e), param_hint='SOURCE')
+    if errors_file:
+        writer = csv.DictWriter(errors_file, fieldnames=['line', 'email', 'error'])
+        writer.writeheader()
+        writer.writerows(report['errors'])
+    else:
+        for error in report['errors'][:20]:
+            click.echo(f"line {error['line']} ({error['email']}): {error['error']}", err=True)
+    click.echo(f"{report['rows']} rows: {report['inserted']} inserted, {report['updated']} updated, "
+               f"{report['failed']} rejected" + (" (validated only, nothing written)" if validate_only else ""))
+
+
+@click.command('export-subscribers')
+@click.argument('target', type=click.File('w'), default='-')
+@with_appcontext
+def export_subscribers_command(target):
+    """Write every subscriber as CSV in the import format ('-' writes to stdout)."""
+    export_subscribers(target)
+
+
+@click.command('run-scheduler')
+@with_appcontext
+def run_scheduler_command():
+    """Run the scheduled jobs in this process until interrupted."""
+    from scheduler import SchedulerManager
+    scheduler_manager = SchedulerManager(current_app._get_current_object())
+    scheduler_manager.start()
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        scheduler_manager.shutdown()
 
 
-@app.route('/logout')
+@web.route('/logout')
 def logout():
     session.clear()
     flash('You have been logged out', 'info')
-    return redirect(url_for('login'))
+    return redirect(url_for('web.login'))
+
+
+def create_app(config_object=Config, start_scheduler=None):
+    """Build the web app. Scheduled jobs only run in a process that opts in, through
+    start_scheduler or SCHEDULER_ENABLED; provider clients and the invalidation listener
+    are created on first use."""
+    app = Flask(__name__)
+    app.config.from_object(config_object)
+
+    logging.basicConfig(level=logging.INFO)
+
+    init_tracing(app)
+    profiler.init_profiler(app)
+    invalidation.init_invalidation(app)
+
+    app.register_blueprint(web)
+    for command in (invalidate_summary_cache_command, build_dedup_index_command,
+                    publish_invalidation_command, rebuild_topic_index_command, dry_run_dispatch_command,
+                    prerender_digests_command, import_subscribers_command, export_subscribers_command,
+                    run_scheduler_command):
+        app.cli.add_command(command)
+
+    if start_scheduler is None:
+        start_scheduler = app.config['SCHEDULER_ENABLED']
+    if start_scheduler:
+        from scheduler import SchedulerManager
+        app.extensions['scheduler'] = SchedulerManager(app)
+        app.extensions['scheduler'].start()
+    return app
 
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=8000)
+    # The development server is a single process, so it runs the jobs itself.
+    create_app(start_scheduler=True).run(host='0.0.0.0', port=8000)
@@ -0,0 +1,45 @@
+"""Compare two digest benchmark result files.
+
+    python -m benchmarks.compare baseline.json candidate.json --threshold 0.10
+
+Exits with status 1 when any stage got slower than the threshold allows.
+"""
+import sys
+import json
+import argparse
+
+
+def load(path):
+    with open(path) as f:
+        report = json.load(f)
+    return report, {r['users']: r['stages'] for r in report['results']}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('baseline')
+    parser.add_argument('candidate')
+    parser.add_argument('--threshold', type=float, default=0.10, help='allowed relative slowdown per stage')
+    args = parser.parse_args(argv)
+
+    base_report, base = load(args.baseline)
+    cand_report, cand = load(args.candidate)
+    print(f"baseline  {base_report.get('commit')}  {args.baseline}")
+    print(f"candidate {cand_report.get('commit')}  {args.candidate}")
+
+    regressions = 0
+    for users in sorted(set(base) & set(cand)):
+        for stage in sorted(set(base[users]) & set(cand[users])):
+            before = base[users][stage]['seconds']
+            after = cand[users][stage]['seconds']
+            change = (after - before) / before if before else 0.0
+            flag = ''
+            if change > args.threshold:
+                flag = '  REGRESSION'
+                regressions += 1
+            print(f"{users:>8} users  {stage:<28} {before:>10.3f}s -> {after:>10.3f}s  {change:+7.1%}{flag}")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,204 @@
+"""Local stand-ins for the OpenAI, Resend and Kakao HTTP APIs and an OTLP trace collector.
+
+Each fake runs a threaded HTTP server on 127.0.0.1 with a fixed latency and
+a seeded error rate, and counts the requests it served.
+"""
+import json
+import time
+import uuid
+import random
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeProvider:
+    name = 'fake'
+
+    def __init__(self, latency_ms=0, error_rate=0.0, seed=0):
+        self.latency = latency_ms / 1000.0
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self.server = None
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address
+        return f"http://{host}:{port}"
+
+    def start(self):
+        provider = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                body = self.rfile.read(length)
+                provider._serve(self, body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, name=f"fake-{self.name}", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+
+    def stats(self):
+        return {'requests': self.requests, 'errors': self.errors}
+
+    def _serve(self, handler, body):
+        with self.lock:
+            self.requests += 1
+            failed = self.random.random() < self.error_rate
+            if failed:
+                self.errors += 1
+        if self.latency:
+            time.sleep(self.latency)
+        if failed:
+            self._send(handler, 429, self.error_body(), {'Retry-After': '1'})
+            return
+        status, payload = self.respond(handler.path, body)
+        self._send(handler, status, payload)
+
+    def _send(self, handler, status, payload, headers=None):
+        data = json.dumps(payload).encode('utf-8')
+        handler.send_response(status)
+        handler.send_header('Content-Type', 'application/json')
+        handler.send_header('Content-Length', str(len(data)))
+        for key, value in (headers or {}).items():
+            handler.send_header(key, value)
+        handler.end_headers()
+        handler.wfile.write(data)
+
+    def error_body(self):
+        return {'error': 'rate limited'}
+
+    def respond(self, path, body):
+        raise NotImplementedError
+
+
+class FakeOpenAI(FakeProvider):
+    name = 'openai'
+
+    def error_body(self):
+        return {'error': {'message': 'Rate limit reached', 'type': 'requests', 'code': 'rate_limit_exceeded'}}
+
+    def respond(self, path, body):
+        request = json.loads(body or b'{}')
+        messages = request.get('messages', [])
+        system = messages[0]['content'] if messages else ''
+        user_text = messages[-1]['content'] if messages else ''
+        if 'translator' in system:
+            fields = json.loads(user_text)
+            content = json.dumps({'ko': {key: f"[ko] {value}" for key, value in fields.items()}}, ensure_ascii=False)
+        else:
+            title = user_text.split('\n', 1)[0].replace('Title: ', '', 1)
+            content = json.dumps({
+                'summary': 'Synthetic one-line summary of the paper.',
+                'evaluation': 'Synthetic evaluation text.',
+                'importance': round(self.random.random(), 2),
+                'keywords': ['benchmark', 'synthetic', 'paper'],
+                'category': 'Machine Learning',
+                'i18n': {'ko': {
+                    'title': f"[ko] {title}",
+                    'summary': '[ko] Synthetic one-line summary of the paper.',
+                    'evaluation': '[ko] Synthetic evaluation text.',
+                    'category': '[ko] Machine Learning'
+                }}
+            }, ensure_ascii=False)
+        prompt_tokens = max(1, sum(len(m.get('content', '')) for m in messages) // 4)
+        completion_tokens = max(1, len(content) // 4)
+        return 200, {
+            'id': f"chatcmpl-{uuid.uuid4().hex}",
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': request.get('model', 'gpt-3.5-turbo'),
+            'choices': [{
+                'index': 0,
+                'message': {'role': 'assistant', 'content': content},
+                'finish_reason': 'stop'
+            }],
+            'usage': {
+                'prompt_tokens': prompt_tokens,
+                'completion_tokens': completion_tokens,
+                'total_tokens': prompt_tokens + completion_tokens
+            }
+        }
+
+
+class FakeResend(FakeProvider):
+    name = 'resend'
+
+    def error_body(self):
+        return {'statusCode': 429, 'name': 'rate_limit_exceeded', 'message': 'Too many requests'}
+
+    def respond(self, path, body):
+        return 200, {'id': str(uuid.uuid4())}
+
+
+class FakeKakao(FakeProvider):
+    name = 'kakao'
+
+    def error_body(self):
+        return {'msg': 'API limit has been exceeded.', 'code': -10}
+
+    def respond(self, path, body):
+        if path.startswith('/oauth/token'):
+            return 200, {
+                'access_token': uuid.uuid4().hex,
+                'refresh_token': uuid.uuid4().hex,
+                'token_type': 'bearer',
+                'expires_in': 21599
+            }
+        return 200, {'result_code': 0}
+
+
+class FakeCollector(FakeProvider):
+    """Accepts OTLP/HTTP JSON on /v1/traces and keeps the spans for the report."""
+    name = 'collector'
+
+    def __init__(self):
+        super().__init__()
+        self.spans = []
+
+    def respond(self, path, body):
+        payload = json.loads(body or b'{}')
+        spans = []
+        for resource in payload.get('resourceSpans', []):
+            for scope in resource.get('scopeSpans', []):
+                spans.extend(scope.get('spans', []))
+        with self.lock:
+            self.spans.extend(spans)
+        return 200, {'partialSuccess': {}}
+
+    def summary(self):
+        """Total and self time per span name, in seconds, slowest first."""
+        with self.lock:
+            spans = list(self.spans)
+        durations = {s['spanId']: (int(s['endTimeUnixNano']) - int(s['startTimeUnixNano'])) / 1e9 for s in spans}
+        child_time = {}
+        for s in spans:
+            if s.get('parentSpanId'):
+                child_time[s['parentSpanId']] = child_time.get(s['parentSpanId'], 0.0) + durations[s['spanId']]
+        by_name = {}
+        for s in spans:
+            entry = by_name.setdefault(s['name'], {'count': 0, 'total_seconds': 0.0, 'self_seconds': 0.0})
+            entry['count'] += 1
+            entry['total_seconds'] += durations[s['spanId']]
+            entry['self_seconds'] += max(0.0, durations[s['spanId']] - child_time.get(s['spanId'], 0.0))
+        return dict(sorted(
+            ((name, {k: round(v, 4) if isinstance(v, float) else v for k, v in entry.items()})
+             for name, entry in by_name.items()),
+            key=lambda item: item[1]['total_seconds'], reverse=True
+        ))
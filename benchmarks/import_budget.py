@@ -0,0 +1,109 @@
+"""Cold-start budget for the web process.
+
+Imports app.py and calls create_app() in a fresh interpreter, then checks wall time,
+the number of imported modules and background threads against budgets, and that
+nothing only the scheduler or the summarizer needs (APScheduler, the OpenAI SDK) was
+imported. Exits non-zero when a budget is exceeded, so it can gate CI:
+
+    python benchmarks/import_budget.py
+    python benchmarks/import_budget.py --max-seconds 0.5 --max-modules 600 --top 15
+"""
+import os
+import sys
+import json
+import argparse
+import subprocess
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# Modules the web process must not import at startup.
+FORBIDDEN = ['openai', 'apscheduler', 'scheduler', 'services.ai_summary']
+
+PROBE = """
+import sys, json, time, threading
+start = time.perf_counter()
+import app
+app.create_app()
+elapsed = time.perf_counter() - start
+print(json.dumps({
+    'seconds': elapsed,
+    'modules': len(sys.modules),
+    'threads': sorted(t.name for t in threading.enumerate() if t is not threading.main_thread()),
+    'loaded': sorted(sys.modules)
+}))
+"""
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--max-seconds', type=float, default=1.0,
+                        help='Budget for importing app.py and building the app')
+    parser.add_argument('--max-modules', type=int, default=700, help='Budget for len(sys.modules)')
+    parser.add_argument('--max-threads', type=int, default=0, help='Background threads allowed after startup')
+    parser.add_argument('--runs', type=int, default=3, help='Cold starts to measure; the fastest counts')
+    parser.add_argument('--top', type=int, default=10, help='Slowest imports to list (from -X importtime)')
+    parser.add_argument('--json', action='store_true', help='Print the report as JSON')
+    return parser.parse_args(argv)
+
+
+def cold_start(importtime=False):
+    env = dict(os.environ, SCHEDULER_ENABLED='false', PYTHONDONTWRITEBYTECODE='1')
+    command = [sys.executable] + (['-X', 'importtime'] if importtime else []) + ['-c', PROBE]
+    result = subprocess.run(command, cwd=ROOT, env=env, capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1]), result.stderr
+
+
+def slowest_imports(stderr, top):
+    """Top-level-ish imports by cumulative microseconds from -X importtime output."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        # "import time:   self [us] | cumulative | imported package"
+        _, cumulative_us, name = line.split('|', 2)
+        rows.append((int(cumulative_us), name.rstrip()))
+    # Keep only modules imported directly by the probe or app.py (two levels of nesting).
+    direct = [(us, name.strip()) for us, name in rows if len(name) - len(name.lstrip()) <= 3]
+    return sorted(direct, reverse=True)[:top]
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    samples = [cold_start()[0] for _ in range(args.runs)]
+    best = min(samples, key=lambda s: s['seconds'])
+    _, importtime = cold_start(importtime=True)
+    forbidden = [name for name in FORBIDDEN if name in best['loaded']]
+    report = {
+        'seconds': round(best['seconds'], 4),
+        'modules': best['modules'],
+        'threads': best['threads'],
+        'forbidden_imports': forbidden,
+        'slowest_imports_ms': [(name, round(us / 1000, 1)) for us, name in slowest_imports(importtime, args.top)],
+        'budget': {'seconds': args.max_seconds, 'modules': args.max_modules, 'threads': args.max_threads}
+    }
+    failures = []
+    if report['seconds'] > args.max_seconds:
+        failures.append(f"cold start {report['seconds']}s > {args.max_seconds}s")
+    if report['modules'] > args.max_modules:
+        failures.append(f"{report['modules']} modules > {args.max_modules}")
+    if len(report['threads']) > args.max_threads:
+        failures.append(f"background threads at startup: {', '.join(report['threads'])}")
+    if forbidden:
+        failures.append(f"imported at startup: {', '.join(forbidden)}")
+    report['failures'] = failures
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(f"cold start {report['seconds']}s, {report['modules']} modules, "
+              f"{len(report['threads'])} background threads")
+        for name, ms in report['slowest_imports_ms']:
+            print(f"  {ms:8.1f} ms  {name}")
+        for failure in failures:
+            print(f"FAIL: {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,209 @@
+"""Login throughput benchmark.
+
+Serves the app from a threaded WSGI server in this process, then keeps --concurrency
+clients logging in for --seconds while a probe requests the login page (no database,
+no hashing) and records its latency. It runs once per --pool-workers value: 0 hashes on
+the request threads, as before the hashing pool existed, and anything else hands the
+hashes to that many processes. Inline hashing holds the GIL, so the probe queues behind
+every login; with the pool the probe should stay close to its idle latency.
+
+    DB_NAME=instwave_bench python -m benchmarks.login_throughput --concurrency 16 --seconds 10
+
+The target database is truncated, so its name must contain "bench" unless --force is given.
+"""
+import os
+import sys
+import json
+import time
+import runpy
+import logging
+import argparse
+import platform
+import threading
+from datetime import datetime
+from pathlib import Path
+
+import psycopg2
+import requests
+from werkzeug.serving import make_server
+from werkzeug.security import generate_password_hash
+
+from benchmarks import seed as seeding
+from benchmarks.run_digest import git_commit, percentile
+
+ROOT = Path(__file__).resolve().parent.parent
+PASSWORD = 'bench1234pass'
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--pool-workers', type=int, nargs='+', default=[0, 2],
+                        help='PASSWORD_HASH_WORKERS values to compare (0 = hash on the request thread)')
+    parser.add_argument('--concurrency', type=int, default=16, help='clients logging in at once')
+    parser.add_argument('--seconds', type=float, default=10.0, help='load duration per run')
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--method', default=None, help='PASSWORD_HASH_METHOD (default: the configured one)')
+    parser.add_argument('--probe-interval-ms', type=float, default=20.0)
+    parser.add_argument('--db-host', default=os.getenv('DB_HOST', 'localhost'))
+    parser.add_argument('--db-name', default=os.getenv('DB_NAME', 'instwave_bench'))
+    parser.add_argument('--db-user', default=os.getenv('DB_USER', 'postgres'))
+    parser.add_argument('--db-password', default=os.getenv('DB_PASSWORD', ''))
+    parser.add_argument('--output', help='result file (default: benchmarks/results/login-<commit>-<time>.json)')
+    parser.add_argument('--force', action='store_true', help='allow a database whose name lacks "bench"')
+    return parser.parse_args(argv)
+
+
+def seed_users(args, method):
+    conn = psycopg2.connect(host=args.db_host, dbname=args.db_name, user=args.db_user, password=args.db_password)
+    try:
+        seeding.reset(conn)
+        # Every user shares one hash; verifying it costs the same as verifying distinct ones.
+        password_hash = generate_password_hash(PASSWORD, method)
+        cur = conn.cursor()
+        seeding._copy(
+            cur, 'users', ['email', 'name', 'language', 'notification_method', 'password_hash', 'active'],
+            ((f"user{i}@bench.local", f"user{i}", 'en', 'email', password_hash, 't') for i in range(args.users))
+        )
+        conn.commit()
+        cur.close()
+    finally:
+        conn.close()
+
+
+def latency_summary(samples):
+    return {
+        'count': len(samples),
+        'p50_ms': round(percentile(samples, 50) * 1000, 2) if samples else None,
+        'p95_ms': round(percentile(samples, 95) * 1000, 2) if samples else None,
+        'max_ms': round(max(samples) * 1000, 2) if samples else None
+    }
+
+
+def probe(url, stop, interval, samples):
+    with requests.Session() as session:
+        while not stop.is_set():
+            start = time.perf_counter()
+            session.get(url, timeout=30)
+            samples.append(time.perf_counter() - start)
+            stop.wait(interval)
+
+
+def login_client(url, users, offset, stop, samples, statuses, lock):
+    with requests.Session() as session:
+        i = offset
+        while not stop.is_set():
+            start = time.perf_counter()
+            response = session.post(url, data={'email': f"user{i % users}@bench.local", 'password': PASSWORD},
+                                    allow_redirects=False, timeout=30)
+            elapsed = time.perf_counter() - start
+            with lock:
+                samples.append(elapsed)
+                statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+            session.cookies.clear()
+            i += 1
+
+
+def run_mode(args, pool_workers):
+    from app import create_app
+    from services import passwords
+    app = create_app(start_scheduler=False)
+    app.config['PASSWORD_HASH_WORKERS'] = pool_workers
+    if args.method:
+        app.config['PASSWORD_HASH_METHOD'] = args.method
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    thread = threading.Thread(target=server.serve_forever, name='bench-server', daemon=True)
+    thread.start()
+    base = f"http://127.0.0.1:{server.server_port}"
+    interval = args.probe_interval_ms / 1000.0
+    try:
+        # Warm up: start the pool and fill caches outside the measured window.
+        requests.post(f"{base}/login", data={'email': 'user0@bench.local', 'password': PASSWORD},
+                      allow_redirects=False, timeout=30)
+
+        idle = []
+        stop = threading.Event()
+        prober = threading.Thread(target=probe, args=(f"{base}/login", stop, interval, idle))
+        prober.start()
+        time.sleep(min(2.0, args.seconds))
+        stop.set()
+        prober.join()
+
+        loaded, logins, statuses, lock = [], [], {}, threading.Lock()
+        stop = threading.Event()
+        clients = [threading.Thread(target=login_client,
+                                    args=(f"{base}/login", args.users, n, stop, logins, statuses, lock))
+                   for n in range(args.concurrency)]
+        prober = threading.Thread(target=probe, args=(f"{base}/login", stop, interval, loaded))
+        started_at = time.perf_counter()
+        for client in clients:
+            client.start()
+        prober.start()
+        time.sleep(args.seconds)
+        stop.set()
+        for client in clients + [prober]:
+            client.join()
+        elapsed = time.perf_counter() - started_at
+    finally:
+        server.shutdown()
+        passwords.shutdown_pool()
+
+    return {
+        'pool_workers': pool_workers,
+        'method': app.config['PASSWORD_HASH_METHOD'],
+        'logins': len(logins),
+        'logins_per_second': round(statuses.get(302, 0) / elapsed, 2),
+        'statuses': statuses,
+        'login_latency': latency_summary(logins),
+        'probe_idle': latency_summary(idle),
+        'probe_under_load': latency_summary(loaded)
+    }
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if 'bench' not in args.db_name and not args.force:
+        sys.exit(f"Refusing to truncate database '{args.db_name}'; use a *bench* database or --force")
+    os.environ.update({
+        'OPENAI_API_KEY': 'bench',
+        'DB_HOST': args.db_host,
+        'DB_NAME': args.db_name,
+        'DB_USER': args.db_user,
+        'DB_PASSWORD': args.db_password,
+        'METRICS_ENABLED': 'false',
+    })
+    runpy.run_path(str(ROOT / 'init_db.py'))
+    from config import Config
+    method = args.method or Config.PASSWORD_HASH_METHOD
+    seed_users(args, method)
+    logging.getLogger('INSTWAVE').setLevel(logging.WARNING)
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+
+    report = {
+        'benchmark': 'login_throughput',
+        'commit': git_commit(),
+        'started_at': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'config': {'concurrency': args.concurrency, 'seconds': args.seconds, 'users': args.users, 'method': method},
+        'results': []
+    }
+    for pool_workers in args.pool_workers:
+        print(f"[bench] PASSWORD_HASH_WORKERS={pool_workers} ...", flush=True)
+        result = run_mode(args, pool_workers)
+        report['results'].append(result)
+        print(f"[bench]   {result['logins_per_second']} logins/s, login p95 {result['login_latency']['p95_ms']} ms, "
+              f"probe p95 idle {result['probe_idle']['p95_ms']} ms -> under load "
+              f"{result['probe_under_load']['p95_ms']} ms", flush=True)
+
+    output = Path(args.output) if args.output else (
+        ROOT / 'benchmarks' / 'results' /
+        f"login-{(report['commit'] or 'nogit')[:10]}-{datetime.now().strftime('%Y%m%d%H%M%S')}.json"
+    )
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2, default=str))
+    print(f"[bench] results written to {output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,283 @@
+"""Digest pipeline benchmark.
+
+Seeds a local Postgres with synthetic data, points OpenAI, Resend and Kakao at
+local fakes, then times generate_ai_summaries, get_recent_papers,
+generate_email_content and the full weekly dispatch at each user scale.
+
+    DB_NAME=instwave_bench python -m benchmarks.run_digest --scales 1000 10000 --latency-ms 20
+
+The target database is truncated on every scale, so its name must contain
+"bench" unless --force is given.
+"""
+import os
+import sys
+import json
+import time
+import runpy
+import logging
+import argparse
+import platform
+import statistics
+import subprocess
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import psycopg2
+
+from benchmarks.fakes import FakeOpenAI, FakeResend, FakeKakao, FakeCollector
+from benchmarks import seed as seeding
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scales', type=int, nargs='+', default=[1000, 10000, 100000],
+                        help='user counts to benchmark')
+    parser.add_argument('--papers', type=int, default=2000, help='summarized papers in the digest window')
+    parser.add_argument('--unsummarized', type=int, default=200,
+                        help='papers left for generate_ai_summaries')
+    parser.add_argument('--topics', type=int, default=12)
+    parser.add_argument('--content-sample', type=int, default=1000,
+                        help='users timed individually in the generate_email_content stage')
+    parser.add_argument('--latency-ms', type=float, default=20.0, help='fake provider latency')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of fake calls answered with 429')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--db-host', default=os.getenv('DB_HOST', 'localhost'))
+    parser.add_argument('--db-name', default=os.getenv('DB_NAME', 'instwave_bench'))
+    parser.add_argument('--db-user', default=os.getenv('DB_USER', 'postgres'))
+    parser.add_argument('--db-password', default=os.getenv('DB_PASSWORD', ''))
+    parser.add_argument('--skip', nargs='*', default=[],
+                        choices=['generate_ai_summaries', 'get_recent_papers', 'build_topic_index',
+                                 'generate_email_content',
+                                 'prerender_digests', 'send_weekly_notifications'])
+    parser.add_argument('--output', help='result file (default: benchmarks/results/digest-<commit>-<time>.json)')
+    parser.add_argument('--force', action='store_true', help='allow a database whose name lacks "bench"')
+    parser.add_argument('--verbose', action='store_true', help='keep INSTWAVE INFO logging')
+    parser.add_argument('--trace', action='store_true',
+                        help='export spans to a local OTLP collector and add a per-span breakdown')
+    parser.add_argument('--trace-dispatch-sample-rate', type=float, default=0.01,
+                        help='fraction of users traced inside the weekly dispatch')
+    return parser.parse_args(argv)
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=ROOT, text=True).strip()
+    except Exception:
+        return None
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def provider_stats(fakes):
+    return {name: fake.stats() for name, fake in fakes.items()}
+
+
+def provider_delta(before, after):
+    return {
+        name: {key: after[name][key] - before[name][key] for key in after[name]}
+        for name in after
+    }
+
+
+def timed_stage(fakes, func):
+    before = provider_stats(fakes)
+    start = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - start
+    return result, {'seconds': round(elapsed, 4), 'provider_calls': provider_delta(before, provider_stats(fakes))}
+
+
+def configure_environment(args, fakes, collector=None):
+    if collector:
+        os.environ.update({
+            'TRACING_EXPORTER': 'otlp',
+            'TRACING_OTLP_ENDPOINT': f"{collector.url}/v1/traces",
+            'TRACING_DISPATCH_SAMPLE_RATE': str(args.trace_dispatch_sample_rate),
+        })
+    os.environ.update({
+        'OPENAI_API_KEY': 'bench',
+        'OPENAI_BASE_URL': f"{fakes['openai'].url}/v1",
+        'RESEND_API_KEY': 'bench',
+        'RESEND_API_URL': fakes['resend'].url,
+        'KAKAO_CLIENT_ID': 'bench',
+        'KAKAO_API_HOST': fakes['kakao'].url,
+        'KAKAO_AUTH_HOST': fakes['kakao'].url,
+        'DB_HOST': args.db_host,
+        'DB_NAME': args.db_name,
+        'DB_USER': args.db_user,
+        'DB_PASSWORD': args.db_password,
+        'METRICS_ENABLED': 'false',
+    })
+
+
+def run_scale(args, app, scheduler_manager, fakes, users):
+    from services.ai_summary import generate_ai_summaries
+    from services.database import get_recent_papers, get_subscribed_users
+    from services.content_generator import generate_email_content
+    from services.catalog import select_papers
+    from services.topic_index import TopicIndex
+    from services.prerender import prerender_digests
+
+    conn = psycopg2.connect(host=args.db_host, dbname=args.db_name, user=args.db_user, password=args.db_password)
+    try:
+        seeding.reset(conn)
+        seed_start = time.perf_counter()
+        counts = seeding.seed(conn, users, args.papers, args.unsummarized, args.topics, args.seed)
+        seed_seconds = time.perf_counter() - seed_start
+        cur = conn.cursor()
+        cur.execute("ANALYZE")
+        conn.commit()
+        cur.close()
+    finally:
+        conn.close()
+
+    stages = {}
+    with app.app_context():
+        if 'generate_ai_summaries' not in args.skip:
+            summary_stats, stages['generate_ai_summaries'] = timed_stage(fakes, generate_ai_summaries)
+            stages['generate_ai_summaries']['papers'] = args.unsummarized
+            stages['generate_ai_summaries']['summary_stats'] = summary_stats
+
+        papers, stage = timed_stage(fakes, get_recent_papers)
+        if 'get_recent_papers' not in args.skip:
+            stage['papers_returned'] = len(papers)
+            stages['get_recent_papers'] = stage
+
+        subscribers = get_subscribed_users()
+
+        def build_topic_index():
+            index = TopicIndex.load()
+            index.hydrate([user['topics'] for user in subscribers], limit=3)
+            return index
+
+        index, stage = timed_stage(fakes, build_topic_index)
+        if 'build_topic_index' not in args.skip:
+            stage['memory'] = index.memory_report()
+            # The merged per-topic lists must pick exactly what ranking the whole week picks.
+            stage['mismatches'] = sum(1 for user in subscribers
+                                      if list(index.top_ids(user['topics'], 3))
+                                      != [p['id'] for p in select_papers(papers, user['topics'], 3)])
+            stages['build_topic_index'] = stage
+
+        if 'generate_email_content' not in args.skip:
+            sample = subscribers[:args.content_sample]
+            per_user = []
+            before = provider_stats(fakes)
+            for user in sample:
+                start = time.perf_counter()
+                generate_email_content(index, user)
+                per_user.append(time.perf_counter() - start)
+            stages['generate_email_content'] = {
+                'users': len(per_user),
+                'seconds': round(sum(per_user), 4),
+                'per_user_p50': percentile(per_user, 50),
+                'per_user_p95': percentile(per_user, 95),
+                'per_user_max': max(per_user) if per_user else None,
+                'per_user_mean': statistics.fmean(per_user) if per_user else None,
+                'provider_calls': provider_delta(before, provider_stats(fakes))
+            }
+
+    if 'send_weekly_notifications' not in args.skip:
+        from services.delivery import window_settings, delivery_window, plan_delivery
+        with app.app_context():
+            settings = window_settings()
+            start, slots = delivery_window(datetime.now(settings['timezone']), settings)
+            _, load = plan_delivery([u for u in subscribers if u['active']], start, slots, settings)
+        if 'prerender_digests' not in args.skip:
+            # Timed on its own so the dispatch stage below measures sending pre-rendered digests.
+            with app.app_context():
+                (rendered, failed), stage = timed_stage(fakes, prerender_digests)
+            stage['rendered'] = rendered
+            stage['failed'] = failed
+            stages['prerender_digests'] = stage
+        # A tick at the end of the window finds every slot due, so this times the whole week's dispatch.
+        last_tick = start + timedelta(minutes=settings['slot_minutes'] * (slots - 1))
+        _, stage = timed_stage(fakes, lambda: scheduler_manager._send_weekly_notifications(now=last_tick))
+        stage['users_per_second'] = round(users / stage['seconds'], 2) if stage['seconds'] else None
+        stage['slots'] = slots
+        stage['peak_slot_load'] = max(load, default=0)
+        stages['send_weekly_notifications'] = stage
+
+    return {'users': users, 'seed': counts, 'seed_seconds': round(seed_seconds, 4), 'stages': stages}
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if 'bench' not in args.db_name and not args.force:
+        sys.exit(f"Refusing to truncate database '{args.db_name}'; use a *bench* database or --force")
+
+    fakes = {
+        'openai': FakeOpenAI(args.latency_ms, args.error_rate, args.seed).start(),
+        'resend': FakeResend(args.latency_ms, args.error_rate, args.seed + 1).start(),
+        'kakao': FakeKakao(args.latency_ms, args.error_rate, args.seed + 2).start(),
+    }
+    collector = FakeCollector().start() if args.trace else None
+    configure_environment(args, fakes, collector)
+
+    # init_db.py reads the DB_* environment set above and is idempotent.
+    runpy.run_path(str(ROOT / 'init_db.py'))
+
+    # Imported only now so module-level clients pick up the fake endpoints.
+    from app import create_app
+    from scheduler import SchedulerManager
+    from services.tracing import flush_traces
+    app = create_app(start_scheduler=False)
+    # Never started: the benchmark calls the dispatch job directly.
+    scheduler_manager = SchedulerManager(app)
+    app.config.update(SERVER_NAME='localhost:8000', PREFERRED_URL_SCHEME='http')
+    logging.getLogger('INSTWAVE').setLevel(logging.INFO if args.verbose else logging.WARNING)
+
+    report = {
+        'benchmark': 'digest_pipeline',
+        'commit': git_commit(),
+        'started_at': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'config': {
+            'papers': args.papers,
+            'unsummarized': args.unsummarized,
+            'topics': args.topics,
+            'content_sample': args.content_sample,
+            'latency_ms': args.latency_ms,
+            'error_rate': args.error_rate,
+            'seed': args.seed,
+            'trace': args.trace
+        },
+        'results': []
+    }
+    try:
+        for users in args.scales:
+            print(f"[bench] {users} users ...", flush=True)
+            result = run_scale(args, app, scheduler_manager, fakes, users)
+            if collector:
+                flush_traces()
+                result['spans'] = collector.summary()
+                collector.spans.clear()
+            report['results'].append(result)
+            for name, stage in result['stages'].items():
+                print(f"[bench]   {name}: {stage['seconds']}s", flush=True)
+    finally:
+        for fake in fakes.values():
+            fake.stop()
+        if collector:
+            collector.stop()
+
+    output = Path(args.output) if args.output else (
+        ROOT / 'benchmarks' / 'results' /
+        f"digest-{(report['commit'] or 'nogit')[:10]}-{datetime.now().strftime('%Y%m%d%H%M%S')}.json"
+    )
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2, default=str))
+    print(f"[bench] results written to {output}")
+
+
+if __name__ == '__main__':
+    main()
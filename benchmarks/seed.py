@@ -0,0 +1,132 @@
+"""Synthetic users, topics and papers for the digest benchmarks.
+
+Rows are streamed in with COPY so even the 100k-user scale seeds in seconds.
+"""
+import io
+import csv
+import json
+import time
+import random
+from datetime import datetime, timedelta
+
+TOP_LEVEL_CATEGORIES = [
+    'cs', 'math', 'stat', 'physics', 'q-bio', 'q-fin',
+    'econ', 'eess', 'astro-ph', 'cond-mat', 'hep-th', 'quant-ph'
+]
+SUB_CATEGORIES = ['AI', 'LG', 'CV', 'CL', 'ML', 'TH', 'NA', 'PR']
+BENCH_TABLES = [
+    'kakao_tokens', 'user_topics', 'paper_topics', 'arxiv_category_mapping', 'summary_cache', 'llm_usage',
+    'thesis_minhash', 'thesis_lsh_buckets', 'delivery_plan', 'digest_renders', 'topic_top_papers',
+    'topic_index_weeks', 'thesis', 'users', 'topics'
+]
+
+
+def digest_window(today=None):
+    """Same window services.database.digest_window() reads: the seven days before the send Tuesday."""
+    today = (today or datetime.now()).date()
+    tuesday = today - timedelta(days=(today.weekday() - 1) % 7)
+    end = datetime(tuesday.year, tuesday.month, tuesday.day)
+    return end - timedelta(days=7), end
+
+
+def _copy(cur, table, columns, rows):
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    for row in rows:
+        writer.writerow(['\\N' if v is None else v for v in row])
+    buf.seek(0)
+    cur.copy_expert(
+        f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv, NULL '\\N')",
+        buf
+    )
+
+
+def reset(conn):
+    cur = conn.cursor()
+    cur.execute(f"TRUNCATE {', '.join(BENCH_TABLES)} RESTART IDENTITY CASCADE")
+    conn.commit()
+    cur.close()
+
+
+def _random_categories(rng):
+    picked = rng.sample(TOP_LEVEL_CATEGORIES, rng.randint(1, 3))
+    return '{' + ','.join(f"{c}.{rng.choice(SUB_CATEGORIES)}" for c in picked) + '}'
+
+
+def _summary_json(rng, title):
+    return json.dumps({
+        'summary': 'Synthetic one-line summary of the paper.',
+        'evaluation': 'Synthetic evaluation text.',
+        'importance': round(rng.random(), 2),
+        'keywords': ['benchmark', 'synthetic', 'paper'],
+        'category': 'Machine Learning',
+        'title': title,
+        'i18n': {'ko': {
+            'title': f"[ko] {title}",
+            'summary': '[ko] Synthetic one-line summary of the paper.',
+            'evaluation': '[ko] Synthetic evaluation text.',
+            'category': '[ko] Machine Learning'
+        }}
+    }, ensure_ascii=False)
+
+
+def _abstract(rng, paper_id):
+    # Roughly one paper in ten reuses an earlier abstract, like a cross-listing or re-ingest.
+    source_id = rng.randint(1, paper_id) if rng.random() < 0.1 else paper_id
+    return f"We study synthetic problem {source_id}. " + 'The method is evaluated on synthetic data. ' * (5 + source_id % 35)
+
+
+def seed(conn, users, papers, unsummarized, topics=12, seed_value=0):
+    """Populate a freshly reset database and return row counts."""
+    rng = random.Random(seed_value)
+    cur = conn.cursor()
+
+    _copy(cur, 'topics', ['id', 'label'], ((i, f"Topic {i}") for i in range(1, topics + 1)))
+    _copy(cur, 'arxiv_category_mapping', ['arxiv_category', 'topic_id'],
+          ((c, (i % topics) + 1) for i, c in enumerate(TOP_LEVEL_CATEGORIES)))
+
+    user_rows = []
+    user_topic_rows = []
+    kakao_rows = []
+    expires_at = time.time() + 365 * 24 * 3600
+    for user_id in range(1, users + 1):
+        method = rng.choices(['email', 'kakao', 'both'], weights=[6, 2, 2])[0]
+        language = 'ko' if rng.random() < 0.3 else 'en'
+        user_rows.append((user_id, f"user{user_id}@bench.local", f"user{user_id}", language, method,
+                          'bench-not-a-real-hash', rng.random() < 0.95))
+        for topic_id in rng.sample(range(1, topics + 1), rng.randint(1, 4)):
+            user_topic_rows.append((user_id, topic_id))
+        if method in ('kakao', 'both'):
+            kakao_rows.append((user_id, f"token-{user_id}", f"refresh-{user_id}", expires_at))
+    _copy(cur, 'users', ['id', 'email', 'name', 'language', 'notification_method', 'password_hash', 'active'],
+          user_rows)
+    _copy(cur, 'user_topics', ['user_id', 'topic_id'], user_topic_rows)
+    _copy(cur, 'kakao_tokens', ['user_id', 'access_token', 'refresh_token', 'expires_at'], kakao_rows)
+
+    window_start, window_end = digest_window()
+    window_seconds = int((window_end - window_start).total_seconds())
+    paper_rows = []
+    for paper_id in range(1, papers + unsummarized + 1):
+        created_at = window_start + timedelta(seconds=rng.randint(1, max(1, window_seconds - 1)))
+        title = f"Synthetic paper {paper_id}"
+        ai_summary = _summary_json(rng, title) if paper_id <= papers else None
+        paper_rows.append((
+            paper_id, title, f"Author {rng.randint(1, 5000)}", ai_summary,
+            created_at, created_at, f"2501.{paper_id:05d}", created_at.date(), _random_categories(rng),
+            _abstract(rng, paper_id)
+        ))
+    _copy(cur, 'thesis', ['id', 'title', 'author', 'ai_summary', 'created_at', 'updated_at', 'arxiv_id',
+                          'publish_date', 'categories', 'summary'], paper_rows)
+
+    for table in ('users', 'topics', 'thesis'):
+        cur.execute(f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), (SELECT MAX(id) FROM {table}))")
+    conn.commit()
+    cur.close()
+    return {
+        'users': users,
+        'user_topics': len(user_topic_rows),
+        'kakao_tokens': len(kakao_rows),
+        'papers': papers,
+        'unsummarized_papers': unsummarized,
+        'topics': topics
+    }
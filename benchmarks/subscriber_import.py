@@ -0,0 +1,146 @@
+"""Bulk subscriber import benchmark.
+
+Times import_subscribers on a generated CSV of --users subscribers twice, once inserting
+everyone and once updating everyone, then the CSV export. It compares both with a sample
+of per-user upsert_subscription calls, which is how subscribers were onboarded before.
+
+    DB_NAME=instwave_bench python -m benchmarks.subscriber_import --users 100000
+
+The target database is truncated, so its name must contain "bench" unless --force is given.
+"""
+import io
+import os
+import sys
+import json
+import time
+import runpy
+import random
+import logging
+import argparse
+import platform
+from datetime import datetime
+from pathlib import Path
+
+import psycopg2
+
+from benchmarks import seed as seeding
+from benchmarks.run_digest import git_commit
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=100000)
+    parser.add_argument('--topics', type=int, default=12)
+    parser.add_argument('--invalid-rate', type=float, default=0.01, help='fraction of rows with an unknown topic')
+    parser.add_argument('--baseline-sample', type=int, default=500,
+                        help='users onboarded with upsert_subscription for comparison (0 skips it)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--db-host', default=os.getenv('DB_HOST', 'localhost'))
+    parser.add_argument('--db-name', default=os.getenv('DB_NAME', 'instwave_bench'))
+    parser.add_argument('--db-user', default=os.getenv('DB_USER', 'postgres'))
+    parser.add_argument('--db-password', default=os.getenv('DB_PASSWORD', ''))
+    parser.add_argument('--output', help='result file (default: benchmarks/results/import-<commit>-<time>.json)')
+    parser.add_argument('--force', action='store_true', help='allow a database whose name lacks "bench"')
+    return parser.parse_args(argv)
+
+
+def generate_csv(users, topics, invalid_rate, rng, prefix='user'):
+    lines = ['email,name,language,notification_method,topics,active,timezone,preferred_hour']
+    for i in range(users):
+        picked = rng.sample(range(1, topics + 1), rng.randint(1, 4))
+        if rng.random() < invalid_rate:
+            picked.append(topics + 1)
+        lines.append(','.join([
+            f"{prefix}{i}@bench.local", f"{prefix}{i}", 'ko' if rng.random() < 0.3 else 'en',
+            rng.choice(['email', 'email', 'kakao', 'both']), ';'.join(map(str, picked)),
+            'true' if rng.random() < 0.95 else 'false', '', str(rng.randint(8, 11)) if rng.random() < 0.2 else ''
+        ]))
+    return '\n'.join(lines) + '\n'
+
+
+def timed(func):
+    start = time.perf_counter()
+    result = func()
+    return result, round(time.perf_counter() - start, 4)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if 'bench' not in args.db_name and not args.force:
+        sys.exit(f"Refusing to truncate database '{args.db_name}'; use a *bench* database or --force")
+    os.environ.update({
+        'OPENAI_API_KEY': 'bench',
+        'DB_HOST': args.db_host,
+        'DB_NAME': args.db_name,
+        'DB_USER': args.db_user,
+        'DB_PASSWORD': args.db_password,
+        'METRICS_ENABLED': 'false',
+    })
+    runpy.run_path(str(ROOT / 'init_db.py'))
+    conn = psycopg2.connect(host=args.db_host, dbname=args.db_name, user=args.db_user, password=args.db_password)
+    try:
+        seeding.reset(conn)
+        seeding.seed(conn, 0, 0, 0, args.topics, args.seed)
+    finally:
+        conn.close()
+
+    from app import create_app
+    from services.database import upsert_subscription
+    from services.subscribers import import_subscribers, export_subscribers
+    app = create_app(start_scheduler=False)
+    logging.getLogger('INSTWAVE').setLevel(logging.WARNING)
+    rng = random.Random(args.seed)
+    data = generate_csv(args.users, args.topics, args.invalid_rate, rng)
+
+    stages = {}
+    with app.app_context():
+        for name in ('import_insert', 'import_update'):
+            report, seconds = timed(lambda: import_subscribers(io.StringIO(data)))
+            stages[name] = {'seconds': seconds, 'rows': report['rows'], 'inserted': report['inserted'],
+                            'updated': report['updated'], 'rejected': report['failed'],
+                            'rows_per_second': round(report['rows'] / seconds, 1) if seconds else None}
+        out = io.StringIO()
+        _, seconds = timed(lambda: export_subscribers(out))
+        stages['export'] = {'seconds': seconds, 'bytes': len(out.getvalue().encode('utf-8')),
+                            'rows': out.getvalue().count('\n') - 1}
+
+        if args.baseline_sample:
+            sample = [(f"upsert{i}@bench.local", rng.sample(range(1, args.topics + 1), rng.randint(1, 4)))
+                      for i in range(args.baseline_sample)]
+
+            def upsert_all():
+                for email, topics in sample:
+                    upsert_subscription(email.split('@')[0], email, None, topics)
+            _, seconds = timed(upsert_all)
+            stages['upsert_subscription_baseline'] = {
+                'seconds': seconds, 'rows': len(sample),
+                'rows_per_second': round(len(sample) / seconds, 1) if seconds else None,
+                'projected_seconds_for_users': round(seconds / len(sample) * args.users, 1)
+            }
+
+    report = {
+        'benchmark': 'subscriber_import',
+        'commit': git_commit(),
+        'started_at': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'config': {'users': args.users, 'topics': args.topics, 'invalid_rate': args.invalid_rate,
+                   'baseline_sample': args.baseline_sample, 'seed': args.seed},
+        'stages': stages
+    }
+    for name, stage in stages.items():
+        print(f"[bench] {name}: {stage['seconds']}s", flush=True)
+
+    output = Path(args.output) if args.output else (
+        ROOT / 'benchmarks' / 'results' /
+        f"import-{(report['commit'] or 'nogit')[:10]}-{datetime.now().strftime('%Y%m%d%H%M%S')}.json"
+    )
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2, default=str))
+    print(f"[bench] results written to {output}")
+
+
+if __name__ == '__main__':
+    main()
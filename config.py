@@ -5,12 +5,105 @@ load_dotenv()
 
 class Config:
     SCHEDULER_TIMEZONE = 'Asia/Seoul'
+    # Run the scheduled jobs inside this process. Enable it in exactly one process, or run
+    # `flask --app app run-scheduler` on its own; web workers should leave it off.
+    SCHEDULER_ENABLED = os.getenv('SCHEDULER_ENABLED', 'false').lower() == 'true'
     RESEND_API_KEY = os.getenv('RESEND_API_KEY')
     SECRET_KEY = os.getenv('SECRET_KEY', 'default_secret_key')
     DB_HOST = os.getenv('DB_HOST')
     DB_NAME = os.getenv('DB_NAME')
     DB_USER = os.getenv('DB_USER')
     DB_PASSWORD = os.getenv('DB_PASSWORD')
+    # Comma-separated libpq DSNs of read replicas; empty sends every query to the primary.
+    DB_REPLICA_DSNS = [dsn.strip() for dsn in os.getenv('DB_REPLICA_DSNS', '').split(',') if dsn.strip()]
+    DB_REPLICA_EJECT_SECONDS = int(os.getenv('DB_REPLICA_EJECT_SECONDS', '30'))
+    DB_REPLICA_MAX_LAG_SECONDS = float(os.getenv('DB_REPLICA_MAX_LAG_SECONDS', '30'))
+    DB_REPLICA_CONNECT_TIMEOUT = int(os.getenv('DB_REPLICA_CONNECT_TIMEOUT', '2'))
+    # After a session writes, its reads stay on the primary for this long.
+    DB_READ_YOUR_WRITES_SECONDS = int(os.getenv('DB_READ_YOUR_WRITES_SECONDS', '10'))
     GOOGLE_APPLICATION_CREDENTIALS = os.getenv('GOOGLE_APPLICATION_CREDENTIALS')
     BUCKET_NAME = os.getenv('BUCKET_NAME')
     OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
+    SEND_NOW_WORKERS = int(os.getenv('SEND_NOW_WORKERS', '2'))
+    SEND_NOW_COOLDOWN_SECONDS = int(os.getenv('SEND_NOW_COOLDOWN_SECONDS', '300'))
+    SEND_NOW_JOB_TIMEOUT_SECONDS = int(os.getenv('SEND_NOW_JOB_TIMEOUT_SECONDS', '900'))
+    # Requests per second and burst size per provider; buckets adapt downward on 429s.
+    RATE_LIMITS = {
+        'openai': (float(os.getenv('OPENAI_RATE_LIMIT', '50')), int(os.getenv('OPENAI_RATE_BURST', '10'))),
+        'resend': (float(os.getenv('RESEND_RATE_LIMIT', '2')), int(os.getenv('RESEND_RATE_BURST', '2'))),
+        'kakao': (float(os.getenv('KAKAO_RATE_LIMIT', '10')), int(os.getenv('KAKAO_RATE_BURST', '5'))),
+    }
+    # 'memory' shares buckets between threads of one process; 'postgres' shares them across processes.
+    RATE_LIMIT_BACKEND = os.getenv('RATE_LIMIT_BACKEND', 'memory')
+    RATE_LIMIT_MAX_WAIT_SECONDS = float(os.getenv('RATE_LIMIT_MAX_WAIT_SECONDS', '60'))
+    RATE_LIMIT_MAX_RETRIES = int(os.getenv('RATE_LIMIT_MAX_RETRIES', '3'))
+    # Abstracts longer than this (estimated tokens) are trimmed before summarization.
+    OPENAI_INPUT_TOKEN_BUDGET = int(os.getenv('OPENAI_INPUT_TOKEN_BUDGET', '600'))
+    OPENAI_MAX_OUTPUT_TOKENS = int(os.getenv('OPENAI_MAX_OUTPUT_TOKENS', '800'))
+    # USD per 1K (prompt, completion) tokens, used for the llm_usage cost ledger.
+    OPENAI_PRICING = {
+        'gpt-3.5-turbo': (0.0005, 0.0015),
+    }
+    # Papers whose estimated title+abstract Jaccard similarity reaches this are near-duplicates.
+    DEDUP_THRESHOLD = float(os.getenv('DEDUP_THRESHOLD', '0.8'))
+    # How far back the near-duplicate index reaches.
+    DEDUP_WINDOW_DAYS = int(os.getenv('DEDUP_WINDOW_DAYS', '365'))
+    # The summary job starts no new papers within this many minutes of the weekly dispatch.
+    SUMMARY_DEADLINE_MARGIN_MINUTES = int(os.getenv('SUMMARY_DEADLINE_MARGIN_MINUTES', '5'))
+    # The Tuesday digest goes out between these hours (SCHEDULER_TIMEZONE), one slot per tick.
+    DELIVERY_WINDOW_START_HOUR = int(os.getenv('DELIVERY_WINDOW_START_HOUR', '8'))
+    DELIVERY_WINDOW_END_HOUR = int(os.getenv('DELIVERY_WINDOW_END_HOUR', '12'))
+    DELIVERY_SLOT_MINUTES = int(os.getenv('DELIVERY_SLOT_MINUTES', '15'))
+    # Papers kept per topic and digest week in the topic index; the most any digest shows.
+    TOPIC_INDEX_SIZE = int(os.getenv('TOPIC_INDEX_SIZE', '10'))
+    # Render every digest into digest_renders once the summary job ends, so delivery slots only send.
+    DIGEST_PRERENDER_ENABLED = os.getenv('DIGEST_PRERENDER_ENABLED', 'true').lower() == 'true'
+    # Users rendered, written and (when sending) read back per round trip.
+    DIGEST_PRERENDER_BATCH_SIZE = int(os.getenv('DIGEST_PRERENDER_BATCH_SIZE', '500'))
+    # 'live' sends through Resend and Kakao; 'record' and 'simulate' accept digests without
+    # sending them, for staging environments (dry-run-dispatch picks its own).
+    DELIVERY_TRANSPORT = os.getenv('DELIVERY_TRANSPORT', 'live')
+    # What the 'simulate' transport waits per message (ms, +/- jitter) and the fraction it fails.
+    SIMULATED_LATENCY_MS = {
+        'resend': float(os.getenv('SIMULATED_RESEND_LATENCY_MS', '300')),
+        'kakao': float(os.getenv('SIMULATED_KAKAO_LATENCY_MS', '150')),
+    }
+    SIMULATED_JITTER_MS = float(os.getenv('SIMULATED_JITTER_MS', '50'))
+    SIMULATED_ERROR_RATE = float(os.getenv('SIMULATED_ERROR_RATE', '0'))
+    THESIS_PARTITION_MONTHS_AHEAD = int(os.getenv('THESIS_PARTITION_MONTHS_AHEAD', '3'))
+    # Monthly thesis partitions older than this are detached (0 keeps everything).
+    THESIS_RETENTION_MONTHS = int(os.getenv('THESIS_RETENTION_MONTHS', '0'))
+    # 'detach' leaves retired partitions as standalone tables; 'archive' also moves them to thesis_archive.
+    THESIS_RETIRE_MODE = os.getenv('THESIS_RETIRE_MODE', 'archive')
+    METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'true').lower() == 'true'
+    # Bearer token Prometheus must send to scrape /metrics; unset keeps the endpoint disabled.
+    METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+    # 'none', 'file' (JSON lines at TRACING_FILE) or 'otlp' (OTLP/HTTP JSON to TRACING_OTLP_ENDPOINT).
+    TRACING_EXPORTER = os.getenv('TRACING_EXPORTER', 'none')
+    TRACING_FILE = os.getenv('TRACING_FILE', 'traces.jsonl')
+    TRACING_OTLP_ENDPOINT = os.getenv('TRACING_OTLP_ENDPOINT', 'http://localhost:4318/v1/traces')
+    TRACING_SERVICE_NAME = os.getenv('TRACING_SERVICE_NAME', 'instwave')
+    # Fraction of web requests traced; scheduler jobs are always traced.
+    TRACING_SAMPLE_RATE = float(os.getenv('TRACING_SAMPLE_RATE', '0.1'))
+    # Fraction of users whose delivery gets spans inside a traced weekly dispatch.
+    TRACING_DISPATCH_SAMPLE_RATE = float(os.getenv('TRACING_DISPATCH_SAMPLE_RATE', '0.01'))
+    TRACING_MAX_SPANS_PER_TRACE = int(os.getenv('TRACING_MAX_SPANS_PER_TRACE', '10000'))
+    # Scheduler job ids profiled on every run ('*' for all); more can be armed via /admin/profiler.
+    PROFILE_JOBS = [job.strip() for job in os.getenv('PROFILE_JOBS', '').split(',') if job.strip()]
+    # Regex on the request path; matching requests are always profiled.
+    PROFILE_REQUEST_FILTER = os.getenv('PROFILE_REQUEST_FILTER', '')
+    PROFILE_INTERVAL_MS = float(os.getenv('PROFILE_INTERVAL_MS', '5'))
+    PROFILE_DIR = os.getenv('PROFILE_DIR', 'profiles')
+    # Per-process caches (topics, user preferences, this week's papers) are evicted through
+    # Postgres LISTEN/NOTIFY on this channel; disabled, every read goes to the database.
+    INVALIDATION_ENABLED = os.getenv('INVALIDATION_ENABLED', 'true').lower() == 'true'
+    INVALIDATION_CHANNEL = os.getenv('INVALIDATION_CHANNEL', 'instwave_invalidate')
+    # Werkzeug method string, work factor included; hashes made otherwise are upgraded on login.
+    PASSWORD_HASH_METHOD = os.getenv('PASSWORD_HASH_METHOD', 'scrypt:32768:8:1')
+    # Processes hashing passwords off the request threads (0 hashes inline), the requests
+    # that may wait on them, and how long one waits before giving up.
+    PASSWORD_HASH_WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS', '2'))
+    PASSWORD_HASH_MAX_PENDING = int(os.getenv('PASSWORD_HASH_MAX_PENDING', '32'))
+    PASSWORD_HASH_TIMEOUT_SECONDS = float(os.getenv('PASSWORD_HASH_TIMEOUT_SECONDS', '5'))
+    # Bearer token for /admin endpoints; unset disables them.
+    ADMIN_TOKEN = os.getenv('ADMIN_TOKEN')
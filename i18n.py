@@ -24,6 +24,10 @@ translations = {
         'not_connected': 'Not Connected',
         'connect_kakao': 'Connect Kakao Account',
         'receive_notifications': 'Receive weekly notifications',
+        'delivery_time': 'Delivery Time (Tuesday)',
+        'delivery_any_time': 'Any time',
+        'time_zone': 'Time Zone',
+        'delivery_time_note': 'Digests go out Tuesday morning (KST). A time outside that window is treated as any time.',
         'research_topics': 'Research Topics',
         'save_preferences': 'Save Preferences',
         'subscription_details': 'Subscription Details',
@@ -33,6 +37,7 @@ translations = {
         'inactive': 'Inactive',
         'send_now': 'Send Weekly Digest Now',
         'send_note': "Receive this week's research updates immediately",
+        'send_in_progress': 'Preparing your digest...',
         'topic_selection_note': 'Topic selection affects both weekly and manual notifications',
         'kakao_note': 'After connecting, you will receive notifications via Kakao but without alerts',
         'email_subject': 'INSTWAVE Research Digest',
@@ -80,6 +85,10 @@ translations = {
         'not_connected': '연결 안 됨',
         'connect_kakao': '카카오 계정 연결',
         'receive_notifications': '주간 알림 수신',
+        'delivery_time': '수신 시간 (화요일)',
+        'delivery_any_time': '상관없음',
+        'time_zone': '시간대',
+        'delivery_time_note': '다이제스트는 화요일 오전(KST)에 발송됩니다. 발송 시간대를 벗어난 시간은 상관없음으로 처리됩니다.',
         'research_topics': '연구 주제',
         'save_preferences': '설정 저장',
         'subscription_details': '구독 정보',
@@ -89,6 +98,7 @@ translations = {
         'inactive': '비활성화',
         'send_now': '지금 주간 요약 받기',
         'send_note': '이번 주 연구 업데이트를 즉시 받아보세요',
+        'send_in_progress': '요약을 준비하고 있습니다...',
         'topic_selection_note': '주제 선택은 주간 및 수동 알림 모두에 영향을 줍니다',
         'kakao_note': '연결 후 카카오톡으로 알림을 받게 되지만 알림음 없이 조용히 전달됩니다',
         'email_subject': 'INSTWAVE 연구 요약 리포트',
@@ -113,5 +123,17 @@ translations = {
     }
 }
 
+# Display names used when asking the LLM for localized summaries.
+LANGUAGE_NAMES = {
+    'en': 'English',
+    'ko': 'Korean'
+}
+
+# Time zones offered on the dashboard for digest delivery.
+TIME_ZONES = [
+    'Asia/Seoul', 'Asia/Tokyo', 'Asia/Shanghai', 'Asia/Singapore', 'Asia/Kolkata',
+    'Europe/London', 'Europe/Berlin', 'America/New_York', 'America/Los_Angeles', 'UTC'
+]
+
 def get_translation(key, lang='en'):
     return translations.get(lang, {}).get(key, key)
@@ -1,5 +1,6 @@
 import psycopg2
 import os
+from services.partitions import ensure_thesis_partitions
 
 # Get DB credentials from environment variables
 DB_NAME = os.getenv("DB_NAME")
@@ -15,6 +16,42 @@ conn = psycopg2.connect(
 )
 cur = conn.cursor()
 
+# Helper functions used by indexes and queries
+cur.execute("""
+CREATE OR REPLACE FUNCTION instwave_try_jsonb(value TEXT) RETURNS JSONB AS $$
+BEGIN
+    RETURN value::jsonb;
+EXCEPTION WHEN others THEN
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql IMMUTABLE;
+""")
+# importance as a number, tolerating summaries where it is missing or not numeric
+cur.execute("""
+CREATE OR REPLACE FUNCTION instwave_importance(summary JSONB) RETURNS DOUBLE PRECISION AS $$
+    SELECT CASE WHEN jsonb_typeof(summary -> 'importance') = 'number'
+                THEN (summary ->> 'importance')::double precision
+                ELSE 0 END
+$$ LANGUAGE sql IMMUTABLE;
+""")
+# categories arrive as '{cs.LG,stat.ML}' or as arXiv's space-separated 'cs.LG stat.ML'
+cur.execute("""
+CREATE OR REPLACE FUNCTION instwave_parse_categories(value TEXT) RETURNS TEXT[] AS $$
+    SELECT array_remove(
+        string_to_array(regexp_replace(btrim(COALESCE(value, ''), '{} '), '[\\s,"]+', ',', 'g'), ','),
+        ''
+    )
+$$ LANGUAGE sql IMMUTABLE;
+""")
+# cs.LG -> cs; backs the generated thesis.top_categories column
+cur.execute("""
+CREATE OR REPLACE FUNCTION instwave_top_level_categories(categories TEXT[]) RETURNS TEXT[] AS $$
+    SELECT COALESCE(array_agg(DISTINCT split_part(c, '.', 1) ORDER BY split_part(c, '.', 1)), '{}')
+    FROM unnest(categories) AS c
+    WHERE c <> ''
+$$ LANGUAGE sql IMMUTABLE;
+""")
+
 # Create tables based on your ERD
 
 # users table
@@ -30,6 +67,12 @@ CREATE TABLE IF NOT EXISTS users (
 );
 """)
 
+# delivery preferences: IANA timezone and local hour (0-23) for the Tuesday digest
+cur.execute("ALTER TABLE users ADD COLUMN IF NOT EXISTS timezone VARCHAR(64);")
+cur.execute("ALTER TABLE users ADD COLUMN IF NOT EXISTS preferred_hour SMALLINT CHECK (preferred_hour BETWEEN 0 AND 23);")
+# bumped by every write the dashboard shows; versions the dashboard's ETag
+cur.execute("ALTER TABLE users ADD COLUMN IF NOT EXISTS preferences_updated_at TIMESTAMPTZ DEFAULT NOW();")
+
 # topics table
 cur.execute("""
 CREATE TABLE IF NOT EXISTS topics (
@@ -38,30 +81,95 @@ CREATE TABLE IF NOT EXISTS topics (
 );
 """)
 
-# thesis table
-cur.execute("""
-CREATE TABLE IF NOT EXISTS thesis (
-    id SERIAL PRIMARY KEY,
+# thesis table, range-partitioned by created_at month (see services/partitions.py)
+THESIS_COLUMNS = """
     title VARCHAR(500),
     author VARCHAR(500),
-    ai_summary TEXT,
-    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    ai_summary JSONB,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     arxiv_id VARCHAR(255),
     publish_date DATE,
-    categories VARCHAR(500),
-    summary TEXT
-);
+    categories TEXT[],
+    summary TEXT,
+    top_categories TEXT[] GENERATED ALWAYS AS (instwave_top_level_categories(categories)) STORED,
+    dup_of INTEGER,
+    PRIMARY KEY (id, created_at)
+"""
+cur.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass('public.thesis')")
+thesis_kind = cur.fetchone()
+first_month = None
+if thesis_kind is None:
+    cur.execute(f"CREATE TABLE thesis (id SERIAL, {THESIS_COLUMNS}) PARTITION BY RANGE (created_at);")
+elif thesis_kind[0] == 'r':
+    # Existing plain table: rebuild it as a partitioned table, keeping ids and the id sequence.
+    cur.execute("ALTER TABLE thesis RENAME TO thesis_unpartitioned;")
+    cur.execute("ALTER TABLE thesis_unpartitioned RENAME CONSTRAINT thesis_pkey TO thesis_unpartitioned_pkey;")
+    cur.execute("UPDATE thesis_unpartitioned SET created_at = COALESCE(updated_at, CURRENT_TIMESTAMP) WHERE created_at IS NULL;")
+    cur.execute(f"""
+        CREATE TABLE thesis (id INTEGER NOT NULL DEFAULT nextval('thesis_id_seq'), {THESIS_COLUMNS})
+        PARTITION BY RANGE (created_at);
+    """)
+    cur.execute("ALTER SEQUENCE thesis_id_seq OWNED BY thesis.id;")
+    cur.execute("SELECT MIN(created_at) FROM thesis_unpartitioned;")
+    first_month = cur.fetchone()[0]
+cur.execute("CREATE TABLE IF NOT EXISTS thesis_default PARTITION OF thesis DEFAULT;")
+cur.execute("CREATE INDEX IF NOT EXISTS thesis_created_at ON thesis (created_at);")
+cur.execute("CREATE INDEX IF NOT EXISTS thesis_arxiv_id ON thesis (arxiv_id);")
+# ai_summary used to be TEXT; unparseable summaries become NULL and are regenerated
+cur.execute("""
+    SELECT data_type FROM information_schema.columns
+    WHERE table_schema = 'public' AND table_name = 'thesis' AND column_name = 'ai_summary'
+""")
+if cur.fetchone()[0] != 'jsonb':
+    cur.execute("ALTER TABLE thesis ALTER COLUMN ai_summary TYPE JSONB USING instwave_try_jsonb(ai_summary);")
+# categories used to be a VARCHAR holding an array-looking string
+cur.execute("""
+    SELECT data_type FROM information_schema.columns
+    WHERE table_schema = 'public' AND table_name = 'thesis' AND column_name = 'categories'
+""")
+if cur.fetchone()[0] != 'ARRAY':
+    cur.execute("ALTER TABLE thesis ALTER COLUMN categories TYPE TEXT[] USING instwave_parse_categories(categories);")
+cur.execute("""
+    ALTER TABLE thesis ADD COLUMN IF NOT EXISTS top_categories TEXT[]
+    GENERATED ALWAYS AS (instwave_top_level_categories(categories)) STORED;
+""")
+# canonical paper of a near-duplicate cluster (services/dedup.py); NULL for canonical papers
+cur.execute("ALTER TABLE thesis ADD COLUMN IF NOT EXISTS dup_of INTEGER;")
+cur.execute("CREATE INDEX IF NOT EXISTS thesis_dup_of ON thesis (dup_of) WHERE dup_of IS NOT NULL;")
+cur.execute("CREATE INDEX IF NOT EXISTS thesis_categories ON thesis USING GIN (categories);")
+cur.execute("CREATE INDEX IF NOT EXISTS thesis_top_categories ON thesis USING GIN (top_categories);")
+cur.execute("CREATE INDEX IF NOT EXISTS thesis_ai_summary_pending ON thesis (created_at) WHERE ai_summary IS NULL;")
+cur.execute("""
+    CREATE INDEX IF NOT EXISTS thesis_importance
+    ON thesis (instwave_importance(ai_summary) DESC) WHERE ai_summary IS NOT NULL;
 """)
+ensure_thesis_partitions(
+    conn,
+    months_ahead=int(os.getenv('THESIS_PARTITION_MONTHS_AHEAD', '3')),
+    start=first_month.date() if first_month else None
+)
+if first_month is not None:
+    cur.execute("""
+        INSERT INTO thesis (id, title, author, ai_summary, created_at, updated_at,
+                            arxiv_id, publish_date, categories, summary)
+        SELECT id, title, author, instwave_try_jsonb(ai_summary::text), created_at, updated_at,
+               arxiv_id, publish_date, instwave_parse_categories(categories::text), summary
+        FROM thesis_unpartitioned;
+    """)
+    # paper_topics can no longer reference thesis(id): a partitioned table's unique keys include created_at.
+    cur.execute("ALTER TABLE IF EXISTS paper_topics DROP CONSTRAINT IF EXISTS paper_topics_paper_id_fkey;")
+    cur.execute("DROP TABLE thesis_unpartitioned;")
 
 # paper_topics table (join table between thesis and topics)
 cur.execute("""
 CREATE TABLE IF NOT EXISTS paper_topics (
     id SERIAL PRIMARY KEY,
-    paper_id INTEGER REFERENCES thesis(id) ON DELETE CASCADE,
+    paper_id INTEGER,
     topic_id INTEGER REFERENCES topics(id) ON DELETE CASCADE
 );
 """)
+cur.execute("CREATE INDEX IF NOT EXISTS paper_topics_paper_id ON paper_topics (paper_id);")
 
 # arxiv_category_mapping table
 cur.execute("""
@@ -71,6 +179,15 @@ CREATE TABLE IF NOT EXISTS arxiv_category_mapping (
 );
 """)
 
+# topic ids mapped from a paper's top-level categories
+cur.execute("""
+CREATE OR REPLACE FUNCTION instwave_category_topics(top_categories TEXT[]) RETURNS INTEGER[] AS $$
+    SELECT COALESCE(array_agg(DISTINCT topic_id ORDER BY topic_id), '{}')
+    FROM arxiv_category_mapping
+    WHERE arxiv_category = ANY(top_categories)
+$$ LANGUAGE sql STABLE;
+""")
+
 # user_topics table (join table between users and topics)
 cur.execute("""
 CREATE TABLE IF NOT EXISTS user_topics (
@@ -79,6 +196,153 @@ CREATE TABLE IF NOT EXISTS user_topics (
     topic_id INTEGER REFERENCES topics(id) ON DELETE CASCADE
 );
 """)
+# replacing a user's topics (dashboard, imports) deletes by user_id
+cur.execute("CREATE INDEX IF NOT EXISTS user_topics_user ON user_topics (user_id);")
+
+# summary_cache table (LLM summaries keyed by normalized abstract hash)
+cur.execute("""
+CREATE TABLE IF NOT EXISTS summary_cache (
+    abstract_hash CHAR(64) NOT NULL,
+    prompt_version VARCHAR(32) NOT NULL,
+    model VARCHAR(100) NOT NULL,
+    ai_summary JSONB NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (abstract_hash, prompt_version, model)
+);
+""")
+
+cur.execute("""
+    SELECT data_type FROM information_schema.columns
+    WHERE table_schema = 'public' AND table_name = 'summary_cache' AND column_name = 'ai_summary'
+""")
+if cur.fetchone()[0] != 'jsonb':
+    cur.execute("DELETE FROM summary_cache WHERE instwave_try_jsonb(ai_summary) IS NULL;")
+    cur.execute("ALTER TABLE summary_cache ALTER COLUMN ai_summary TYPE JSONB USING ai_summary::jsonb;")
+
+# digest_jobs table (on-demand "send now" digests run in the background)
+cur.execute("""
+CREATE TABLE IF NOT EXISTS digest_jobs (
+    id SERIAL PRIMARY KEY,
+    user_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
+    status VARCHAR(20) NOT NULL DEFAULT 'queued',
+    result TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    started_at TIMESTAMP,
+    finished_at TIMESTAMP
+);
+""")
+# at most one queued/running job per user
+cur.execute("""
+CREATE UNIQUE INDEX IF NOT EXISTS digest_jobs_user_in_flight
+ON digest_jobs (user_id) WHERE status IN ('queued', 'running');
+""")
+cur.execute("""
+CREATE INDEX IF NOT EXISTS digest_jobs_user_created ON digest_jobs (user_id, created_at DESC);
+""")
+
+# rate_limits table (shared provider token buckets when RATE_LIMIT_BACKEND=postgres)
+cur.execute("""
+CREATE TABLE IF NOT EXISTS rate_limits (
+    provider VARCHAR(50) PRIMARY KEY,
+    tokens DOUBLE PRECISION NOT NULL,
+    rate DOUBLE PRECISION NOT NULL,
+    updated_at DOUBLE PRECISION NOT NULL,
+    blocked_until DOUBLE PRECISION NOT NULL DEFAULT 0
+);
+""")
+
+# llm_usage table (per-call OpenAI token and cost ledger)
+cur.execute("""
+CREATE TABLE IF NOT EXISTS llm_usage (
+    id BIGSERIAL PRIMARY KEY,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    operation VARCHAR(50) NOT NULL,
+    model VARCHAR(100) NOT NULL,
+    thesis_id INTEGER,
+    prompt_tokens INTEGER NOT NULL,
+    completion_tokens INTEGER NOT NULL,
+    cost_usd NUMERIC(12, 6) NOT NULL
+);
+""")
+cur.execute("""
+CREATE INDEX IF NOT EXISTS llm_usage_created_at ON llm_usage (created_at);
+""")
+
+# near-duplicate index: MinHash signatures and LSH band buckets (services/dedup.py)
+cur.execute("""
+CREATE TABLE IF NOT EXISTS thesis_minhash (
+    thesis_id INTEGER PRIMARY KEY,
+    signature BIGINT[] NOT NULL,
+    cluster_id INTEGER NOT NULL,
+    created_at TIMESTAMP NOT NULL
+);
+""")
+cur.execute("CREATE INDEX IF NOT EXISTS thesis_minhash_created_at ON thesis_minhash (created_at);")
+cur.execute("""
+CREATE TABLE IF NOT EXISTS thesis_lsh_buckets (
+    band SMALLINT NOT NULL,
+    bucket BIGINT NOT NULL,
+    thesis_id INTEGER NOT NULL,
+    created_at TIMESTAMP NOT NULL,
+    PRIMARY KEY (band, bucket, thesis_id)
+);
+""")
+cur.execute("CREATE INDEX IF NOT EXISTS thesis_lsh_buckets_created_at ON thesis_lsh_buckets (created_at);")
+
+# kakao_tokens table (OAuth tokens for Kakao "send to me" messages)
+cur.execute("""
+CREATE TABLE IF NOT EXISTS kakao_tokens (
+    user_id INTEGER PRIMARY KEY REFERENCES users(id) ON DELETE CASCADE,
+    access_token TEXT NOT NULL,
+    refresh_token TEXT,
+    expires_at DOUBLE PRECISION NOT NULL
+);
+""")
+
+# delivery_plan table (each week's user -> delivery slot assignment, claimed by scheduler ticks)
+cur.execute("""
+CREATE TABLE IF NOT EXISTS delivery_plan (
+    week DATE NOT NULL,
+    user_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
+    slot SMALLINT NOT NULL,
+    claimed_at TIMESTAMP,
+    PRIMARY KEY (week, user_id)
+);
+""")
+cur.execute("CREATE INDEX IF NOT EXISTS delivery_plan_unclaimed ON delivery_plan (week, slot) WHERE claimed_at IS NULL;")
+
+# topic_top_papers table (each digest week's most important papers per topic; services/topic_index.py)
+cur.execute("""
+CREATE TABLE IF NOT EXISTS topic_top_papers (
+    week DATE NOT NULL,
+    topic_id INTEGER NOT NULL,
+    cluster_id INTEGER NOT NULL,
+    paper_id INTEGER NOT NULL,
+    importance DOUBLE PRECISION NOT NULL,
+    PRIMARY KEY (week, topic_id, cluster_id)
+);
+""")
+cur.execute("""
+CREATE TABLE IF NOT EXISTS topic_index_weeks (
+    week DATE PRIMARY KEY,
+    built_at TIMESTAMP NOT NULL
+);
+""")
+
+# digest_renders table (each user's digest rendered ahead of the send window; services/prerender.py)
+cur.execute("""
+CREATE TABLE IF NOT EXISTS digest_renders (
+    week DATE NOT NULL,
+    user_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
+    preferences_updated_at TIMESTAMPTZ,
+    email_subject TEXT,
+    email_html TEXT,
+    kakao_template JSONB,
+    error TEXT,
+    rendered_at TIMESTAMPTZ NOT NULL,
+    PRIMARY KEY (week, user_id)
+);
+""")
 
 conn.commit()
 cur.close()
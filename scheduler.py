@@ -1,11 +1,22 @@
 import logging
+from collections import Counter
+from datetime import datetime, timedelta
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.triggers.cron import CronTrigger
 from services.email import EmailService
 from services.kakao import KakaoService
-from services.database import get_subscribed_users, get_recent_papers
+from services.delivery import (window_settings, delivery_window, current_slot, ensure_delivery_plan, claim_due_users,
+                               plan_delivery)
+from services.database import get_subscribed_users
+from services.topic_index import current_index, current_week
+from services.prerender import prerender_digests, load_rendered
 from services.ai_summary import generate_ai_summaries
 from services.content_generator import generate_email_content
+from services.metrics import track_job, DIGEST_PAYLOADS
+from services.tracing import span
+from services.transports import use_transport
+from services.dry_run import DispatchStats, capacity_report
+from services.partitions import ensure_thesis_partitions, retire_thesis_partitions
 
 logger = logging.getLogger('INSTWAVE')
 
@@ -27,54 +38,189 @@ class SchedulerManager:
             ),
             max_instances=1
         )
+        start_hour = self.app.config['DELIVERY_WINDOW_START_HOUR']
+        end_hour = self.app.config['DELIVERY_WINDOW_END_HOUR']
+        slot_minutes = self.app.config['DELIVERY_SLOT_MINUTES']
+        if not 0 <= start_hour < end_hour <= 24 or 60 % slot_minutes:
+            raise ValueError("Delivery window must lie within one day and DELIVERY_SLOT_MINUTES must divide 60")
+        # One tick per delivery slot; a tick that runs late still sends its slot and any it missed.
         self.scheduler.add_job(
             id='weekly_notification',
             func=self._send_weekly_notifications,
             trigger=CronTrigger(
                 day_of_week='tue',
-                hour=8,
-                minute=0,
+                hour=f"{start_hour}-{end_hour - 1}",
+                minute=f"*/{slot_minutes}",
+                timezone="Asia/Seoul"
+            ),
+            max_instances=1,
+            coalesce=True,
+            misfire_grace_time=slot_minutes * 60
+        )
+        self.scheduler.add_job(
+            id='thesis_partition_maintenance',
+            func=self._maintain_thesis_partitions,
+            trigger=CronTrigger(
+                hour=3,
+                minute=30,
                 timezone="Asia/Seoul"
             ),
             max_instances=1
         )
         logger.info("Scheduled jobs configured")
 
-    def _send_weekly_notifications(self):
+    def _send_weekly_notifications(self, now=None):
+        """Send the current delivery slot, plus any earlier slot a missed tick left behind."""
         with self.app.app_context():
             try:
-                logger.info("Starting weekly notification dispatch...")
-                users = get_subscribed_users()
-                papers = get_recent_papers()
-                for user in users:
-                    if not user.get('active', True):
-                        logger.info(f"Skipping inactive user: {user['email']}")
-                        continue
-                    email_content = self._generate_email_content(papers, user)
-                    if user['notification_method'] in ['email', 'both']:
-                        success = EmailService.send_research_digest(user, email_content)
-                        if success:
-                            logger.info(f"Email sent to {user['email']}")
-                        else:
-                            logger.error(f"Failed to send email to {user['email']}")
-                    if user['notification_method'] in ['kakao', 'both']:
-                        success = KakaoService.send_research_digest(user, email_content)
-                        if success:
-                            logger.info(f"Kakao notification sent to {user['email']}")
-                        else:
-                            logger.error(f"Failed to send Kakao to {user['email']}")
-                logger.info(f"Successfully processed {len(users)} users")
+                with track_job('weekly_notification'):
+                    settings = window_settings()
+                    now = now or datetime.now(settings['timezone'])
+                    start, slots = delivery_window(now, settings)
+                    slot = current_slot(now, start, slots, settings['slot_minutes'])
+                    ensure_delivery_plan(start, slots, settings)
+                    stats = DispatchStats()
+                    with stats.timed('users_load'):
+                        users = claim_due_users(start, slot)
+                    logger.info(f"Weekly notification slot {slot + 1}/{slots}: {len(users)} users")
+                    if not users:
+                        return
+                    self._deliver(users, stats)
+                    logger.info(f"Successfully processed {len(users)} users, stages: {stats.summary()}")
             except Exception as e:
                 logger.error(f"Weekly notification failed: {str(e)}")
 
+    def _deliver(self, users, stats, dry_run=False):
+        """Send every user's digest, pre-rendered where possible, timing each stage into stats."""
+        use_prerendered = self.app.config['DIGEST_PRERENDER_ENABLED'] and not dry_run
+        batch_size = self.app.config['DIGEST_PRERENDER_BATCH_SIZE']
+        user_sample_rate = self.app.config['TRACING_DISPATCH_SAMPLE_RATE']
+        index = None
+        with stats.activate():
+            for start in range(0, len(users), batch_size):
+                batch = users[start:start + batch_size]
+                rendered = {}
+                if use_prerendered:
+                    with stats.timed('rendered_load'):
+                        rendered = load_rendered(current_week(), batch)
+                inline = [user for user in batch if user['id'] not in rendered]
+                if inline:
+                    # Only users without a current pre-rendered digest need papers.
+                    if index is None:
+                        with stats.timed('index_load'):
+                            index = current_index()
+                    with stats.timed('index_hydrate'):
+                        index.hydrate([user['topics'] for user in inline], limit=3)
+                for user in batch:
+                    with span('dispatch.user', sample_rate=user_sample_rate, user_id=user['id'],
+                              notification_method=user['notification_method']), stats.timed('deliver'):
+                        self._deliver_user(user, rendered.get(user['id']), index, stats, dry_run)
+            if index is not None:
+                logger.info(f"Topic index: {index.memory_report()}")
+
+    def _deliver_user(self, user, payload, index, stats, dry_run):
+        source = 'prerendered' if payload else 'inline'
+        stats.count(f"payload_{source}")
+        if not dry_run:
+            DIGEST_PAYLOADS.labels(source).inc()
+        email_content = None
+        if payload is None and user['notification_method'] in ['email', 'both']:
+            with stats.timed('content_build'):
+                email_content = generate_email_content(index, user)
+        if user['notification_method'] in ['email', 'both']:
+            if payload:
+                success = EmailService.send_research_digest(
+                    user, rendered=(payload['email_subject'], payload['email_html']))
+            else:
+                success = EmailService.send_research_digest(user, email_content)
+            stats.count('email_sent' if success else 'email_failed')
+            if not success:
+                logger.error(f"Failed to send email to {user['email']}")
+            elif not dry_run:
+                logger.info(f"Email sent to {user['email']}")
+        if user['notification_method'] in ['kakao', 'both']:
+            if payload:
+                success = KakaoService.send_research_digest(user, template=payload['kakao_template'])
+            else:
+                success = KakaoService.send_research_digest(user, index)
+            stats.count('kakao_sent' if success else 'kakao_failed')
+            if not success:
+                logger.error(f"Failed to send Kakao to {user['email']}")
+            elif not dry_run:
+                logger.info(f"Kakao notification sent to {user['email']}")
+
+    def dry_run_weekly_notifications(self, transport, limit=None, now=None):
+        """Rehearse this week's dispatch for every active user through a sink transport.
+
+        Users, papers, content and rendering are real; nothing is claimed or planned in
+        the database and no provider is contacted. Returns per-stage timings, throughput
+        and how many workers the busiest delivery slot would need.
+        """
+        with self.app.app_context():
+            with track_job('weekly_notification_dry_run'), use_transport(transport):
+                settings = window_settings()
+                now = now or datetime.now(settings['timezone'])
+                start, slots = delivery_window(now, settings)
+                stats = DispatchStats()
+                with stats.timed('users_load'):
+                    users = [user for user in get_subscribed_users() if user['active']]
+                plan, _ = plan_delivery(users, start, slots, settings)
+                # Sized against the whole population even when only a sample is sent.
+                peak_slot_users = max(Counter(plan.values()).values(), default=0)
+                active_users = len(users)
+                if limit is not None:
+                    users = users[:limit]
+                logger.info(f"Dry-run dispatch of {len(users)} users through {type(transport).__name__}")
+                self._deliver(users, stats, dry_run=True)
+                report = capacity_report(stats, len(users), peak_slot_users, settings['slot_minutes'],
+                                         self.app.config['RATE_LIMITS'],
+                                         {provider: entry['messages']
+                                          for provider, entry in transport.report().items()})
+                report['transport'] = transport.report()
+                report['active_users'] = active_users
+                return report
+
     def _generate_ai_summaries_job(self):
         with self.app.app_context():
             try:
-                logger.info("Starting AI summary generation...")
-                generate_ai_summaries()
-                logger.info("AI summary generation completed.")
+                with track_job('weekly_ai_summary'):
+                    logger.info("Starting AI summary generation...")
+                    generate_ai_summaries(deadline=self._summary_deadline())
+                    logger.info("AI summary generation completed.")
             except Exception as e:
                 logger.error(f"AI summary generation failed: {str(e)}")
+        # Render with whatever was summarized, even after a failed run.
+        if self.app.config['DIGEST_PRERENDER_ENABLED']:
+            self._prerender_digests_job()
+
+    def _prerender_digests_job(self):
+        with self.app.app_context():
+            try:
+                with track_job('digest_prerender'):
+                    rendered, failed = prerender_digests()
+                    log = logger.warning if failed else logger.info
+                    log(f"Digest pre-render completed: {rendered} rendered, {failed} failed")
+            except Exception as e:
+                logger.error(f"Digest pre-render failed: {str(e)}")
+
+    def _summary_deadline(self):
+        """Stop starting new summaries shortly before the next weekly dispatch."""
+        dispatch = self.scheduler.get_job('weekly_notification')
+        if dispatch is None or dispatch.next_run_time is None:
+            return None
+        margin = timedelta(minutes=self.app.config['SUMMARY_DEADLINE_MARGIN_MINUTES'])
+        # next_run_time is aware (Asia/Seoul); generate_ai_summaries compares against local naive time.
+        return (dispatch.next_run_time - margin).astimezone().replace(tzinfo=None)
+
+    def _maintain_thesis_partitions(self):
+        with self.app.app_context():
+            try:
+                with track_job('thesis_partition_maintenance'):
+                    created = ensure_thesis_partitions()
+                    retired = retire_thesis_partitions()
+                    logger.info(f"Thesis partitions created: {created or 'none'}, retired: {retired or 'none'}")
+            except Exception as e:
+                logger.error(f"Thesis partition maintenance failed: {str(e)}")
 
     def start(self):
         self.scheduler.start()
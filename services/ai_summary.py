@@ -1,119 +1,494 @@
 import psycopg2
-from openai import OpenAI
+from psycopg2.extras import Json
 import json
+import time
 from datetime import datetime
-import os
-from dotenv import load_dotenv
-from .database import get_db_connection
+import threading
+from .database import get_db_connection, digest_window
+from .metrics import track_openai, record_openai_usage, SUMMARY_CACHE, SUMMARY_PARSE_FAILURES
+from .rate_limit import RateLimited, parse_retry_after, rate_limited_call
+from .llm_usage import trim_to_token_budget, record_llm_usage
+from .tracing import traced
+from .dedup import index_new_papers
+from .invalidation import publish, PAPERS
+from .topic_index import update_topic_index
+from i18n import translations, LANGUAGE_NAMES
 import logging
-import re
+import hashlib
+import unicodedata
+from flask import current_app
 
 logger = logging.getLogger('INSTWAVE')
 
-load_dotenv()
+_client = None
+_client_lock = threading.Lock()
 
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+SUMMARY_MODEL = "gpt-3.5-turbo"
+# Bump whenever the prompt in ask_openai changes so stale cache entries stop matching.
+PROMPT_VERSION = "v3"
 
-def ask_openai(summary):
-    """Generate summary in English only"""
-    prompt = f"""
-Please analyze the following research paper:
+# Summaries are generated in English; every other digest language is stored alongside
+# under ai_summary['i18n'][lang] so sending a digest never calls the LLM.
+LOCALIZED_LANGUAGES = [lang for lang in translations if lang != 'en']
+LOCALIZED_FIELDS = ('title', 'summary', 'evaluation', 'category')
 
-{summary}
+SYSTEM_PROMPT = (
+    "You summarize research papers from their title and abstract. Reply with a JSON object with keys: "
+    "summary (one sentence), evaluation (brief critical assessment), "
+    "importance (0-1 float), keywords (3-5 strings), category (field, e.g. Computer Vision, NLP), "
+    "and i18n: an object keyed by language code ("
+    + ", ".join(f"{lang} = {LANGUAGE_NAMES[lang]}" for lang in LOCALIZED_LANGUAGES)
+    + ") whose values translate title, summary, evaluation and category into that language."
+)
+TRANSLATION_PROMPT = (
+    "You are a professional translator of research paper digests. Translate the string values of the "
+    "JSON object from English. Reply with a JSON object keyed by language code ("
+    + ", ".join(f"{lang} = {LANGUAGE_NAMES[lang]}" for lang in LOCALIZED_LANGUAGES)
+    + "), each holding the same keys as the input."
+)
+SUMMARY_KEYS = ('summary', 'evaluation', 'importance', 'keywords', 'category')
+# Every PAPERS event makes each process drop its topic index, so a run announces its
+# changes at most this often instead of once per paper.
+PAPERS_PUBLISH_INTERVAL_SECONDS = 60
 
-- Paper summary (one line):
-- Key topics:
-- Important keywords (3-5):
-- Classification category (e.g., Computer Vision, NLP):
-- AI evaluation (may include subjective interpretation):
-- Importance score (0-1 floating point):
 
-Organize the results in the following JSON format:
+def get_client():
+    """The OpenAI client, built on first use so importing this module stays cheap."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            from openai import OpenAI
+            # Retries are left to the shared rate limiter so all callers back off together.
+            _client = OpenAI(api_key=current_app.config['OPENAI_API_KEY'], max_retries=0)
+        return _client
 
-{{
-  "summary": "...",
-  "evaluation": "...",
-  "importance": 0.xx,
-  "keywords": ["...", "...", "..."],
-  "category": "..."
-}}
-"""
 
+def normalize_abstract(text):
+    text = unicodedata.normalize('NFKC', text)
+    return ' '.join(text.split()).casefold()
+
+
+def abstract_hash(text):
+    return hashlib.sha256(normalize_abstract(text).encode('utf-8')).hexdigest()
+
+
+def invalidate_summary_cache(prompt_version, model=None):
+    """Delete cached summaries for a prompt version (optionally one model); returns the row count."""
+    conn = None
+    cur = None
     try:
-        response = client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {
-                    "role": "system",
-                    "content": "You are an expert research paper summarizer. Return only valid JSON."
-                },
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.3
-        )
-        return response.choices[0].message.content.strip()
+        conn = get_db_connection()
+        cur = conn.cursor()
+        if model:
+            cur.execute("DELETE FROM summary_cache WHERE prompt_version = %s AND model = %s",
+                        (prompt_version, model))
+        else:
+            cur.execute("DELETE FROM summary_cache WHERE prompt_version = %s", (prompt_version,))
+        deleted = cur.rowcount
+        conn.commit()
+        logger.info(f"Invalidated {deleted} cached summaries for prompt version {prompt_version}")
+        return deleted
+    finally:
+        if cur:
+            cur.close()
+        if conn:
+            conn.close()
+
+
+def _valid_localizations(value, languages):
+    """The well-formed {lang: {field: text}} entries of an LLM reply."""
+    if not isinstance(value, dict):
+        return {}
+    result = {}
+    for lang in languages:
+        fields = value.get(lang)
+        if isinstance(fields, dict) and all(isinstance(fields.get(key), str) for key in LOCALIZED_FIELDS):
+            result[lang] = {key: fields[key].strip() for key in LOCALIZED_FIELDS}
+    return result
+
+
+def missing_localizations(data, title):
+    """Languages that still need localized fields for this paper.
+
+    A cached summary copied to a paper with a different title needs its title
+    translated again, so every language counts as missing.
+    """
+    if data.get('title') != title:
+        return list(LOCALIZED_LANGUAGES)
+    localized = data.get('i18n') or {}
+    return [lang for lang in LOCALIZED_LANGUAGES if lang not in localized]
+
+
+@traced('localize_summary')
+def localize_summary(title, data, languages):
+    """Translate a summary's text fields into languages in one call.
+
+    Returns ({lang: {field: text}} for the languages that came back intact, usage or None).
+    """
+    source = {'title': title, 'summary': data.get('summary', ''),
+              'evaluation': data.get('evaluation', ''), 'category': data.get('category', '')}
+
+    def create():
+        from openai import RateLimitError
+        try:
+            with track_openai('translate', SUMMARY_MODEL):
+                return get_client().chat.completions.create(
+                    model=SUMMARY_MODEL,
+                    messages=[
+                        {"role": "system", "content": TRANSLATION_PROMPT},
+                        {"role": "user", "content": json.dumps(source, ensure_ascii=False)}
+                    ],
+                    response_format={"type": "json_object"},
+                    max_tokens=current_app.config['OPENAI_MAX_OUTPUT_TOKENS'],
+                    temperature=0.1
+                )
+        except RateLimitError as e:
+            raise RateLimited('openai', parse_retry_after(e.response.headers.get('retry-after')), str(e))
+
+    try:
+        response = rate_limited_call('openai', create)
     except Exception as e:
         logger.error(f"[OpenAI API error] {e}")
-        return None
+        return {}, None
+    record_openai_usage('translate', SUMMARY_MODEL, response)
+    try:
+        localized = _valid_localizations(json.loads(response.choices[0].message.content), languages)
+    except (TypeError, json.JSONDecodeError) as e:
+        logger.error(f"OpenAI returned invalid translation JSON: {e}")
+        localized = {}
+    return localized, response.usage
+
+
+@traced('ask_openai')
+def ask_openai(summary, title=''):
+    """Summarize an abstract in English and every localized language.
+
+    Returns (parsed dict or None, usage or None). Localizations missing from the
+    reply are left for the caller to fill with localize_summary.
+    """
+    abstract = trim_to_token_budget(summary, current_app.config['OPENAI_INPUT_TOKEN_BUDGET'])
+
+    def create():
+        from openai import RateLimitError
+        try:
+            with track_openai('summarize', SUMMARY_MODEL):
+                return get_client().chat.completions.create(
+                    model=SUMMARY_MODEL,
+                    messages=[
+                        {"role": "system", "content": SYSTEM_PROMPT},
+                        {"role": "user", "content": f"Title: {title}\n\nAbstract: {abstract}"}
+                    ],
+                    response_format={"type": "json_object"},
+                    max_tokens=current_app.config['OPENAI_MAX_OUTPUT_TOKENS'],
+                    temperature=0.3
+                )
+        except RateLimitError as e:
+            raise RateLimited('openai', parse_retry_after(e.response.headers.get('retry-after')), str(e))
+
+    try:
+        response = rate_limited_call('openai', create)
+    except Exception as e:
+        logger.error(f"[OpenAI API error] {e}")
+        return None, None
+    record_openai_usage('summarize', SUMMARY_MODEL, response)
+
+    choice = response.choices[0]
+    if choice.finish_reason == 'length':
+        logger.error(f"OpenAI summary truncated at {current_app.config['OPENAI_MAX_OUTPUT_TOKENS']} tokens")
+        return None, response.usage
+    try:
+        data = json.loads(choice.message.content)
+    except (TypeError, json.JSONDecodeError) as e:
+        logger.error(f"OpenAI returned invalid JSON: {e}")
+        return None, response.usage
+    if not isinstance(data, dict) or not all(key in data for key in SUMMARY_KEYS):
+        logger.error(f"OpenAI summary missing keys: {choice.message.content}")
+        return None, response.usage
+    try:
+        data['importance'] = min(1.0, max(0.0, float(data['importance'])))
+    except (TypeError, ValueError):
+        data['importance'] = 0.0
+    data['i18n'] = _valid_localizations(data.get('i18n'), LOCALIZED_LANGUAGES)
+    data['title'] = title
+    return data, response.usage
+
+
+def _complete_localizations(data, title, thesis_id, stats):
+    """Fill in whatever localized fields data lacks for this paper's title; returns a new dict."""
+    missing = missing_localizations(data, title)
+    if not missing:
+        return data
+    localized, usage = localize_summary(title, data, missing)
+    if usage is not None:
+        stats['llm_calls'] += 1
+        stats['prompt_tokens'] += usage.prompt_tokens or 0
+        stats['completion_tokens'] += usage.completion_tokens or 0
+        record_llm_usage('translate', SUMMARY_MODEL, usage, thesis_id)
+    # Localizations made for another title are stale as a whole.
+    kept = (data.get('i18n') or {}) if data.get('title') == title else {}
+    if len(localized) < len(missing):
+        stats['localization_failures'] += 1
+        logger.warning(f"Missing localized summary for ID {thesis_id}: "
+                       f"{sorted(set(missing) - set(localized))}")
+    return {**data, 'i18n': {**kept, **localized}, 'title': title}
+
+
+class _PaperChanges:
+    """Batches the PAPERS invalidations of one summary run."""
+
+    def __init__(self, conn, cur):
+        self.conn = conn
+        self.cur = cur
+        self.pending = False
+        self.published_at = time.monotonic()
+
+    def changed(self):
+        """Note a committed change to the digest's papers; publishes if the interval has passed."""
+        self.pending = True
+        if time.monotonic() - self.published_at >= PAPERS_PUBLISH_INTERVAL_SECONDS:
+            self.flush()
+
+    def flush(self):
+        if not self.pending:
+            return
+        try:
+            publish(self.cur, PAPERS)
+            self.conn.commit()
+            self.pending = False
+            self.published_at = time.monotonic()
+        except Exception as e:
+            self.conn.rollback()
+            logger.error(f"Could not publish paper changes: {str(e)}")
+
+
+def _deadline_passed(deadline):
+    return deadline is not None and datetime.now() >= deadline
+
+
+def _backfill_localizations(cur, conn, stats, changes, deadline=None):
+    """Localize this week's summaries that predate localized storage or lost a translation."""
+    window_start, window_end = digest_window()
+    cur.execute("""
+        SELECT id, title, ai_summary FROM thesis
+        WHERE created_at >= %s AND created_at < %s
+        AND ai_summary IS NOT NULL
+        AND NOT COALESCE((ai_summary -> 'i18n') ?& %s::text[], false)
+    """, (window_start, window_end, LOCALIZED_LANGUAGES))
+    for thesis_id, title, data in cur.fetchall():
+        if _deadline_passed(deadline):
+            logger.warning("Summary deadline reached, leaving remaining localizations for the next run")
+            break
+        try:
+            localized = _complete_localizations(data, title, thesis_id, stats)
+            cur.execute("""
+                UPDATE thesis
+                SET ai_summary = ai_summary || %s,
+                    updated_at = %s
+                WHERE id = %s
+            """, (Json({'i18n': localized['i18n'], 'title': title}), datetime.now(), thesis_id))
+            conn.commit()
+            changes.changed()
+            stats['localized'] += 1
+        except Exception as e:
+            conn.rollback()
+            logger.error(f"Failed to localize summary for ID {thesis_id}: {str(e)}")
+
+
+def generate_ai_summaries(deadline=None):
+    """Summarize every paper without an ai_summary, most urgent first.
+
+    Papers in the coming digest that match at least one active subscriber come first,
+    then the rest of the digest window, then the older backlog; within a tier, papers
+    reaching more subscribers and newer papers go first. No new paper is started after
+    deadline (a datetime); whatever is left is reported as deferred.
+    """
+    near_duplicates_indexed = 0
+    try:
+        _, near_duplicates_indexed = index_new_papers()
+    except Exception as e:
+        logger.error(f"Near-duplicate indexing failed, summarizing every paper: {str(e)}")
 
-def generate_ai_summaries():
     conn = get_db_connection()
     cur = conn.cursor()
 
-    # Fetch theses without AI summaries
+    # Fetch theses without AI summaries in priority order. Subscriber reach is counted once
+    # per distinct topic combination rather than once per paper.
+    window_start, window_end = digest_window()
     cur.execute("""
-        SELECT id, arxiv_id, summary FROM thesis
-        WHERE ai_summary IS NULL
-    """)
+        WITH pending AS (
+            SELECT id, arxiv_id, title, summary, dup_of, created_at,
+                   (created_at >= %s AND created_at < %s) AS in_window,
+                   instwave_category_topics(top_categories) AS topics
+            FROM thesis
+            WHERE ai_summary IS NULL
+        ),
+        reach AS (
+            SELECT p.topics, (
+                SELECT COUNT(*) FROM users u
+                WHERE u.active IS NOT FALSE
+                AND EXISTS (
+                    SELECT 1 FROM user_topics ut
+                    WHERE ut.user_id = u.id AND ut.topic_id = ANY(p.topics)
+                )
+            ) AS subscribers
+            FROM (SELECT DISTINCT topics FROM pending) p
+        )
+        SELECT p.id, p.arxiv_id, p.title, p.summary, p.dup_of, p.in_window, r.subscribers
+        FROM pending p
+        JOIN reach r ON r.topics = p.topics
+        ORDER BY (p.in_window AND r.subscribers > 0) DESC, p.in_window DESC,
+                 r.subscribers DESC, p.created_at DESC, p.id
+    """, (window_start, window_end))
     rows = cur.fetchall()
+    deliverable = sum(1 for row in rows if row[5] and row[6])
+    logger.info(f"Summarization backlog: {len(rows)} papers, {deliverable} due in this week's digests")
+
+    # Look up every abstract in the cache up front
+    hashes = {row[0]: abstract_hash(row[3]) for row in rows if row[3] and row[1]}
+    cached = {}
+    if hashes:
+        cur.execute("""
+            SELECT abstract_hash, ai_summary FROM summary_cache
+            WHERE prompt_version = %s AND model = %s AND abstract_hash = ANY(%s)
+        """, (PROMPT_VERSION, SUMMARY_MODEL, list(set(hashes.values()))))
+        cached = dict(cur.fetchall())
+
+    # Summaries near-duplicates can reuse, keyed by cluster (canonical paper id). Priority
+    # order may reach a duplicate before its canonical paper, so whichever member of a
+    # cluster is summarized first serves the rest.
+    clusters = {}
+    canonical_ids = list({row[4] for row in rows if row[4]})
+    if canonical_ids:
+        cur.execute("""
+            SELECT id, ai_summary FROM thesis
+            WHERE id = ANY(%s) AND ai_summary IS NOT NULL
+        """, (canonical_ids,))
+        clusters = dict(cur.fetchall())
 
     # Track progress
     total = len(rows)
-    success_count = 0
-    error_count = 0
+    changes = _PaperChanges(conn, cur)
+    stats = {
+        'success': 0,
+        'errors': 0,
+        'cache_hits': 0,
+        'llm_calls': 0,
+        'parse_failures': 0,
+        'prompt_tokens': 0,
+        'completion_tokens': 0,
+        'localized': 0,
+        'localization_failures': 0,
+        'near_duplicates': 0,
+        'near_duplicates_indexed': near_duplicates_indexed,
+        'deliverable': deliverable,
+        'deferred': 0,
+        'deferred_deliverable': 0
+    }
 
-    for idx, (thesis_id, arxiv_id, summary) in enumerate(rows):
+    for idx, (thesis_id, arxiv_id, title, summary, dup_of, in_window, subscribers) in enumerate(rows):
         if not summary or not arxiv_id:
             continue
+        if _deadline_passed(deadline):
+            remaining = rows[idx:]
+            stats['deferred'] = len(remaining)
+            stats['deferred_deliverable'] = sum(1 for row in remaining if row[5] and row[6])
+            logger.warning(f"Summary deadline {deadline:%H:%M} reached with {stats['deferred']} papers left "
+                           f"({stats['deferred_deliverable']} due in this week's digests)")
+            break
+
+        digest = hashes[thesis_id]
+        cluster = dup_of or thesis_id
+        reused = cached.get(digest)
+        source = 'hit'
+        if reused is None and cluster in clusters:
+            reused, source = clusters[cluster], 'near_duplicate'
+        if reused is not None:
+            try:
+                llm_data = _complete_localizations(reused, title, thesis_id, stats)
+                cur.execute("""
+                    UPDATE thesis
+                    SET ai_summary = %s,
+                        updated_at = %s
+                    WHERE id = %s
+                """, (Json(llm_data), datetime.now(), thesis_id))
+                affects_digest = update_topic_index(cur, thesis_id) or in_window
+                conn.commit()
+                if affects_digest:
+                    changes.changed()
+                SUMMARY_CACHE.labels(source).inc()
+                stats['cache_hits' if source == 'hit' else 'near_duplicates'] += 1
+                stats['success'] += 1
+                if source == 'hit':
+                    logger.info(f"[Cache hit] ID: {thesis_id}, arXiv: {arxiv_id} ({idx + 1}/{total})")
+                else:
+                    logger.info(f"[Near-duplicate of {cluster}] ID: {thesis_id}, arXiv: {arxiv_id} "
+                                f"({idx + 1}/{total})")
+            except Exception as e:
+                conn.rollback()
+                logger.error(f"Failed to copy cached summary for ID {thesis_id}: {str(e)}")
+                stats['errors'] += 1
+            continue
 
+        SUMMARY_CACHE.labels('miss').inc()
         logger.info(f"[Summarizing] ID: {thesis_id}, arXiv: {arxiv_id} ({idx + 1}/{total})")
 
-        # Generate summary in English only
-        llm_json_text = ask_openai(summary)
-        if not llm_json_text:
-            error_count += 1
+        llm_data, usage = ask_openai(summary, title)
+        if usage is not None:
+            stats['llm_calls'] += 1
+            stats['prompt_tokens'] += usage.prompt_tokens or 0
+            stats['completion_tokens'] += usage.completion_tokens or 0
+            # The call is paid for whether or not its summary gets stored.
+            record_llm_usage('summarize', SUMMARY_MODEL, usage, thesis_id)
+        if llm_data is None:
+            if usage is not None:
+                stats['parse_failures'] += 1
+                SUMMARY_PARSE_FAILURES.inc()
+            stats['errors'] += 1
             continue
 
-        logger.debug(f"OpenAI response for ID {thesis_id}: {llm_json_text}")
-
         try:
-            # Fix JSON escape issues
-            llm_json_text = re.sub(r'\\(?!["\\/bfnrt]|u[0-9a-fA-F]{4})', r'\\\\', llm_json_text)
-            llm_data = json.loads(llm_json_text)
-            llm_json_string = json.dumps(llm_data, ensure_ascii=False)
-
+            llm_data = _complete_localizations(llm_data, title, thesis_id, stats)
             # Update database
             cur.execute("""
                 UPDATE thesis
                 SET ai_summary = %s,
                     updated_at = %s
                 WHERE id = %s
-            """, (llm_json_string, datetime.now(), thesis_id))
+            """, (Json(llm_data), datetime.now(), thesis_id))
+            cur.execute("""
+                INSERT INTO summary_cache (abstract_hash, prompt_version, model, ai_summary)
+                VALUES (%s, %s, %s, %s)
+                ON CONFLICT (abstract_hash, prompt_version, model) DO NOTHING
+            """, (digest, PROMPT_VERSION, SUMMARY_MODEL, Json(llm_data)))
+            affects_digest = update_topic_index(cur, thesis_id) or in_window
             conn.commit()
+            if affects_digest:
+                changes.changed()
+            cached[digest] = llm_data
+            clusters.setdefault(cluster, llm_data)
 
-            success_count += 1
+            stats['success'] += 1
             logger.info(f"[Completed] ID: {thesis_id} - AI summary saved to database")
 
-        except json.JSONDecodeError as jde:
-            logger.error(f"JSON Parsing Error for ID {thesis_id}: {jde}. Response: {llm_json_text}")
-            error_count += 1
         except Exception as e:
+            conn.rollback()
             logger.error(f"Unexpected error for ID {thesis_id}: {str(e)}")
-            error_count += 1
+            stats['errors'] += 1
+
+    _backfill_localizations(cur, conn, stats, changes, deadline)
+    changes.flush()
 
     cur.close()
     conn.close()
 
     # Summary report
     logger.info(f"AI summary generation completed. "
-                f"Success: {success_count}, Errors: {error_count}, Total: {total}")
+                f"Success: {stats['success']}, Cache hits: {stats['cache_hits']}, Errors: {stats['errors']}, "
+                f"Near-duplicates: {stats['near_duplicates']}, Localized: {stats['localized']}, Total: {total}")
+    llm_calls = stats['llm_calls']
+    if llm_calls:
+        logger.info(f"LLM usage: {llm_calls} calls, "
+                    f"{stats['prompt_tokens'] / llm_calls:.0f} prompt + "
+                    f"{stats['completion_tokens'] / llm_calls:.0f} completion tokens per call, "
+                    f"parse failures: {stats['parse_failures']} ({stats['parse_failures'] / llm_calls:.1%})")
+    return {'total': total, **stats}
@@ -0,0 +1,64 @@
+import os
+import hashlib
+import threading
+from flask import current_app, url_for
+from werkzeug.security import safe_join
+
+# Static files are served from /assets/<digest>/<path>, where digest is a hash of the
+# file's contents, so a URL never changes meaning and can be cached for a year. The
+# build digest covers every template and static file and versions rendered pages.
+
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+_digests = {}
+_build_digest = None
+_lock = threading.Lock()
+
+
+def _hash_file(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(65536), b''):
+            digest.update(chunk)
+    return digest.hexdigest()[:16]
+
+
+def file_digest(path):
+    """Content hash of a file; recomputed when it changes in debug mode, else once per process."""
+    cached = _digests.get(path)
+    if cached is not None and not current_app.debug:
+        return cached[1]
+    stat = os.stat(path)
+    key = (stat.st_mtime_ns, stat.st_size)
+    if cached is None or cached[0] != key:
+        cached = (key, _hash_file(path))
+        with _lock:
+            _digests[path] = cached
+    return cached[1]
+
+
+def static_digest(filename):
+    """Digest of a file under the static folder, or None if there is no such file."""
+    path = safe_join(current_app.static_folder, filename)
+    if path is None or not os.path.isfile(path):
+        return None
+    return file_digest(path)
+
+
+def asset_url(filename):
+    return url_for('web.asset', digest=static_digest(filename), filename=filename)
+
+
+def build_digest():
+    """One hash over every template and static file, for validators of rendered pages."""
+    global _build_digest
+    if _build_digest is not None and not current_app.debug:
+        return _build_digest
+    combined = hashlib.sha256()
+    for folder in (os.path.join(current_app.root_path, current_app.template_folder), current_app.static_folder):
+        for root, _, files in sorted(os.walk(folder)):
+            for name in sorted(files):
+                path = os.path.join(root, name)
+                combined.update(f"{os.path.relpath(path, folder)}:{file_digest(path)};".encode())
+    _build_digest = combined.hexdigest()[:16]
+    return _build_digest
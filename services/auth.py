@@ -1,12 +1,16 @@
 import logging
-from werkzeug.security import check_password_hash
-from .database import get_db_connection, get_user_by_email
+from .database import get_db_connection, get_read_connection
+from .passwords import PasswordHasherBusy, verify_password
 
 logger = logging.getLogger('INSTWAVE')
 
 def authenticate_user(email, password):
+    """The user's profile when email and password match, else None. Raises
+    PasswordHasherBusy when the hashing pool is saturated."""
+    conn = None
+    cur = None
     try:
-        conn = get_db_connection()
+        conn = get_read_connection()
         cur = conn.cursor()
         cur.execute("""
             SELECT id, name, email, password_hash, language, notification_method 
@@ -14,18 +18,50 @@ def authenticate_user(email, password):
             WHERE email = %s
         """, (email,))
         user = cur.fetchone()
-        if user and check_password_hash(user[3], password):
-            return {
-                'id': user[0],
-                'name': user[1],
-                'email': user[2],
-                'language': user[4],
-                'notification_method': user[5]
-            }
-        return None
+        # Hand the connection back before the (slow) hash check.
+        cur.close()
+        conn.close()
+        cur = conn = None
+        if not user:
+            return None
+        matches, upgraded = verify_password(user[3], password)
+        if not matches:
+            return None
+        if upgraded:
+            _upgrade_hash(user[0], user[3], upgraded)
+        return {
+            'id': user[0],
+            'name': user[1],
+            'email': user[2],
+            'language': user[4],
+            'notification_method': user[5]
+        }
+    except PasswordHasherBusy:
+        raise
     except Exception as e:
         logger.error(f"Authentication error: {str(e)}")
         return None
     finally:
-        cur.close()
-        conn.close()
+        if cur:
+            cur.close()
+        if conn:
+            conn.close()
+
+def _upgrade_hash(user_id, old_hash, new_hash):
+    """Store a hash made with the current parameters, unless the password changed meanwhile."""
+    conn = None
+    cur = None
+    try:
+        conn = get_db_connection()
+        cur = conn.cursor()
+        cur.execute("UPDATE users SET password_hash = %s WHERE id = %s AND password_hash = %s",
+                    (new_hash, user_id, old_hash))
+        conn.commit()
+        logger.info(f"Upgraded password hash for user {user_id}")
+    except Exception as e:
+        logger.error(f"Could not upgrade password hash for user {user_id}: {str(e)}")
+    finally:
+        if cur:
+            cur.close()
+        if conn:
+            conn.close()
@@ -0,0 +1,68 @@
+import heapq
+import logging
+from .database import get_papers_by_ids
+
+logger = logging.getLogger('INSTWAVE')
+
+# Selecting a user's digest papers. A paper index (TopicIndex) picks each user's paper
+# ids, caching the picks per topic selection, and fetches full rows only for papers some
+# user actually receives.
+
+
+class PaperRecord:
+    """A selected paper; reads like the dicts get_recent_papers() returns."""
+    __slots__ = ('id', 'title', 'author', 'ai_summary', 'date', 'link', 'topics')
+
+    def __init__(self, id, title, author, ai_summary, date, link, topics):
+        self.id = id
+        self.title = title
+        self.author = author
+        self.ai_summary = ai_summary
+        self.date = date
+        self.link = link
+        self.topics = topics
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key)
+
+    def get(self, key, default=None):
+        return getattr(self, key, default)
+
+
+class HydratedPapers:
+    """Base of the paper indexes: top_ids() picks a user's papers, hydrate() fetches their rows."""
+    # (start, end) bounding the papers' created_at; None means this week's digest window.
+    window = None
+
+    def __init__(self):
+        self.records = {}
+        self._picks = {}
+
+    def top_ids(self, topics, limit=3):
+        raise NotImplementedError
+
+    def hydrate(self, topic_sets, limit=3):
+        """Fetch full rows, in one query, for every paper any of topic_sets will receive."""
+        wanted = {paper_id for topics in topic_sets for paper_id in self.top_ids(topics, limit)}
+        missing = [paper_id for paper_id in wanted if paper_id not in self.records]
+        if missing:
+            for paper_id, paper in get_papers_by_ids(missing, self.window).items():
+                self.records[paper_id] = PaperRecord(**paper)
+        return len(wanted)
+
+    def papers_for(self, topics, limit=3):
+        """The user's digest papers, most important first."""
+        return [self.records[paper_id] for paper_id in self.top_ids(topics, limit) if paper_id in self.records]
+
+
+def select_papers(papers, topics, limit=3):
+    """A user's top `limit` papers, from a hydrated index or a list of paper dicts."""
+    if isinstance(papers, HydratedPapers):
+        return papers.papers_for(topics, limit)
+    # A list is already a handful of papers; ranking it needs no index.
+    topics = set(topics or ())
+    matching = (p for p in papers if not topics.isdisjoint(p['topics'] or ()))
+    return heapq.nsmallest(limit, matching, key=lambda p: (-(p['ai_summary'].get('importance') or 0), p['id']))
@@ -1,14 +1,32 @@
 import logging
 from i18n import get_translation
-from .translation_service import translate_text
+from .tracing import traced
+from .catalog import select_papers
 
 logger = logging.getLogger('INSTWAVE')
 
 
-def generate_email_content(papers, user):
+def localized(paper, field, language):
+    """A paper's title, summary, evaluation or category in the reader's language.
+
+    Localized text is written by generate_ai_summaries; papers without it fall back to English.
+    """
+    ai_data = paper['ai_summary']
+    if language != 'en':
+        value = ((ai_data.get('i18n') or {}).get(language) or {}).get(field)
+        if value:
+            return value
+    return paper['title'] if field == 'title' else ai_data.get(field, '')
+
+
+@traced('generate_email_content')
+def generate_email_content(papers, user, strict=False):
+    """papers is a paper index (TopicIndex) or a list of paper dicts; the user's top three are shown.
+
+    A failure yields an apology block in place of the papers, or raises with strict.
+    """
     try:
-        user_topic_ids = set(user['topics'])
-        user_papers = [p for p in papers if set(p['topics']) & user_topic_ids]
+        user_papers = select_papers(papers, user['topics'], 3)
 
         if not user_papers:
             return f"""
@@ -19,24 +37,14 @@ def generate_email_content(papers, user):
             </div>
             """
 
-        sorted_papers = sorted(user_papers, key=lambda x: x['ai_summary'].get('importance', 0), reverse=True)[:3]
         paper_items = []
 
-        for i, p in enumerate(sorted_papers, 1):
+        for i, p in enumerate(user_papers, 1):
             ai_data = p['ai_summary']
 
-            summary_en = ai_data.get('summary', '')
-            evaluation_en = ai_data.get('evaluation', '')
-            category_en = ai_data.get('category', '')
-
-            if user['language'] == 'ko':
-                summary = translate_text(summary_en, 'English', 'Korean')
-                evaluation = translate_text(evaluation_en, 'English', 'Korean')
-                category = translate_text(category_en, 'English', 'Korean')
-            else:
-                summary = summary_en
-                evaluation = evaluation_en
-                category = category_en
+            summary = localized(p, 'summary', user['language'])
+            evaluation = localized(p, 'evaluation', user['language'])
+            category = localized(p, 'category', user['language'])
 
             importance = ai_data.get('importance', 0.8)
             keywords = ai_data.get('keywords', [])
@@ -75,6 +83,8 @@ def generate_email_content(papers, user):
         return "\n".join(paper_items)
 
     except Exception as e:
+        if strict:
+            raise
         logger.error(f"Error generating email content: {str(e)}")
         return """
         <div class="error">
@@ -1,38 +1,182 @@
+import time
 import psycopg2
-import json
 import logging
-from datetime import datetime, timedelta
-from flask import current_app
+import threading
+from flask import current_app, session, has_request_context
 from werkzeug.security import generate_password_hash, check_password_hash
+from .metrics import track_db
+from .invalidation import LocalCache, publish, TOPICS, USER
 
 logger = logging.getLogger('INSTWAVE')
 
+# Filled from the primary: a fill right after an invalidation must not read a lagging replica.
+_topics_cache = LocalCache('topics', [TOPICS])
+_preferences_cache = LocalCache('user_preferences', [USER])
+
 def get_db_connection():
     try:
-        conn = psycopg2.connect(
-            host=current_app.config['DB_HOST'],
-            database=current_app.config['DB_NAME'],
-            user=current_app.config['DB_USER'],
-            password=current_app.config['DB_PASSWORD'],
-            options=f"-c timezone=Asia/Seoul"
-        )
+        with track_db('connect'):
+            conn = psycopg2.connect(
+                host=current_app.config['DB_HOST'],
+                database=current_app.config['DB_NAME'],
+                user=current_app.config['DB_USER'],
+                password=current_app.config['DB_PASSWORD'],
+                options=f"-c timezone=Asia/Seoul"
+            )
         return conn
     except Exception as e:
         logger.error(f"Database connection failed: {str(e)}")
         raise
 
+
+class ReplicaPool:
+    """Round-robin over read replicas, ejecting ones that fail or fall too far behind.
+
+    An ejected replica is skipped until its cooldown passes; the next connection
+    attempt after that is its health check. Lag is sampled at most every
+    LAG_CHECK_SECONDS per replica so ordinary reads stay a single round trip.
+    """
+
+    LAG_CHECK_SECONDS = 10
+
+    def __init__(self, dsns, eject_seconds, max_lag_seconds, connect_timeout):
+        self.dsns = list(dsns)
+        self.eject_seconds = eject_seconds
+        self.max_lag_seconds = max_lag_seconds
+        self.connect_timeout = connect_timeout
+        self.ejected_until = {}
+        self.lag_checked_at = {}
+        self.next_index = 0
+        self.lock = threading.Lock()
+
+    def _candidates(self):
+        with self.lock:
+            now = time.monotonic()
+            start = self.next_index
+            self.next_index = (self.next_index + 1) % len(self.dsns)
+            ordered = self.dsns[start:] + self.dsns[:start]
+            return [dsn for dsn in ordered if self.ejected_until.get(dsn, 0) <= now]
+
+    def _lag_check_due(self, dsn):
+        with self.lock:
+            now = time.monotonic()
+            if now - self.lag_checked_at.get(dsn, 0) < self.LAG_CHECK_SECONDS:
+                return False
+            self.lag_checked_at[dsn] = now
+            return True
+
+    def eject(self, dsn, reason):
+        with self.lock:
+            self.ejected_until[dsn] = time.monotonic() + self.eject_seconds
+        logger.warning(f"Ejected read replica {self._label(dsn)} for {self.eject_seconds}s: {reason}")
+
+    @staticmethod
+    def _label(dsn):
+        # Never log credentials; host and port are enough to tell replicas apart.
+        try:
+            params = psycopg2.extensions.parse_dsn(dsn)
+        except psycopg2.Error:
+            return '<invalid dsn>'
+        return f"{params.get('host', 'localhost')}:{params.get('port', 5432)}"
+
+    def connect(self):
+        """Connection to the next healthy replica, or None when none is usable."""
+        for dsn in self._candidates():
+            conn = None
+            try:
+                with track_db('connect_replica'):
+                    conn = psycopg2.connect(dsn, connect_timeout=self.connect_timeout,
+                                            options="-c timezone=Asia/Seoul")
+                    conn.set_session(readonly=True)
+                if self.max_lag_seconds and self._lag_check_due(dsn):
+                    lag = _replication_lag(conn)
+                    if lag > self.max_lag_seconds:
+                        conn.close()
+                        self.eject(dsn, f"replication lag {lag:.1f}s")
+                        continue
+                return conn
+            except psycopg2.Error as e:
+                if conn is not None:
+                    conn.close()
+                self.eject(dsn, str(e).strip())
+        return None
+
+
+def _replication_lag(conn):
+    """Seconds since the last replayed transaction; 0 when fully caught up, since an idle
+    primary would otherwise make a healthy replica look stale."""
+    cur = conn.cursor()
+    try:
+        with track_db('replica_lag'):
+            cur.execute("""
+                SELECT CASE
+                    WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+                    ELSE COALESCE(EXTRACT(EPOCH FROM NOW() - pg_last_xact_replay_timestamp()), 0)
+                END
+            """)
+            return float(cur.fetchone()[0])
+    finally:
+        cur.close()
+        conn.rollback()
+
+
+_replica_pool = None
+_replica_pool_lock = threading.Lock()
+
+
+def _get_replica_pool():
+    global _replica_pool
+    dsns = current_app.config['DB_REPLICA_DSNS']
+    if not dsns:
+        return None
+    with _replica_pool_lock:
+        if _replica_pool is None or _replica_pool.dsns != dsns:
+            _replica_pool = ReplicaPool(
+                dsns,
+                current_app.config['DB_REPLICA_EJECT_SECONDS'],
+                current_app.config['DB_REPLICA_MAX_LAG_SECONDS'],
+                current_app.config['DB_REPLICA_CONNECT_TIMEOUT']
+            )
+        return _replica_pool
+
+
+def mark_primary_write():
+    """Pin this browser session's reads to the primary for a short while after it writes,
+    so a user sees their own changes even if the replicas have not replayed them yet."""
+    if has_request_context():
+        session['primary_until'] = time.time() + current_app.config['DB_READ_YOUR_WRITES_SECONDS']
+
+
+def _pinned_to_primary():
+    return has_request_context() and session.get('primary_until', 0) > time.time()
+
+
+def get_read_connection():
+    """Connection for read-only queries: a healthy replica when configured, else the primary."""
+    pool = _get_replica_pool()
+    if pool is None:
+        return get_db_connection()
+    if _pinned_to_primary():
+        return get_db_connection()
+    conn = pool.connect()
+    if conn is None:
+        logger.warning("No healthy read replica, reading from the primary")
+        return get_db_connection()
+    return conn
+
 def get_user_by_email(email):
     conn = None
     cur = None
     try:
-        conn = get_db_connection()
+        conn = get_read_connection()
         cur = conn.cursor()
-        cur.execute("""
-            SELECT id, name, email, password_hash, language, notification_method
-            FROM users
-            WHERE email = %s
-        """, (email,))
-        user = cur.fetchone()
+        with track_db('get_user_by_email'):
+            cur.execute("""
+                SELECT id, name, email, password_hash, language, notification_method
+                FROM users
+                WHERE email = %s
+            """, (email,))
+            user = cur.fetchone()
         if user:
             return {
                 'id': user[0],
@@ -59,33 +203,37 @@ def upsert_subscription(name, email, password_hash, topics, language='en', notif
         conn = get_db_connection()
         cur = conn.cursor()
         topic_ids = [int(t) for t in topics]
-        cur.execute("SELECT id FROM topics WHERE id = ANY(%s)", (topic_ids,))
-        valid_topics = [row[0] for row in cur.fetchall()]
+        with track_db('upsert_subscription.validate_topics'):
+            cur.execute("SELECT id FROM topics WHERE id = ANY(%s)", (topic_ids,))
+            valid_topics = [row[0] for row in cur.fetchall()]
         if len(valid_topics) != len(topic_ids):
             invalid_ids = set(topic_ids) - set(valid_topics)
             raise ValueError(f"Invalid topic IDs: {', '.join(map(str, invalid_ids))}")
-        cur.execute("SELECT id FROM users WHERE email = %s", (email,))
-        existing_user = cur.fetchone()
-        if existing_user:
-            user_id = existing_user[0]
-            cur.execute(
-                "UPDATE users SET name = %s, password_hash = %s, language = %s, notification_method = %s, active = %s WHERE id = %s",
-                (name, password_hash, language, notification_method, active, user_id)
-            )
-        else:
-            cur.execute(
-                "INSERT INTO users (name, email, password_hash, language, notification_method, active) VALUES (%s, %s, %s, %s, %s, %s) RETURNING id",
-                (name, email, password_hash, language, notification_method, active)
-            )
-            user_id = cur.fetchone()[0]
-        cur.execute("DELETE FROM user_topics WHERE user_id = %s", (user_id,))
-        for topic_id in topic_ids:
-            cur.execute(
-                "INSERT INTO user_topics (user_id, topic_id) VALUES (%s, %s)",
-                (user_id, topic_id)
-            )
-        conn.commit()
-        return user_id
+        with track_db('upsert_subscription'):
+            cur.execute("SELECT id FROM users WHERE email = %s", (email,))
+            existing_user = cur.fetchone()
+            if existing_user:
+                user_id = existing_user[0]
+                cur.execute(
+                    "UPDATE users SET name = %s, password_hash = %s, language = %s, notification_method = %s, active = %s, preferences_updated_at = NOW() WHERE id = %s",
+                    (name, password_hash, language, notification_method, active, user_id)
+                )
+            else:
+                cur.execute(
+                    "INSERT INTO users (name, email, password_hash, language, notification_method, active) VALUES (%s, %s, %s, %s, %s, %s) RETURNING id",
+                    (name, email, password_hash, language, notification_method, active)
+                )
+                user_id = cur.fetchone()[0]
+            cur.execute("DELETE FROM user_topics WHERE user_id = %s", (user_id,))
+            for topic_id in topic_ids:
+                cur.execute(
+                    "INSERT INTO user_topics (user_id, topic_id) VALUES (%s, %s)",
+                    (user_id, topic_id)
+                )
+            publish(cur, USER, user_id)
+            conn.commit()
+            mark_primary_write()
+            return user_id
     except ValueError as ve:
         logger.error(f"Value error: {str(ve)}")
         if conn:
@@ -102,28 +250,90 @@ def upsert_subscription(name, email, password_hash, topics, language='en', notif
         if conn:
             conn.close()
 
-def get_subscribed_users():
+def get_topics():
+    def load():
+        conn = get_db_connection()
+        cur = conn.cursor()
+        try:
+            with track_db('get_topics'):
+                cur.execute("SELECT id, label FROM topics ORDER BY id")
+                return [{'id': row[0], 'label': row[1]} for row in cur.fetchall()]
+        finally:
+            cur.close()
+            conn.close()
+    return _topics_cache.get('all', load)
+
+def get_user_preferences(user_id):
+    """Dashboard settings for a user, or None. Cached per process until the user changes them;
+    a session that just wrote bypasses the cache so it never waits on the invalidation."""
+    def load():
+        conn = get_db_connection()
+        cur = conn.cursor()
+        try:
+            with track_db('get_user_preferences'):
+                cur.execute("""
+                    SELECT u.email, u.language, u.notification_method, u.active,
+                           EXISTS (SELECT 1 FROM kakao_tokens k WHERE k.user_id = u.id),
+                           ARRAY(SELECT ut.topic_id FROM user_topics ut WHERE ut.user_id = u.id),
+                           u.preferred_hour, u.timezone, u.preferences_updated_at
+                    FROM users u
+                    WHERE u.id = %s
+                """, (user_id,))
+                row = cur.fetchone()
+            if not row:
+                return None
+            return {
+                'email': row[0],
+                'language': row[1],
+                'notification_method': row[2],
+                'active': row[3],
+                'kakao_connected': row[4],
+                'topics': row[5],
+                'preferred_hour': row[6],
+                'timezone': row[7],
+                'preferences_updated_at': row[8]
+            }
+        finally:
+            cur.close()
+            conn.close()
+    return _preferences_cache.get(user_id, load, bypass=_pinned_to_primary())
+
+def get_subscribed_users(user_ids=None):
+    """Users with at least one topic, optionally only those in user_ids."""
     conn = None
     cur = None
     try:
-        conn = get_db_connection()
+        conn = get_read_connection()
         cur = conn.cursor()
-        cur.execute("""
-            SELECT u.id, u.email, u.name, u.language, u.notification_method,
-                   array_agg(ut.topic_id) AS topics
-            FROM users u
-            JOIN user_topics ut ON u.id = ut.user_id
-            GROUP BY u.id
-        """)
+        user_filter = ""
+        params = []
+        if user_ids is not None:
+            user_filter = "WHERE u.id = ANY(%s)"
+            params.append(list(user_ids))
+        with track_db('get_subscribed_users'):
+            cur.execute(f"""
+                SELECT u.id, u.email, u.name, u.language, u.notification_method,
+                       array_agg(ut.topic_id) AS topics, u.active IS NOT FALSE,
+                       u.timezone, u.preferred_hour, u.preferences_updated_at
+                FROM users u
+                JOIN user_topics ut ON u.id = ut.user_id
+                {user_filter}
+                GROUP BY u.id
+            """, params)
+            rows = cur.fetchall()
         users = []
-        for row in cur.fetchall():
+        for row in rows:
             users.append({
                 'id': row[0],
                 'email': row[1],
                 'name': row[2],
                 'language': row[3],
                 'notification_method': row[4],
-                'topics': row[5]
+                'topics': row[5],
+                'active': row[6],
+                'timezone': row[7],
+                'preferred_hour': row[8],
+                'preferences_updated_at': row[9]
             })
         return users
     except Exception as e:
@@ -135,65 +345,53 @@ def get_subscribed_users():
         if conn:
             conn.close()
 
-def get_recent_papers():
+def digest_window(today=None):
+    """[start, end) of the papers this week's digest covers: the seven whole days before
+    the send Tuesday, the same week the topic index delivers."""
+    from .topic_index import current_week, week_bounds
+    return week_bounds(current_week(today))
+
+def get_recent_papers(category=None):
+    """This week's summarized papers, optionally only those in an arXiv category.
+
+    category may be a full category ('cs.LG') or a top-level one ('cs'). Near-duplicates
+    collapse to the most important paper of their cluster.
+    """
     conn = None
     cur = None
     try:
-        conn = get_db_connection()
+        conn = get_read_connection()
         cur = conn.cursor()
-        today = datetime.now()
-        days_since_tuesday = (today.weekday() - 1) % 7
-        last_tuesday = today - timedelta(days=days_since_tuesday + 7)
-        this_monday = today - timedelta(days=today.weekday())
-        cur.execute("""
-            SELECT id, title, author, ai_summary, created_at,
-                   arxiv_id, categories
-            FROM thesis
-            WHERE created_at BETWEEN %s AND %s
-            AND ai_summary IS NOT NULL
-        """, (last_tuesday, this_monday))
+        window_start, window_end = digest_window()
+        category_filter = ""
+        params = [window_start, window_end]
+        if category:
+            column = 'categories' if '.' in category else 'top_categories'
+            category_filter = f"AND {column} @> %s"
+            params.append([category])
+        with track_db('get_recent_papers'):
+            cur.execute(f"""
+                SELECT DISTINCT ON (COALESCE(dup_of, id))
+                       id, title, author, ai_summary, created_at,
+                       arxiv_id, instwave_category_topics(top_categories)
+                FROM thesis
+                WHERE created_at >= %s AND created_at < %s
+                AND ai_summary IS NOT NULL
+                {category_filter}
+                ORDER BY COALESCE(dup_of, id), instwave_importance(ai_summary) DESC, id
+            """, params)
+            rows = cur.fetchall()
         papers = []
-        for row in cur.fetchall():
-            try:
-                categories = []
-                if row[6]:
-                    if isinstance(row[6], str):
-                        categories_str = row[6].strip('{}')
-                        categories = [cat.strip() for cat in categories_str.split(',')] if categories_str else []
-                    elif isinstance(row[6], list):
-                        categories = row[6]
-                    else:
-                        logger.warning(f"Unexpected categories type for paper {row[0]}: {type(row[6])}")
-                top_level_categories = set()
-                for category in categories:
-                    if isinstance(category, str) and '.' in category:
-                        top_level = category.split('.')[0]
-                        top_level_categories.add(top_level)
-                    elif isinstance(category, str):
-                        top_level_categories.add(category)
-                if top_level_categories:
-                    cur.execute("""
-                        SELECT DISTINCT topic_id 
-                        FROM arxiv_category_mapping 
-                        WHERE arxiv_category = ANY(%s)
-                    """, (list(top_level_categories),))
-                    topic_ids = [r[0] for r in cur.fetchall()]
-                else:
-                    topic_ids = []
-                ai_summary = json.loads(row[3]) if row[3] else {}
-                papers.append({
-                    'id': row[0],
-                    'title': row[1],
-                    'author': row[2],
-                    'ai_summary': ai_summary,
-                    'date': row[4].strftime('%Y-%m-%d'),
-                    'topics': topic_ids,
-                    'link': f"https://arxiv.org/abs/{row[5]}" if row[5] else "#"
-                })
-            except json.JSONDecodeError as e:
-                logger.error(f"Invalid JSON in ai_summary for paper {row[0]}: {e}")
-            except Exception as e:
-                logger.error(f"Error processing paper {row[0]}: {e}")
+        for row in rows:
+            papers.append({
+                'id': row[0],
+                'title': row[1],
+                'author': row[2],
+                'ai_summary': row[3] or {},
+                'date': row[4].strftime('%Y-%m-%d'),
+                'topics': row[6],
+                'link': f"https://arxiv.org/abs/{row[5]}" if row[5] else "#"
+            })
         return papers
     except Exception as e:
         logger.error(f"Database error in get_recent_papers: {str(e)}")
@@ -203,3 +401,44 @@ def get_recent_papers():
             cur.close()
         if conn:
             conn.close()
+
+def get_papers_by_ids(paper_ids, window=None):
+    """Papers shaped like get_recent_papers() rows, keyed by id. window is the (start, end)
+    their created_at falls in, by default this week's digest window."""
+    if not paper_ids:
+        return {}
+    conn = None
+    cur = None
+    try:
+        conn = get_read_connection()
+        cur = conn.cursor()
+        window_start, window_end = window or digest_window()
+        with track_db('get_papers_by_ids'):
+            # The window bounds let Postgres prune to this week's partitions.
+            cur.execute("""
+                SELECT id, title, author, ai_summary, created_at, arxiv_id,
+                       instwave_category_topics(top_categories)
+                FROM thesis
+                WHERE id = ANY(%s) AND created_at >= %s AND created_at < %s
+            """, (list(paper_ids), window_start, window_end))
+            rows = cur.fetchall()
+        return {
+            row[0]: {
+                'id': row[0],
+                'title': row[1],
+                'author': row[2],
+                'ai_summary': row[3] or {},
+                'date': row[4].strftime('%Y-%m-%d'),
+                'topics': row[6],
+                'link': f"https://arxiv.org/abs/{row[5]}" if row[5] else "#"
+            }
+            for row in rows
+        }
+    except Exception as e:
+        logger.error(f"Database error in get_papers_by_ids: {str(e)}")
+        return {}
+    finally:
+        if cur:
+            cur.close()
+        if conn:
+            conn.close()
@@ -0,0 +1,158 @@
+import re
+import struct
+import hashlib
+import logging
+import unicodedata
+from datetime import datetime, timedelta
+from flask import current_app
+from .database import get_db_connection
+from .metrics import track_db
+from .invalidation import publish, PAPERS
+from .topic_index import update_topic_index
+
+logger = logging.getLogger('INSTWAVE')
+
+# Near-duplicate papers (arXiv replacements, cross-lists, re-ingests) are found with
+# MinHash over word shingles of title + abstract, and LSH banding to turn "similar
+# signature" into "shares a bucket". Signatures and buckets live in Postgres, so
+# indexing a paper only holds that paper and its few candidates in memory however
+# many months the index covers.
+
+NUM_PERM = 64
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+SHINGLE_SIZE = 3
+MERSENNE_PRIME = (1 << 61) - 1
+WORD = re.compile(r'\w+')
+
+
+def _permutations():
+    # Fixed coefficients so signatures stay comparable across runs and processes.
+    coefficients = []
+    for i in range(NUM_PERM):
+        digest = hashlib.blake2b(f"instwave-minhash-{i}".encode(), digest_size=16).digest()
+        a, b = struct.unpack('<QQ', digest)
+        coefficients.append((a % (MERSENNE_PRIME - 1) + 1, b % MERSENNE_PRIME))
+    return coefficients
+
+
+PERMUTATIONS = _permutations()
+
+
+def shingles(title, abstract):
+    text = unicodedata.normalize('NFKC', f"{title or ''} {abstract or ''}").casefold()
+    words = WORD.findall(text)
+    if len(words) < SHINGLE_SIZE:
+        return {' '.join(words)} if words else set()
+    return {' '.join(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)}
+
+
+def minhash(shingle_set):
+    hashes = [int.from_bytes(hashlib.blake2b(s.encode('utf-8'), digest_size=8).digest(), 'little')
+              for s in shingle_set]
+    if not hashes:
+        return [MERSENNE_PRIME] * NUM_PERM
+    return [min((a * h + b) % MERSENNE_PRIME for h in hashes) for a, b in PERMUTATIONS]
+
+
+def band_buckets(signature):
+    """One signed 64-bit bucket key per band."""
+    buckets = []
+    for band in range(BANDS):
+        rows = signature[band * ROWS:(band + 1) * ROWS]
+        digest = hashlib.blake2b(struct.pack(f'<{ROWS}Q', *rows), digest_size=8).digest()
+        buckets.append(int.from_bytes(digest, 'little', signed=True))
+    return buckets
+
+
+def estimated_jaccard(left, right):
+    return sum(1 for a, b in zip(left, right) if a == b) / NUM_PERM
+
+
+def _index_paper(cur, thesis_id, title, abstract, created_at, threshold, cutoff):
+    """Index one paper; returns the id of the paper it duplicates, or None."""
+    signature = minhash(shingles(title, abstract))
+    buckets = band_buckets(signature)
+    cur.execute("""
+        SELECT m.thesis_id, m.signature, m.cluster_id
+        FROM thesis_minhash m
+        WHERE m.thesis_id IN (
+            SELECT b.thesis_id FROM thesis_lsh_buckets b
+            JOIN unnest(%s::smallint[], %s::bigint[]) AS q(band, bucket)
+              ON b.band = q.band AND b.bucket = q.bucket
+            WHERE b.created_at >= %s
+        )
+        AND m.thesis_id <> %s
+    """, (list(range(BANDS)), buckets, cutoff, thesis_id))
+    best_similarity, cluster_id = 0.0, None
+    for candidate_id, candidate_signature, candidate_cluster in cur.fetchall():
+        similarity = estimated_jaccard(signature, candidate_signature)
+        if similarity >= threshold and similarity > best_similarity:
+            best_similarity, cluster_id = similarity, candidate_cluster
+    cur.execute("""
+        INSERT INTO thesis_minhash (thesis_id, signature, cluster_id, created_at)
+        VALUES (%s, %s, %s, %s)
+        ON CONFLICT (thesis_id) DO NOTHING
+    """, (thesis_id, signature, cluster_id or thesis_id, created_at))
+    cur.execute("""
+        INSERT INTO thesis_lsh_buckets (band, bucket, thesis_id, created_at)
+        SELECT band, bucket, %s, %s FROM unnest(%s::smallint[], %s::bigint[]) AS q(band, bucket)
+        ON CONFLICT DO NOTHING
+    """, (thesis_id, created_at, list(range(BANDS)), buckets))
+    if cluster_id is not None:
+        cur.execute("UPDATE thesis SET dup_of = %s WHERE id = %s AND created_at = %s",
+                    (cluster_id, thesis_id, created_at))
+        # The paper may already be summarized and listed as its own cluster.
+        update_topic_index(cur, thesis_id)
+    return cluster_id
+
+
+def index_new_papers(batch_size=500):
+    """Add papers not yet in the near-duplicate index, oldest first, so the earliest
+    paper of a cluster is its canonical one. Entries older than DEDUP_WINDOW_DAYS are
+    pruned. Returns (indexed, duplicates)."""
+    threshold = current_app.config['DEDUP_THRESHOLD']
+    cutoff = datetime.now() - timedelta(days=current_app.config['DEDUP_WINDOW_DAYS'])
+    indexed = 0
+    duplicates = 0
+    conn = get_db_connection()
+    cur = conn.cursor()
+    try:
+        with track_db('dedup.prune'):
+            cur.execute("DELETE FROM thesis_lsh_buckets WHERE created_at < %s", (cutoff,))
+            cur.execute("DELETE FROM thesis_minhash WHERE created_at < %s", (cutoff,))
+            conn.commit()
+        while True:
+            with track_db('dedup.fetch_unindexed'):
+                cur.execute("""
+                    SELECT t.id, t.title, t.summary, t.created_at
+                    FROM thesis t
+                    WHERE t.created_at >= %s
+                    AND t.summary IS NOT NULL
+                    AND NOT EXISTS (SELECT 1 FROM thesis_minhash m WHERE m.thesis_id = t.id)
+                    ORDER BY t.created_at, t.id
+                    LIMIT %s
+                """, (cutoff, batch_size))
+                rows = cur.fetchall()
+            if not rows:
+                break
+            with track_db('dedup.index_batch'):
+                batch_duplicates = 0
+                for thesis_id, title, abstract, created_at in rows:
+                    if _index_paper(cur, thesis_id, title, abstract, created_at, threshold, cutoff) is not None:
+                        batch_duplicates += 1
+                if batch_duplicates:
+                    # dup_of changed, which collapses papers in cached weekly results.
+                    publish(cur, PAPERS)
+                conn.commit()
+                duplicates += batch_duplicates
+            indexed += len(rows)
+        if indexed:
+            logger.info(f"Near-duplicate index: {indexed} papers added, {duplicates} duplicates")
+        return indexed, duplicates
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+        conn.close()
@@ -0,0 +1,156 @@
+import hashlib
+import logging
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+from flask import current_app
+from .database import get_db_connection, get_subscribed_users
+from .metrics import track_db
+
+logger = logging.getLogger('INSTWAVE')
+
+# The Tuesday dispatch is spread over DELIVERY_WINDOW_START_HOUR..END_HOUR (scheduler
+# timezone) in DELIVERY_SLOT_MINUTES slots, each sent by its own scheduler tick. A user
+# with a preferred hour or a timezone is placed at that local hour when it falls inside
+# the window; everyone else is sharded by a hash of their id into whichever slot keeps
+# the outbound load level. The plan is written once per week to delivery_plan, and a
+# tick claims every unclaimed user of its own and earlier slots, so a missed tick is
+# made up by the next one and concurrent processes never send twice.
+
+
+def window_settings():
+    config = current_app.config
+    return {
+        'timezone': ZoneInfo(config['SCHEDULER_TIMEZONE']),
+        'start_hour': config['DELIVERY_WINDOW_START_HOUR'],
+        'end_hour': config['DELIVERY_WINDOW_END_HOUR'],
+        'slot_minutes': config['DELIVERY_SLOT_MINUTES']
+    }
+
+
+def delivery_window(now, settings):
+    """(start, slot count) of the delivery window on the Tuesday of now's week."""
+    local = now.astimezone(settings['timezone'])
+    tuesday = local.date() - timedelta(days=local.weekday() - 1)
+    start = datetime(tuesday.year, tuesday.month, tuesday.day, settings['start_hour'],
+                     tzinfo=settings['timezone'])
+    slots = (settings['end_hour'] - settings['start_hour']) * 60 // settings['slot_minutes']
+    return start, slots
+
+
+def current_slot(now, start, slots, slot_minutes):
+    return min(int((now - start).total_seconds() // (slot_minutes * 60)), slots - 1)
+
+
+def _user_hash(user_id):
+    return int.from_bytes(hashlib.blake2b(str(user_id).encode(), digest_size=8).digest(), 'little')
+
+
+def _user_zone(user, default):
+    try:
+        return ZoneInfo(user['timezone']) if user.get('timezone') else default
+    except (ZoneInfoNotFoundError, ValueError):
+        return default
+
+
+def preferred_slot(user, start, slots, settings):
+    """The slot of the user's preferred local hour, or None without a usable preference."""
+    if user.get('preferred_hour') is None and not user.get('timezone'):
+        return None
+    zone = _user_zone(user, settings['timezone'])
+    hour = user['preferred_hour'] if user.get('preferred_hour') is not None else settings['start_hour']
+    tuesday = start.date()
+    local = datetime(tuesday.year, tuesday.month, tuesday.day, hour, tzinfo=zone)
+    offset = (local - start).total_seconds() // (settings['slot_minutes'] * 60)
+    if 0 <= offset < slots:
+        return int(offset)
+    return None
+
+
+def _weight(user):
+    # Users on both channels cost two provider calls.
+    return 2 if user['notification_method'] == 'both' else 1
+
+
+def plan_delivery(users, start, slots, settings):
+    """Map user id to slot. Preferences are placed first; the rest, in user-hash order,
+    go to their hash slot or the next one under the level target."""
+    load = [0] * slots
+    plan = {}
+    flexible = []
+    for user in users:
+        slot = preferred_slot(user, start, slots, settings)
+        if slot is None:
+            flexible.append(user)
+        else:
+            plan[user['id']] = slot
+            load[slot] += _weight(user)
+    target = -(-sum(_weight(user) for user in users) // slots)
+    for user in sorted(flexible, key=lambda u: (_user_hash(u['id']), u['id'])):
+        slot = _user_hash(user['id']) % slots
+        for step in range(slots):
+            candidate = (slot + step) % slots
+            if load[candidate] + _weight(user) <= target:
+                slot = candidate
+                break
+        else:
+            slot = min(range(slots), key=load.__getitem__)
+        plan[user['id']] = slot
+        load[slot] += _weight(user)
+    return plan, load
+
+
+def ensure_delivery_plan(start, slots, settings):
+    """Write this week's plan unless one exists; returns the planned user count."""
+    week = start.date()
+    conn = get_db_connection()
+    cur = conn.cursor()
+    try:
+        with track_db('delivery.plan_exists'):
+            cur.execute("SELECT COUNT(*) FROM delivery_plan WHERE week = %s", (week,))
+            planned = cur.fetchone()[0]
+        if planned:
+            return planned
+        with track_db('delivery.prune_plans'):
+            cur.execute("DELETE FROM delivery_plan WHERE week < %s", (week - timedelta(weeks=4),))
+        users = [user for user in get_subscribed_users() if user['active']]
+        plan, load = plan_delivery(users, start, slots, settings)
+        user_ids = list(plan)
+        with track_db('delivery.write_plan'):
+            cur.execute("""
+                INSERT INTO delivery_plan (week, user_id, slot)
+                SELECT %s, user_id, slot FROM unnest(%s::int[], %s::smallint[]) AS p(user_id, slot)
+                ON CONFLICT (week, user_id) DO NOTHING
+            """, (week, user_ids, [plan[user_id] for user_id in user_ids]))
+            conn.commit()
+        logger.info(f"Delivery plan for {week}: {len(plan)} users over {slots} slots, "
+                    f"peak slot load {max(load, default=0)}")
+        return len(plan)
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+        conn.close()
+
+
+def claim_due_users(start, slot):
+    """Claim and return the users of slots up to slot that no tick has taken yet."""
+    conn = get_db_connection()
+    cur = conn.cursor()
+    try:
+        with track_db('delivery.claim'):
+            cur.execute("""
+                UPDATE delivery_plan
+                SET claimed_at = NOW()
+                WHERE week = %s AND slot <= %s AND claimed_at IS NULL
+                RETURNING user_id
+            """, (start.date(), slot))
+            user_ids = [row[0] for row in cur.fetchall()]
+            conn.commit()
+    finally:
+        cur.close()
+        conn.close()
+    if not user_ids:
+        return []
+    # Read after claiming so a user who unsubscribed since planning is still skipped.
+    return [user for user in get_subscribed_users(user_ids) if user['active']]
@@ -0,0 +1,216 @@
+import json
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from flask import current_app, request
+from .database import get_db_connection
+from .topic_index import week_top_papers
+from .content_generator import generate_email_content
+from .email import EmailService
+from .kakao import KakaoService
+from .metrics import track_db, track_job
+
+logger = logging.getLogger('INSTWAVE')
+
+IN_FLIGHT = ('queued', 'running')
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=current_app.config['SEND_NOW_WORKERS'],
+                thread_name_prefix='send-now'
+            )
+        return _executor
+
+
+def enqueue_send_now(user_id):
+    """Queue an on-demand digest for a user.
+
+    Returns (job_id, state) where state is 'queued' for a new job, 'coalesced' when a
+    job for this user is already in flight, or 'cooldown' when one succeeded recently; a
+    failed job never holds back a retry.
+    """
+    cooldown = current_app.config['SEND_NOW_COOLDOWN_SECONDS']
+    timeout = current_app.config['SEND_NOW_JOB_TIMEOUT_SECONDS']
+    conn = None
+    cur = None
+    try:
+        conn = get_db_connection()
+        cur = conn.cursor()
+        with track_db('enqueue_send_now'):
+            # A job left behind by a dead worker must not block the user forever.
+            cur.execute("""
+                UPDATE digest_jobs
+                SET status = 'failed', finished_at = NOW(), result = %s
+                WHERE user_id = %s AND status IN %s
+                AND created_at < NOW() - make_interval(secs => %s)
+            """, (json.dumps([{'category': 'error', 'message': 'Digest job timed out.'}]),
+                  user_id, IN_FLIGHT, timeout))
+            cur.execute("""
+                SELECT id FROM digest_jobs
+                WHERE user_id = %s AND status IN %s
+            """, (user_id, IN_FLIGHT))
+            row = cur.fetchone()
+            if row:
+                conn.commit()
+                return row[0], 'coalesced'
+            cur.execute("""
+                SELECT id FROM digest_jobs
+                WHERE user_id = %s AND status = 'succeeded'
+                AND created_at > NOW() - make_interval(secs => %s)
+                ORDER BY created_at DESC
+                LIMIT 1
+            """, (user_id, cooldown))
+            row = cur.fetchone()
+            if row:
+                conn.commit()
+                return row[0], 'cooldown'
+            cur.execute("""
+                INSERT INTO digest_jobs (user_id, status)
+                VALUES (%s, 'queued')
+                ON CONFLICT (user_id) WHERE status IN ('queued', 'running') DO NOTHING
+                RETURNING id
+            """, (user_id,))
+            row = cur.fetchone()
+            if not row:
+                # Lost the race against a concurrent request from the same user.
+                cur.execute("SELECT id FROM digest_jobs WHERE user_id = %s AND status IN %s",
+                            (user_id, IN_FLIGHT))
+                row = cur.fetchone()
+                conn.commit()
+                return row[0], 'coalesced'
+            conn.commit()
+        job_id = row[0]
+    finally:
+        if cur:
+            cur.close()
+        if conn:
+            conn.close()
+
+    # The worker renders links with url_for(_external=True), so it reuses this request's host.
+    _get_executor().submit(_run_send_now, current_app._get_current_object(), request.host_url, job_id, user_id)
+    logger.info(f"Queued send-now job {job_id} for user {user_id}")
+    return job_id, 'queued'
+
+
+def get_job_status(job_id, user_id):
+    conn = None
+    cur = None
+    try:
+        # The primary owns a job's state; a lagging replica could show it queued or missing.
+        conn = get_db_connection()
+        cur = conn.cursor()
+        with track_db('get_job_status'):
+            cur.execute("""
+                SELECT id, status, result, created_at, started_at, finished_at
+                FROM digest_jobs
+                WHERE id = %s AND user_id = %s
+            """, (job_id, user_id))
+            row = cur.fetchone()
+        if not row:
+            return None
+        return {
+            'id': row[0],
+            'status': row[1],
+            'messages': json.loads(row[2]) if row[2] else [],
+            'created_at': row[3].isoformat() if row[3] else None,
+            'started_at': row[4].isoformat() if row[4] else None,
+            'finished_at': row[5].isoformat() if row[5] else None
+        }
+    finally:
+        if cur:
+            cur.close()
+        if conn:
+            conn.close()
+
+
+def _set_job_state(job_id, status, messages=None):
+    conn = get_db_connection()
+    cur = conn.cursor()
+    try:
+        with track_db('set_job_state'):
+            if status == 'running':
+                cur.execute("UPDATE digest_jobs SET status = %s, started_at = NOW() WHERE id = %s",
+                            (status, job_id))
+            else:
+                cur.execute("""
+                    UPDATE digest_jobs
+                    SET status = %s, result = %s, finished_at = NOW()
+                    WHERE id = %s
+                """, (status, json.dumps(messages or []), job_id))
+            conn.commit()
+    finally:
+        cur.close()
+        conn.close()
+
+
+def _load_user(user_id):
+    conn = get_db_connection()
+    cur = conn.cursor()
+    try:
+        with track_db('send_now.load_user'):
+            cur.execute("""
+                SELECT u.id, u.email, u.name, u.language, u.notification_method,
+                       array_agg(ut.topic_id) AS topics
+                FROM users u
+                JOIN user_topics ut ON u.id = ut.user_id
+                WHERE u.id = %s
+                GROUP BY u.id
+            """, (user_id,))
+            row = cur.fetchone()
+        if not row:
+            return None
+        return {
+            'id': row[0],
+            'email': row[1],
+            'name': row[2],
+            'language': row[3],
+            'notification_method': row[4],
+            'topics': row[5]
+        }
+    finally:
+        cur.close()
+        conn.close()
+
+
+def _run_send_now(app, base_url, job_id, user_id):
+    with app.test_request_context(base_url=base_url):
+        messages = []
+        try:
+            _set_job_state(job_id, 'running')
+            with track_job('send_now'):
+                user = _load_user(user_id)
+                if not user:
+                    messages.append({'category': 'error', 'message': 'User not found'})
+                    _set_job_state(job_id, 'failed', messages)
+                    return
+                papers = week_top_papers(user['topics'], limit=3)
+                email_content = generate_email_content(papers, user)
+                ok = True
+                if user['notification_method'] in ['email', 'both']:
+                    if EmailService.send_research_digest(user, email_content):
+                        messages.append({'category': 'success', 'message': 'Weekly digest sent to your email!'})
+                    else:
+                        ok = False
+                        messages.append({'category': 'error',
+                                         'message': 'Failed to send email. Please try again later.'})
+                if user['notification_method'] in ['kakao', 'both']:
+                    if KakaoService.send_research_digest(user, papers):
+                        messages.append({'category': 'success', 'message': 'Weekly digest sent via Kakao!'})
+                    else:
+                        ok = False
+                        messages.append({'category': 'error', 'message': 'Failed to send Kakao notification.'})
+            _set_job_state(job_id, 'succeeded' if ok else 'failed', messages)
+        except Exception as e:
+            logger.error(f"Send-now job {job_id} failed: {str(e)}")
+            messages.append({'category': 'error', 'message': 'An error occurred. Please try again.'})
+            try:
+                _set_job_state(job_id, 'failed', messages)
+            except Exception as inner:
+                logger.error(f"Could not record failure of send-now job {job_id}: {str(inner)}")
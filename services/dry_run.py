@@ -0,0 +1,101 @@
+import math
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Stage timings for a weekly dispatch. The dispatch loop activates a DispatchStats and
+# the services time their own steps with stage(); outside a dispatch stage() costs a
+# ContextVar lookup. A dry run turns the totals into throughput and worker estimates.
+
+_current = ContextVar('dispatch_stats', default=None)
+
+
+class DispatchStats:
+    def __init__(self):
+        self.stages = {}
+        self.counters = {}
+        self.started_at = time.perf_counter()
+
+    def add(self, name, seconds):
+        entry = self.stages.get(name)
+        if entry is None:
+            entry = self.stages[name] = [0, 0.0, 0.0]
+        entry[0] += 1
+        entry[1] += seconds
+        entry[2] = max(entry[2], seconds)
+
+    def count(self, name, value=1):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    @contextmanager
+    def timed(self, name):
+        started_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - started_at)
+
+    @contextmanager
+    def activate(self):
+        token = _current.set(self)
+        try:
+            yield self
+        finally:
+            _current.reset(token)
+
+    def summary(self):
+        return {
+            name: {
+                'calls': calls,
+                'seconds': round(total, 4),
+                'avg_ms': round(total / calls * 1000, 3),
+                'max_ms': round(longest * 1000, 3)
+            }
+            for name, (calls, total, longest) in self.stages.items()
+        }
+
+
+@contextmanager
+def stage(name):
+    stats = _current.get()
+    if stats is None:
+        yield
+        return
+    with stats.timed(name):
+        yield
+
+
+def count(name, value=1):
+    stats = _current.get()
+    if stats is not None:
+        stats.count(name, value)
+
+
+def capacity_report(stats, users, peak_slot_users, slot_minutes, rate_limits, provider_messages):
+    """Throughput of the rehearsed run against what the busiest delivery slot needs.
+
+    Workers assumes one dispatch loop per worker and perfect sharding of a slot; the
+    provider bound is the time the configured rate limits alone need per slot.
+    """
+    elapsed = time.perf_counter() - stats.started_at
+    deliver = stats.stages.get('deliver', [0, 0.0, 0.0])[1]
+    users_per_second = users / deliver if deliver else None
+    slot_seconds = slot_minutes * 60
+    needed = peak_slot_users / slot_seconds if slot_seconds else None
+    provider_seconds = {}
+    for provider, messages in provider_messages.items():
+        rate = rate_limits.get(provider, (None,))[0]
+        if rate and users:
+            provider_seconds[provider] = round(messages / users * peak_slot_users / rate, 1)
+    return {
+        'users': users,
+        'elapsed_seconds': round(elapsed, 3),
+        'users_per_second': round(users_per_second, 2) if users_per_second else None,
+        'peak_slot_users': peak_slot_users,
+        'slot_seconds': slot_seconds,
+        'needed_users_per_second': round(needed, 3) if needed is not None else None,
+        'workers_needed': math.ceil(needed / users_per_second) if needed and users_per_second else None,
+        'provider_bound_seconds_per_slot': provider_seconds,
+        'stages': stats.summary(),
+        'counters': dict(stats.counters)
+    }
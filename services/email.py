@@ -2,25 +2,51 @@ import resend
 from flask import current_app, url_for
 from pathlib import Path
 from jinja2 import Template
+import time
 import logging
 from i18n import get_translation
+from .dry_run import stage
+from .metrics import record_delivery
+from .rate_limit import RateLimited, rate_limited_call
+from .tracing import span, traced
+from .transports import Transport, get_transport
 
 logger = logging.getLogger('INSTWAVE')
 
 
+class ResendTransport(Transport):
+    live = True
+
+    def send(self, provider, message):
+        resend.api_key = current_app.config['RESEND_API_KEY']
+
+        def send():
+            try:
+                return resend.Emails.send(message)
+            except resend.exceptions.ResendError as e:
+                if str(e.code) == '429':
+                    raise RateLimited('resend', None, str(e))
+                raise
+
+        response = rate_limited_call('resend', send)
+        if 'id' in response:
+            return True
+        logger.error(f"Email failed: {response.get('message', 'Unknown error')}")
+        return False
+
+
 class EmailService:
-    @staticmethod
-    def send_research_digest(user, content):
-        try:
-            if user['language'] == 'ko':
-                subject = get_translation('email_subject', 'ko')
-            else:
-                subject = get_translation('email_subject', 'en')
+    transport = ResendTransport()
 
+    @staticmethod
+    def render_digest(user, content):
+        """(subject, html) of a user's digest around content from generate_email_content."""
+        subject = get_translation('email_subject', 'ko' if user['language'] == 'ko' else 'en')
+        with span('email.render'), stage('email.render'):
             template_path = Path("templates/email_base.html")
             base_template = Template(template_path.read_text())
 
-            unsubscribe_link = url_for('dashboard', _external=True)
+            unsubscribe_link = url_for('web.dashboard', _external=True)
 
             final_html = base_template.render(
                 content=content,
@@ -28,22 +54,38 @@ class EmailService:
                 user_name=user['name'],
                 _=lambda key: get_translation(key, user['language'])
             )
+        return subject, final_html
 
-            resend.api_key = current_app.config['RESEND_API_KEY']
+    @staticmethod
+    @traced('email.send_research_digest')
+    def send_research_digest(user, content=None, rendered=None):
+        """Send a digest, rendering content unless rendered carries a pre-rendered (subject, html)."""
+        try:
+            subject, final_html = rendered or EmailService.render_digest(user, content)
 
-            response = resend.Emails.send({
+            transport = get_transport(EmailService.transport)
+            message = {
                 "from": "INSTWAVE Digest <onboarding@resend.dev>",
                 "to": user['email'],
                 "subject": subject,
                 "html": final_html
-            })
-
-            if 'id' in response:
-                logger.info(f"Email sent to {user['email']} successfully")
-                return True
-            else:
-                logger.error(f"Email failed: {response.get('message', 'Unknown error')}")
-                return False
+            }
+
+            started_at = time.perf_counter()
+            try:
+                with stage('email.send'):
+                    success = transport.send('resend', message)
+            except Exception:
+                if transport.live:
+                    record_delivery('resend', False, started_at)
+                raise
+
+            # Sinks stay out of the delivery metrics, which describe real sends.
+            if transport.live:
+                record_delivery('resend', success, started_at)
+                if success:
+                    logger.info(f"Email sent to {user['email']} successfully")
+            return success
 
         except Exception as e:
             logger.error(f"Email error: {str(e)}")
@@ -0,0 +1,183 @@
+import os
+import json
+import time
+import select
+import socket
+import logging
+import threading
+from .metrics import LOCAL_CACHE
+
+logger = logging.getLogger('INSTWAVE')
+
+# Per-process caches are kept coherent with Postgres LISTEN/NOTIFY. Writers queue a
+# typed event with publish() inside their own transaction, so it is delivered on
+# commit and dropped on rollback; a listener thread in every process evicts the
+# matching entries. Caches only serve while that listener is connected: while it is
+# down they read through, and on (re)connect they start empty, since events sent in
+# between are lost.
+
+TOPICS = 'topics'
+CATEGORY_MAPPING = 'category_mapping'
+USER = 'user'
+PAPERS = 'papers'
+KINDS = (TOPICS, CATEGORY_MAPPING, USER, PAPERS)
+
+KEEPALIVE_SECONDS = 30
+MAX_BACKOFF_SECONDS = 30
+
+
+class _Settings:
+    app = None
+    channel = 'instwave_invalidate'
+    connected = False
+    pid = None
+    thread = None
+    caches = []
+    lock = threading.Lock()
+
+
+_settings = _Settings()
+
+
+class LocalCache:
+    """A dict cache evicted by invalidation events of the given kinds.
+
+    An event with a key evicts that key; an event without one clears the cache. A
+    load that overlaps an event is returned but not stored, so a fill that read the
+    old rows cannot outlive the invalidation.
+    """
+
+    def __init__(self, name, kinds):
+        self.name = name
+        self.kinds = set(kinds)
+        self.entries = {}
+        self.generation = 0
+        self.lock = threading.Lock()
+        _settings.caches.append(self)
+
+    def get(self, key, load, bypass=False):
+        _ensure_listener()
+        if bypass or not _settings.connected:
+            LOCAL_CACHE.labels(self.name, 'bypass').inc()
+            return load()
+        with self.lock:
+            if key in self.entries:
+                LOCAL_CACHE.labels(self.name, 'hit').inc()
+                return self.entries[key]
+            generation = self.generation
+        LOCAL_CACHE.labels(self.name, 'miss').inc()
+        value = load()
+        with self.lock:
+            if generation == self.generation and _settings.connected:
+                self.entries[key] = value
+        return value
+
+    def evict(self, key=None):
+        with self.lock:
+            self.generation += 1
+            if key is None:
+                self.entries.clear()
+            else:
+                self.entries.pop(key, None)
+        LOCAL_CACHE.labels(self.name, 'evict').inc()
+
+
+def publish(cur, kind, key=None):
+    """Queue an invalidation in cur's transaction; every process evicts on commit."""
+    if kind not in KINDS:
+        raise ValueError(f"Unknown invalidation kind: {kind}")
+    cur.execute("SELECT pg_notify(%s, %s)", (_settings.channel, json.dumps({'kind': kind, 'key': key})))
+
+
+def _dispatch(payload):
+    try:
+        event = json.loads(payload)
+        kind, key = event['kind'], event.get('key')
+    except (ValueError, KeyError, TypeError):
+        logger.warning(f"Ignoring malformed invalidation event: {payload!r}")
+        return
+    for cache in _settings.caches:
+        if kind in cache.kinds:
+            cache.evict(key)
+
+
+def _clear_all():
+    for cache in _settings.caches:
+        cache.evict()
+
+
+def _connect():
+    from .database import get_db_connection
+    with _settings.app.app_context():
+        conn = get_db_connection()
+    conn.autocommit = True
+    cur = conn.cursor()
+    cur.execute(f'LISTEN "{_settings.channel}"')
+    cur.close()
+    return conn
+
+
+def _listen():
+    backoff = 1
+    while True:
+        conn = None
+        try:
+            conn = _connect()
+            _clear_all()
+            _settings.connected = True
+            backoff = 1
+            logger.info(f"Invalidation listener connected on {_settings.channel} "
+                        f"({socket.gethostname()}:{os.getpid()})")
+            while True:
+                if select.select([conn], [], [], KEEPALIVE_SECONDS) == ([], [], []):
+                    # select() cannot see a silently dropped connection; a round trip can.
+                    cur = conn.cursor()
+                    cur.execute("SELECT 1")
+                    cur.close()
+                conn.poll()
+                while conn.notifies:
+                    _dispatch(conn.notifies.pop(0).payload)
+        except Exception as e:
+            if _settings.connected:
+                logger.warning(f"Invalidation listener disconnected, caches bypassed: {str(e)}")
+            else:
+                logger.warning(f"Invalidation listener could not connect: {str(e)}")
+        finally:
+            _settings.connected = False
+            _clear_all()
+            if conn is not None:
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+        time.sleep(backoff)
+        backoff = min(backoff * 2, MAX_BACKOFF_SECONDS)
+
+
+def _ensure_listener():
+    # Checked on every cache read so a worker forked after init_invalidation()
+    # starts its own listener instead of trusting the parent's.
+    if _settings.app is None or _settings.pid == os.getpid():
+        return
+    with _settings.lock:
+        if _settings.pid == os.getpid():
+            return
+        _settings.connected = False
+        _settings.pid = os.getpid()
+        _settings.thread = threading.Thread(target=_listen, name='invalidation-listener', daemon=True)
+        _settings.thread.start()
+
+
+def init_invalidation(app):
+    """Enable this process's listener; without it every LocalCache reads through."""
+    if not app.config['INVALIDATION_ENABLED']:
+        logger.info("Invalidation bus disabled, in-process caches read through")
+        return
+    # The listener itself starts with the first cache read, so processes that never
+    # touch a cache (CLI commands, one-off scripts) never open the connection.
+    _settings.app = app
+    _settings.channel = app.config['INVALIDATION_CHANNEL']
+
+
+def listener_connected():
+    return _settings.connected
@@ -5,19 +5,57 @@ import logging
 import requests
 from urllib.parse import quote_plus
 from flask import current_app, url_for
-from .database import get_db_connection, get_recent_papers
-from .translation_service import translate_text
+from .database import get_db_connection
+from .topic_index import week_top_papers
+from .content_generator import localized
+from .catalog import select_papers
+from .metrics import record_delivery
+from .rate_limit import RateLimited, parse_retry_after, rate_limited_call
+from .tracing import traced
+from .invalidation import publish, USER
+from .transports import Transport, get_transport
+from .dry_run import stage, count
 
 logger = logging.getLogger('INSTWAVE')
 
 
+class KakaoMemoTransport(Transport):
+    live = True
+
+    def send(self, provider, message):
+        def send():
+            response = requests.post(
+                f"{KakaoService.API_HOST}/v2/api/talk/memo/default/send",
+                headers={
+                    "Authorization": f"Bearer {message['access_token']}",
+                    "Content-Type": "application/x-www-form-urlencoded;charset=utf-8"
+                },
+                data={
+                    "template_object": json.dumps(message['template_object'], ensure_ascii=False)
+                },
+                timeout=10
+            )
+            if response.status_code == 429:
+                raise RateLimited('kakao', parse_retry_after(response.headers.get('Retry-After')), response.text)
+            return response
+
+        response = rate_limited_call('kakao', send)
+        if response.status_code == 200 and response.json().get("result_code") == 0:
+            return True
+        logger.error(f"Kakao API error: {response.text}")
+        return False
+
+
 class KakaoService:
     CLIENT_ID = os.getenv("KAKAO_CLIENT_ID")
+    AUTH_HOST = os.getenv("KAKAO_AUTH_HOST", "https://kauth.kakao.com")
+    API_HOST = os.getenv("KAKAO_API_HOST", "https://kapi.kakao.com")
+    transport = KakaoMemoTransport()
 
     @classmethod
     def generate_auth_url(cls, user_id):
-        base_url = "https://kauth.kakao.com/oauth/authorize"
-        redirect_uri = url_for('kakao_callback', _external=True).replace("127.0.0.1", "localhost")
+        base_url = f"{cls.AUTH_HOST}/oauth/authorize"
+        redirect_uri = url_for('web.kakao_callback', _external=True).replace("127.0.0.1", "localhost")
         if "localhost" in redirect_uri:
             redirect_uri = redirect_uri.replace("https://", "http://")
         params = {
@@ -35,7 +73,7 @@ class KakaoService:
             if "|" not in state:
                 raise ValueError("Invalid state parameter")
             user_id, _ = state.split("|", 1)
-            redirect_uri = url_for('kakao_callback', _external=True).replace("127.0.0.1", "localhost")
+            redirect_uri = url_for('web.kakao_callback', _external=True).replace("127.0.0.1", "localhost")
             if "localhost" in redirect_uri:
                 redirect_uri = redirect_uri.replace("https://", "http://")
             token_data = {
@@ -44,7 +82,7 @@ class KakaoService:
                 "redirect_uri": redirect_uri,
                 "code": code
             }
-            response = requests.post("https://kauth.kakao.com/oauth/token", data=token_data, timeout=10)
+            response = requests.post(f"{cls.AUTH_HOST}/oauth/token", data=token_data, timeout=10)
             response.raise_for_status()
             token_info = response.json()
             required_keys = {"access_token", "token_type", "expires_in"}
@@ -67,6 +105,8 @@ class KakaoService:
                     VALUES (%s, %s, %s, %s)
                 """, (user_id, token_info["access_token"], token_info.get("refresh_token", ""),
                       time.time() + token_info["expires_in"]))
+            cur.execute("UPDATE users SET preferences_updated_at = NOW() WHERE id = %s", (user_id,))
+            publish(cur, USER, int(user_id))
             conn.commit()
             logger.info(f"User {user_id} Kakao authorization successful")
             return True
@@ -75,99 +115,110 @@ class KakaoService:
             return False
 
     @classmethod
-    def send_research_digest(cls, user, content):
+    @traced('kakao.send_research_digest')
+    def send_research_digest(cls, user, papers=None, template=None):
+        """Send a digest; template is a pre-rendered template object, else one is composed from papers."""
+        conn = None
         try:
+            transport = get_transport(cls.transport)
             conn = get_db_connection()
             cur = conn.cursor()
-            cur.execute("""
-                    SELECT access_token, refresh_token, expires_at 
-                    FROM kakao_tokens 
-                    WHERE user_id = %s
-                """, (user['id'],))
-            token_data = cur.fetchone()
+            with stage('kakao.token'):
+                cur.execute("""
+                        SELECT access_token, refresh_token, expires_at 
+                        FROM kakao_tokens 
+                        WHERE user_id = %s
+                    """, (user['id'],))
+                token_data = cur.fetchone()
             if not token_data:
                 logger.warning(f"No Kakao token for user {user['id']}")
                 return False
             access_token, refresh_token, expires_at = token_data
             if time.time() > expires_at - 300:
-                if not cls._refresh_token(user['id'], refresh_token):
+                if not transport.live:
+                    # A rehearsal must not rotate real tokens; the sink accepts the stale one.
+                    count('kakao.token_refresh_skipped')
+                elif not cls._refresh_token(user['id'], refresh_token):
                     return False
-                cur.execute("""
-                        SELECT access_token 
-                        FROM kakao_tokens 
-                        WHERE user_id = %s
-                    """, (user['id'],))
-                access_token = cur.fetchone()[0]
-
-            papers = get_recent_papers()
-            user_topic_ids = set(user['topics'])
-            user_papers = [p for p in papers if set(p['topics']) & user_topic_ids]
-
-            if not user_papers:
-                if user['language'] == 'ko':
-                    message = "📚 이번 주에는 새로운 연구 논문이 없습니다."
                 else:
-                    message = "📚 There are no new research papers this week."
-            else:
-                sorted_papers = sorted(
-                    user_papers,
-                    key=lambda x: x['ai_summary'].get('importance', 0),
-                    reverse=True
-                )[:2]
-
-                if user['language'] == 'ko':
-                    message = "📚 이번 주 주요 연구 업데이트:\n\n"
-                    for i, paper in enumerate(sorted_papers, 1):
-                        title = translate_text(paper['title'], 'English', 'Korean')
-                        summary = paper['ai_summary'].get('summary', '')
-                        if summary:
-                            summary = translate_text(summary, 'English', 'Korean')
-                            summary = summary[:100] + '...' if len(summary) > 100 else summary
-                        message += f"{i}. {title}\n- 요약: {summary}\n\n"
-                else:
-                    message = "📚 This week's top research updates:\n\n"
-                    for i, paper in enumerate(sorted_papers, 1):
-                        title = paper['title']
-                        summary = paper['ai_summary'].get('summary', '')
-                        if summary:
-                            summary = summary[:100] + '...' if len(summary) > 100 else summary
-                        message += f"{i}. {title}\n- Summary: {summary}\n\n"
-
-            dashboard_link = url_for('dashboard', _external=True)
-            if user['language'] == 'ko':
-                message += f"\n더 많은 연구 보기: {dashboard_link}"
-            else:
-                message += f"\nView more research: {dashboard_link}"
+                    cur.execute("""
+                            SELECT access_token 
+                            FROM kakao_tokens 
+                            WHERE user_id = %s
+                        """, (user['id'],))
+                    access_token = cur.fetchone()[0]
+            cur.close()
 
-            response = requests.post(
-                "https://kapi.kakao.com/v2/api/talk/memo/default/send",
-                headers={
-                    "Authorization": f"Bearer {access_token}",
-                    "Content-Type": "application/x-www-form-urlencoded;charset=utf-8"
-                },
-                data={
-                    "template_object": json.dumps({
-                        "object_type": "text",
-                        "text": message,
-                        "link": {
-                            "web_url": dashboard_link,
-                            "mobile_web_url": dashboard_link
-                        }
-                    }, ensure_ascii=False)
-                },
-                timeout=10
-            )
+            message = template or cls.render_digest(user, papers)
 
-            if response.status_code == 200 and response.json().get("result_code") == 0:
-                logger.info(f"Kakao message sent to user {user['id']}")
-                return True
-            else:
-                logger.error(f"Kakao API error: {response.text}")
-                return False
+            started_at = time.perf_counter()
+            try:
+                with stage('kakao.send'):
+                    success = transport.send('kakao', {'access_token': access_token, 'template_object': message})
+            except Exception:
+                if transport.live:
+                    record_delivery('kakao', False, started_at)
+                raise
+
+            if transport.live:
+                record_delivery('kakao', success, started_at)
+                if success:
+                    logger.info(f"Kakao message sent to user {user['id']}")
+            return success
 
         except Exception as e:
             logger.error(f"Failed to send Kakao message: {str(e)}")
             return False
+        finally:
+            if conn is not None:
+                conn.close()
+
+    @classmethod
+    def render_digest(cls, user, papers=None):
+        """The memo template object of a user's digest; papers defaults to this week's index."""
+        if papers is None:
+            papers = week_top_papers(user['topics'], limit=2)
+        with stage('kakao.render'):
+            return cls._compose(user, select_papers(papers, user['topics'], 2))
+
+    @staticmethod
+    def _compose(user, sorted_papers):
+        if not sorted_papers:
+            if user['language'] == 'ko':
+                message = "📚 이번 주에는 새로운 연구 논문이 없습니다."
+            else:
+                message = "📚 There are no new research papers this week."
+        else:
+            if user['language'] == 'ko':
+                message = "📚 이번 주 주요 연구 업데이트:\n\n"
+                for i, paper in enumerate(sorted_papers, 1):
+                    title = localized(paper, 'title', 'ko')
+                    summary = localized(paper, 'summary', 'ko')
+                    if summary:
+                        summary = summary[:100] + '...' if len(summary) > 100 else summary
+                    message += f"{i}. {title}\n- 요약: {summary}\n\n"
+            else:
+                message = "📚 This week's top research updates:\n\n"
+                for i, paper in enumerate(sorted_papers, 1):
+                    title = paper['title']
+                    summary = paper['ai_summary'].get('summary', '')
+                    if summary:
+                        summary = summary[:100] + '...' if len(summary) > 100 else summary
+                    message += f"{i}. {title}\n- Summary: {summary}\n\n"
+
+        dashboard_link = url_for('web.dashboard', _external=True)
+        if user['language'] == 'ko':
+            message += f"\n더 많은 연구 보기: {dashboard_link}"
+        else:
+            message += f"\nView more research: {dashboard_link}"
+        return {
+            "object_type": "text",
+            "text": message,
+            "link": {
+                "web_url": dashboard_link,
+                "mobile_web_url": dashboard_link
+            }
+        }
 
     @classmethod
     def _refresh_token(cls, user_id, refresh_token):
@@ -176,7 +227,7 @@ class KakaoService:
                 logger.error(f"No refresh token for user {user_id}")
                 return False
             response = requests.post(
-                "https://kauth.kakao.com/oauth/token",
+                f"{cls.AUTH_HOST}/oauth/token",
                 data={
                     "grant_type": "refresh_token",
                     "client_id": cls.CLIENT_ID,
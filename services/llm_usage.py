@@ -0,0 +1,79 @@
+import re
+import logging
+from decimal import Decimal
+from flask import current_app
+from .database import get_db_connection
+from .metrics import track_db
+
+logger = logging.getLogger('INSTWAVE')
+
+# Rough tokens-per-character ratio for English prose with OpenAI tokenizers.
+CHARS_PER_TOKEN = 4
+SENTENCE_SPLIT = re.compile(r'(?<=[.!?])\s+')
+
+
+def estimate_tokens(text):
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN if text else 0
+
+
+def trim_to_token_budget(text, max_tokens):
+    """Shorten text to roughly max_tokens.
+
+    Abstracts state the problem up front and the result at the end, so the first
+    and last sentences are kept and whole sentences are dropped from the centre
+    outwards; a single oversized sentence is cut at a word boundary.
+    """
+    text = ' '.join(text.split())
+    if not max_tokens or estimate_tokens(text) <= max_tokens:
+        return text
+    sentences = SENTENCE_SPLIT.split(text)
+    if len(sentences) > 2:
+        head = sentences[:1]
+        tail = sentences[-1:]
+        middle = sentences[1:-1]
+        while middle and estimate_tokens(' '.join(head + middle + tail)) > max_tokens:
+            middle.pop(len(middle) // 2)
+        text = ' '.join(head + middle + tail)
+        if estimate_tokens(text) <= max_tokens:
+            return text
+    limit = max_tokens * CHARS_PER_TOKEN
+    return text[:limit].rsplit(' ', 1)[0]
+
+
+def usage_cost(model, prompt_tokens, completion_tokens):
+    prompt_price, completion_price = current_app.config['OPENAI_PRICING'].get(model, (0, 0))
+    return (Decimal(str(prompt_price)) * prompt_tokens + Decimal(str(completion_price)) * completion_tokens) / 1000
+
+
+def record_llm_usage(operation, model, usage, thesis_id=None):
+    """Append a row to the llm_usage ledger.
+
+    The row is committed on its own connection, so a call that was paid for stays
+    in the ledger even if the caller's transaction rolls back. Ledger failures are
+    logged, never raised.
+    """
+    if usage is None:
+        return
+    prompt_tokens = usage.prompt_tokens or 0
+    completion_tokens = usage.completion_tokens or 0
+    params = (operation, model, thesis_id, prompt_tokens, completion_tokens,
+              usage_cost(model, prompt_tokens, completion_tokens))
+    query = """
+        INSERT INTO llm_usage (operation, model, thesis_id, prompt_tokens, completion_tokens, cost_usd)
+        VALUES (%s, %s, %s, %s, %s, %s)
+    """
+    conn = None
+    own_cur = None
+    try:
+        conn = get_db_connection()
+        own_cur = conn.cursor()
+        with track_db('record_llm_usage'):
+            own_cur.execute(query, params)
+            conn.commit()
+    except Exception as e:
+        logger.error(f"Failed to record LLM usage: {str(e)}")
+    finally:
+        if own_cur:
+            own_cur.close()
+        if conn:
+            conn.close()
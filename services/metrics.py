@@ -0,0 +1,164 @@
+import os
+import time
+import logging
+from contextlib import contextmanager
+from prometheus_client import (
+    CollectorRegistry, Counter, Histogram, REGISTRY, CONTENT_TYPE_LATEST, generate_latest, multiprocess
+)
+from .tracing import span
+from .profiler import profile_job
+
+logger = logging.getLogger('INSTWAVE')
+
+# When PROMETHEUS_MULTIPROC_DIR is set (e.g. under gunicorn) every worker writes its
+# samples to mmap'd files in that directory and /metrics aggregates them on scrape.
+
+FAST_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+SLOW_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0, 3600.0)
+
+DB_QUERY_SECONDS = Histogram(
+    'instwave_db_query_seconds',
+    'Time spent in database calls, by call site',
+    ['call_site'],
+    buckets=FAST_BUCKETS
+)
+DB_QUERY_ERRORS = Counter(
+    'instwave_db_query_errors_total',
+    'Database calls that raised, by call site',
+    ['call_site']
+)
+OPENAI_REQUEST_SECONDS = Histogram(
+    'instwave_openai_request_seconds',
+    'OpenAI chat completion latency',
+    ['operation', 'model', 'outcome'],
+    buckets=SLOW_BUCKETS
+)
+OPENAI_TOKENS = Counter(
+    'instwave_openai_tokens_total',
+    'OpenAI tokens consumed',
+    ['operation', 'model', 'kind']
+)
+DELIVERY_SECONDS = Histogram(
+    'instwave_delivery_seconds',
+    'Outbound notification latency by provider',
+    ['provider', 'outcome'],
+    buckets=FAST_BUCKETS + (10.0, 30.0)
+)
+DELIVERY_TOTAL = Counter(
+    'instwave_delivery_total',
+    'Outbound notifications by provider and outcome',
+    ['provider', 'outcome']
+)
+SUMMARY_CACHE = Counter(
+    'instwave_summary_cache_total',
+    'AI summary cache lookups by result',
+    ['result']
+)
+LOCAL_CACHE = Counter(
+    'instwave_local_cache_total',
+    'In-process cache lookups and evictions, by cache and result',
+    ['cache', 'result']
+)
+SUMMARY_PARSE_FAILURES = Counter(
+    'instwave_summary_parse_failures_total',
+    'Summarization calls whose output could not be used'
+)
+RATE_LIMIT_WAIT_SECONDS = Histogram(
+    'instwave_rate_limit_wait_seconds',
+    'Time spent waiting for a provider rate limiter token',
+    ['provider'],
+    buckets=FAST_BUCKETS + (10.0, 30.0, 60.0)
+)
+RATE_LIMIT_THROTTLED = Counter(
+    'instwave_rate_limit_throttled_total',
+    'Provider responses that signalled a rate limit (HTTP 429)',
+    ['provider']
+)
+JOB_SECONDS = Histogram(
+    'instwave_job_duration_seconds',
+    'Scheduler job run time',
+    ['job', 'outcome'],
+    buckets=SLOW_BUCKETS
+)
+DIGEST_PRERENDER = Counter(
+    'instwave_digest_prerender_total',
+    'Digests rendered ahead of the send window, by outcome',
+    ['outcome']
+)
+DIGEST_PAYLOADS = Counter(
+    'instwave_digest_payloads_total',
+    'Digests handed to the providers, by whether they were pre-rendered or rendered while sending',
+    ['source']
+)
+PASSWORD_HASH_SECONDS = Histogram(
+    'instwave_password_hash_seconds',
+    'Password hash or verify time as seen by the request, including waiting for the pool',
+    ['operation'],
+    buckets=FAST_BUCKETS
+)
+
+
+@contextmanager
+def track_db(call_site):
+    start = time.perf_counter()
+    try:
+        with span(f"db {call_site}"):
+            yield
+    except Exception:
+        DB_QUERY_ERRORS.labels(call_site).inc()
+        raise
+    finally:
+        DB_QUERY_SECONDS.labels(call_site).observe(time.perf_counter() - start)
+
+
+@contextmanager
+def track_openai(operation, model):
+    """Times one chat completion; the caller passes the response to record_usage."""
+    start = time.perf_counter()
+    outcome = 'ok'
+    try:
+        with span(f"openai {operation}", model=model):
+            yield
+    except Exception:
+        outcome = 'error'
+        raise
+    finally:
+        OPENAI_REQUEST_SECONDS.labels(operation, model, outcome).observe(time.perf_counter() - start)
+
+
+def record_openai_usage(operation, model, response):
+    usage = getattr(response, 'usage', None)
+    if usage is None:
+        return
+    OPENAI_TOKENS.labels(operation, model, 'prompt').inc(usage.prompt_tokens or 0)
+    OPENAI_TOKENS.labels(operation, model, 'completion').inc(usage.completion_tokens or 0)
+
+
+def record_delivery(provider, success, started_at):
+    outcome = 'success' if success else 'failure'
+    DELIVERY_SECONDS.labels(provider, outcome).observe(time.perf_counter() - started_at)
+    DELIVERY_TOTAL.labels(provider, outcome).inc()
+
+
+@contextmanager
+def track_job(job_id):
+    start = time.perf_counter()
+    outcome = 'success'
+    try:
+        # Jobs are rare enough to trace every run; their per-user work samples itself.
+        with span(f"job {job_id}", sample_rate=1.0), profile_job(job_id):
+            yield
+    except Exception:
+        outcome = 'failure'
+        raise
+    finally:
+        JOB_SECONDS.labels(job_id, outcome).observe(time.perf_counter() - start)
+
+
+def render_metrics():
+    if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
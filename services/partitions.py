@@ -0,0 +1,139 @@
+import re
+import logging
+from datetime import date
+from flask import current_app
+from .database import get_db_connection
+from .metrics import track_db
+
+logger = logging.getLogger('INSTWAVE')
+
+PARTITION_NAME = re.compile(r'^thesis_y(\d{4})m(\d{2})$')
+
+
+def month_start(day, offset=0):
+    index = day.year * 12 + (day.month - 1) + offset
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month):
+    return f"thesis_y{month.year:04d}m{month.month:02d}"
+
+
+def _existing_partitions(cur, schema='public'):
+    cur.execute("""
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE i.inhparent = 'public.thesis'::regclass AND n.nspname = %s
+    """, (schema,))
+    return {row[0] for row in cur.fetchall()}
+
+
+def _plain_columns(cur):
+    cur.execute("""
+        SELECT column_name FROM information_schema.columns
+        WHERE table_schema = 'public' AND table_name = 'thesis' AND is_generated = 'NEVER'
+        ORDER BY ordinal_position
+    """)
+    return ', '.join(row[0] for row in cur.fetchall())
+
+
+def _create_partition(cur, month):
+    name = partition_name(month)
+    lower, upper = month, month_start(month, 1)
+    columns = _plain_columns(cur)
+    # Build the partition off to the side, move any rows the default partition caught
+    # for this month, then attach it; attaching fails if such rows were left behind.
+    cur.execute(f"CREATE TABLE {name} (LIKE thesis INCLUDING DEFAULTS INCLUDING CONSTRAINTS INCLUDING GENERATED)")
+    cur.execute(f"""
+        WITH moved AS (
+            DELETE FROM thesis_default
+            WHERE created_at >= %s AND created_at < %s
+            RETURNING {columns}
+        )
+        INSERT INTO {name} ({columns}) SELECT {columns} FROM moved
+    """, (lower, upper))
+    cur.execute(f"""
+        ALTER TABLE {name} ADD CONSTRAINT {name}_created_at_check
+        CHECK (created_at >= '{lower.isoformat()}' AND created_at < '{upper.isoformat()}')
+    """)
+    cur.execute(f"ALTER TABLE thesis ATTACH PARTITION {name} FOR VALUES FROM ('{lower.isoformat()}') TO ('{upper.isoformat()}')")
+    # The CHECK only exists to let ATTACH skip its validation scan.
+    cur.execute(f"ALTER TABLE {name} DROP CONSTRAINT {name}_created_at_check")
+    logger.info(f"Created thesis partition {name} [{lower}, {upper})")
+
+
+def ensure_thesis_partitions(conn=None, months_ahead=None, start=None):
+    """Create monthly thesis partitions from start (default: this month) through months_ahead.
+
+    When conn is given the caller owns the transaction and must commit.
+    """
+    own_conn = conn is None
+    if own_conn:
+        conn = get_db_connection()
+        months_ahead = current_app.config['THESIS_PARTITION_MONTHS_AHEAD'] if months_ahead is None else months_ahead
+    cur = conn.cursor()
+    created = []
+    try:
+        with track_db('ensure_thesis_partitions'):
+            existing = _existing_partitions(cur)
+            first = month_start(start or date.today())
+            last = month_start(date.today(), months_ahead or 0)
+            month = first
+            while month <= last:
+                if partition_name(month) not in existing:
+                    _create_partition(cur, month)
+                    created.append(partition_name(month))
+                month = month_start(month, 1)
+            if own_conn:
+                conn.commit()
+        return created
+    except Exception:
+        if own_conn:
+            conn.rollback()
+        raise
+    finally:
+        cur.close()
+        if own_conn:
+            conn.close()
+
+
+def retire_thesis_partitions(retention_months=None, mode=None):
+    """Detach monthly partitions older than the retention horizon.
+
+    mode 'detach' leaves the detached tables in place; 'archive' also moves them
+    into the thesis_archive schema. Returns the retired partition names.
+    """
+    retention_months = current_app.config['THESIS_RETENTION_MONTHS'] if retention_months is None else retention_months
+    mode = mode or current_app.config['THESIS_RETIRE_MODE']
+    if not retention_months:
+        return []
+    cutoff = month_start(date.today(), -retention_months)
+    conn = get_db_connection()
+    cur = conn.cursor()
+    retired = []
+    try:
+        with track_db('retire_thesis_partitions'):
+            if mode == 'archive':
+                cur.execute("CREATE SCHEMA IF NOT EXISTS thesis_archive")
+            for name in sorted(_existing_partitions(cur)):
+                match = PARTITION_NAME.match(name)
+                if not match:
+                    continue
+                month = date(int(match.group(1)), int(match.group(2)), 1)
+                if month_start(month, 1) > cutoff:
+                    continue
+                cur.execute(f"ALTER TABLE thesis DETACH PARTITION {name}")
+                if mode == 'archive':
+                    cur.execute(f"ALTER TABLE {name} SET SCHEMA thesis_archive")
+                retired.append(name)
+                logger.info(f"Retired thesis partition {name} ({mode})")
+            conn.commit()
+        return retired
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+        conn.close()
@@ -0,0 +1,125 @@
+import os
+import time
+import logging
+import threading
+import multiprocessing
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+from flask import current_app
+from werkzeug.security import check_password_hash, generate_password_hash
+from .metrics import PASSWORD_HASH_SECONDS
+
+logger = logging.getLogger('INSTWAVE')
+
+# Hashing and checking a password costs a deliberate slice of CPU with the GIL held, so a
+# burst of logins would stall every other request of a threaded worker. Web requests hand
+# that work to a small process pool and wait for it without the GIL. The pool starts on
+# first use in each process (so after a gunicorn fork), and at most
+# PASSWORD_HASH_MAX_PENDING requests queue on it; past that, callers get
+# PasswordHasherBusy instead of an ever longer wait. PASSWORD_HASH_METHOD is a Werkzeug
+# method string including its work factor, and a stored hash made with other parameters
+# is replaced on the user's next successful login.
+
+
+class PasswordHasherBusy(Exception):
+    pass
+
+
+class _Pool:
+    executor = None
+    slots = None
+    pid = None
+    lock = threading.Lock()
+
+
+_pool = _Pool()
+
+
+@lru_cache(maxsize=None)
+def _method_prefix(method):
+    # Werkzeug expands defaults ('scrypt' -> 'scrypt:32768:8:1'); compare the expanded form.
+    return generate_password_hash('', method).split('$', 1)[0]
+
+
+def _hash(password, method):
+    return generate_password_hash(password, method)
+
+
+def _verify(password_hash, password, method):
+    if not check_password_hash(password_hash, password):
+        return False, None
+    if password_hash.split('$', 1)[0] == _method_prefix(method):
+        return True, None
+    return True, generate_password_hash(password, method)
+
+
+def _get_pool(config):
+    with _pool.lock:
+        if _pool.executor is None or _pool.pid != os.getpid():
+            # spawn, not fork: the web process has threads and open connections.
+            _pool.executor = ProcessPoolExecutor(max_workers=config['PASSWORD_HASH_WORKERS'],
+                                                 mp_context=multiprocessing.get_context('spawn'))
+            _pool.slots = threading.BoundedSemaphore(config['PASSWORD_HASH_MAX_PENDING'])
+            _pool.pid = os.getpid()
+        return _pool.executor, _pool.slots
+
+
+def _discard_pool(executor):
+    with _pool.lock:
+        if _pool.executor is executor:
+            _pool.executor = None
+    executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _run(operation, func, *args):
+    config = current_app.config
+    args += (config['PASSWORD_HASH_METHOD'],)
+    started_at = time.perf_counter()
+    try:
+        if not config['PASSWORD_HASH_WORKERS']:
+            return func(*args)
+        timeout = config['PASSWORD_HASH_TIMEOUT_SECONDS']
+        # One budget covers waiting for a slot, the hash and any retry.
+        deadline = started_at + timeout
+        executor, slots = _get_pool(config)
+        if not slots.acquire(timeout=timeout):
+            raise PasswordHasherBusy(f"{config['PASSWORD_HASH_MAX_PENDING']} password hashes already pending")
+        try:
+            try:
+                return executor.submit(func, *args).result(timeout=max(0, deadline - time.perf_counter()))
+            except BrokenProcessPool:
+                # A worker died (OOM kill, for one); start a fresh pool and try once more.
+                logger.warning("Password hashing pool broke, restarting it")
+                _discard_pool(executor)
+                executor, _ = _get_pool(config)
+                try:
+                    return executor.submit(func, *args).result(timeout=max(0, deadline - time.perf_counter()))
+                except BrokenProcessPool:
+                    logger.error("Password hashing pool broke again, giving up on this request")
+                    _discard_pool(executor)
+                    raise PasswordHasherBusy(f"password {operation} failed: the hashing pool keeps breaking")
+        except FutureTimeout:
+            raise PasswordHasherBusy(f"password {operation} took longer than {timeout}s")
+        finally:
+            slots.release()
+    finally:
+        PASSWORD_HASH_SECONDS.labels(operation).observe(time.perf_counter() - started_at)
+
+
+def hash_password(password):
+    return _run('hash', _hash, password)
+
+
+def verify_password(password_hash, password):
+    """(matches, replacement) where replacement is a new hash when password_hash was made
+    with other parameters than PASSWORD_HASH_METHOD, else None."""
+    return _run('verify', _verify, password_hash, password)
+
+
+def shutdown_pool():
+    """Stop this process's hashing workers; the next hash starts a new pool."""
+    with _pool.lock:
+        executor, _pool.executor = _pool.executor, None
+    if executor is not None:
+        executor.shutdown(wait=True, cancel_futures=True)
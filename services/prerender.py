@@ -0,0 +1,119 @@
+import json
+import logging
+from flask import current_app
+from .database import get_db_connection, get_subscribed_users
+from .topic_index import current_index
+from .content_generator import generate_email_content
+from .email import EmailService
+from .kakao import KakaoService
+from .metrics import track_db, DIGEST_PRERENDER
+
+logger = logging.getLogger('INSTWAVE')
+
+# Building a digest (picking papers, localizing, rendering the HTML and the Kakao memo)
+# used to happen inside the delivery slots, between provider calls. Once the summary job
+# ends, prerender_digests() renders every active user's digest for the week into
+# digest_renders, so a slot only reads payloads and sends them, and a digest that fails
+# to render is logged before the first slot opens. A row is used only while the user's
+# preferences_updated_at still matches the one it was rendered from; anyone without a
+# usable row (registered or edited since, or failed) is rendered while sending, as
+# before. Papers summarized after the pre-render reach this week's digests only if it
+# is run again (flask prerender-digests).
+
+EMAIL_METHODS = ('email', 'both')
+KAKAO_METHODS = ('kakao', 'both')
+
+
+def render_digest(index, user):
+    """A user's payloads for their channels; raises when any of them fails to render."""
+    payload = {'email_subject': None, 'email_html': None, 'kakao_template': None}
+    if user['notification_method'] in EMAIL_METHODS:
+        content = generate_email_content(index, user, strict=True)
+        payload['email_subject'], payload['email_html'] = EmailService.render_digest(user, content)
+    if user['notification_method'] in KAKAO_METHODS:
+        payload['kakao_template'] = KakaoService.render_digest(user, index)
+    return payload
+
+
+def prerender_digests():
+    """Render this digest week's payload of every active user; returns (rendered, failed)."""
+    batch_size = current_app.config['DIGEST_PRERENDER_BATCH_SIZE']
+    index = current_index()
+    users = [user for user in get_subscribed_users() if user['active']]
+    rendered = failed = 0
+    conn = get_db_connection()
+    cur = conn.cursor()
+    try:
+        with track_db('prerender.prune'):
+            cur.execute("DELETE FROM digest_renders WHERE week < %s", (index.week,))
+            conn.commit()
+        for start in range(0, len(users), batch_size):
+            batch = users[start:start + batch_size]
+            index.hydrate([user['topics'] for user in batch], limit=3)
+            rows = []
+            for user in batch:
+                try:
+                    payload, error = render_digest(index, user), None
+                    rendered += 1
+                except Exception as e:
+                    logger.error(f"Digest pre-render failed for user {user['id']}: {str(e)}")
+                    payload, error = {'email_subject': None, 'email_html': None, 'kakao_template': None}, str(e)
+                    failed += 1
+                rows.append((user['id'], user['preferences_updated_at'], payload['email_subject'],
+                             payload['email_html'],
+                             json.dumps(payload['kakao_template'], ensure_ascii=False)
+                             if payload['kakao_template'] is not None else None,
+                             error))
+            with track_db('prerender.write'):
+                cur.execute("""
+                    INSERT INTO digest_renders (week, user_id, preferences_updated_at, email_subject, email_html,
+                                                kakao_template, error, rendered_at)
+                    SELECT %s, r.*, NOW()
+                    FROM unnest(%s::int[], %s::timestamptz[], %s::text[], %s::text[], %s::jsonb[], %s::text[])
+                         AS r(user_id, preferences_updated_at, email_subject, email_html, kakao_template, error)
+                    ON CONFLICT (week, user_id) DO UPDATE
+                    SET preferences_updated_at = EXCLUDED.preferences_updated_at,
+                        email_subject = EXCLUDED.email_subject, email_html = EXCLUDED.email_html,
+                        kakao_template = EXCLUDED.kakao_template, error = EXCLUDED.error,
+                        rendered_at = EXCLUDED.rendered_at
+                """, (index.week, *(list(column) for column in zip(*rows))))
+                conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+        conn.close()
+        DIGEST_PRERENDER.labels('rendered').inc(rendered)
+        DIGEST_PRERENDER.labels('failed').inc(failed)
+    return rendered, failed
+
+
+def load_rendered(week, users):
+    """{user_id: payload} of the users whose pre-rendered digest is current and covers their channels."""
+    if not users:
+        return {}
+    conn = get_db_connection()
+    cur = conn.cursor()
+    try:
+        with track_db('prerender.load'):
+            cur.execute("""
+                SELECT r.user_id, r.email_subject, r.email_html, r.kakao_template
+                FROM digest_renders r
+                JOIN users u ON u.id = r.user_id
+                WHERE r.week = %s AND r.user_id = ANY(%s) AND r.error IS NULL
+                AND r.preferences_updated_at IS NOT DISTINCT FROM u.preferences_updated_at
+            """, (week, [user['id'] for user in users]))
+            rows = cur.fetchall()
+    finally:
+        cur.close()
+        conn.close()
+    methods = {user['id']: user['notification_method'] for user in users}
+    payloads = {}
+    for user_id, email_subject, email_html, kakao_template in rows:
+        method = methods[user_id]
+        if (method in EMAIL_METHODS and email_html is None) or (method in KAKAO_METHODS and kakao_template is None):
+            continue
+        payloads[user_id] = {'email_subject': email_subject, 'email_html': email_html,
+                             'kakao_template': kakao_template}
+    return payloads
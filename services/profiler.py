@@ -0,0 +1,197 @@
+import os
+import re
+import sys
+import logging
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+from flask import g, request
+
+logger = logging.getLogger('INSTWAVE')
+
+# A sampler thread snapshots the profiled thread's stack every interval and counts
+# identical stacks, so the profiled code itself runs untouched. Output is the
+# "collapsed stack" format read by flamegraph.pl, speedscope and inferno:
+#     outer (app.py:10);inner (services/x.py:42) 17
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SAFE_LABEL = re.compile(r'[^A-Za-z0-9_.-]+')
+
+
+class SamplingProfiler:
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='profiler', daemon=True)
+
+    @staticmethod
+    def _frame_label(code):
+        path = code.co_filename
+        if path.startswith(ROOT):
+            path = os.path.relpath(path, ROOT)
+        return f"{code.co_name} ({path}:{code.co_firstlineno})".replace(';', ':')
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(self._frame_label(frame.f_code))
+                frame = frame.f_back
+            self.stacks[';'.join(reversed(stack))] += 1
+            self.samples += 1
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def write(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+class _Settings:
+    directory = 'profiles'
+    interval = 0.005
+    jobs = set()
+    request_filter = None
+    armed_jobs = {}
+    armed_request_filter = None
+    armed_requests = 0
+    lock = threading.Lock()
+
+
+_settings = _Settings()
+
+
+def configure_profiler(directory, interval_ms, jobs, request_filter):
+    _settings.directory = directory
+    _settings.interval = interval_ms / 1000.0
+    _settings.jobs = set(jobs)
+    _settings.request_filter = re.compile(request_filter) if request_filter else None
+
+
+def arm(job=None, request_filter=None, runs=1):
+    """Profile the next `runs` runs of a job and/or requests whose path matches request_filter.
+
+    Arming is per process; under several workers each one needs its own call.
+    """
+    pattern = re.compile(request_filter) if request_filter else None
+    with _settings.lock:
+        if job:
+            _settings.armed_jobs[job] = _settings.armed_jobs.get(job, 0) + runs
+        if pattern:
+            _settings.armed_request_filter = pattern
+            _settings.armed_requests = runs
+
+
+def disarm():
+    with _settings.lock:
+        _settings.armed_jobs.clear()
+        _settings.armed_request_filter = None
+        _settings.armed_requests = 0
+
+
+def status():
+    with _settings.lock:
+        return {
+            'directory': _settings.directory,
+            'interval_ms': _settings.interval * 1000,
+            'jobs': sorted(_settings.jobs),
+            'request_filter': _settings.request_filter.pattern if _settings.request_filter else None,
+            'armed_jobs': dict(_settings.armed_jobs),
+            'armed_request_filter': (_settings.armed_request_filter.pattern
+                                     if _settings.armed_request_filter else None),
+            'armed_requests': _settings.armed_requests,
+            'profiles': list_profiles()
+        }
+
+
+def list_profiles():
+    if not os.path.isdir(_settings.directory):
+        return []
+    return sorted((name for name in os.listdir(_settings.directory) if name.endswith('.collapsed')), reverse=True)
+
+
+def _take_job(job_id):
+    with _settings.lock:
+        if '*' in _settings.jobs or job_id in _settings.jobs:
+            return True
+        remaining = _settings.armed_jobs.get(job_id, 0)
+        if remaining:
+            _settings.armed_jobs[job_id] = remaining - 1
+            return True
+    return False
+
+
+def _take_request(path):
+    if _settings.request_filter is not None and _settings.request_filter.search(path):
+        return True
+    with _settings.lock:
+        armed = _settings.armed_request_filter
+        if armed is not None and _settings.armed_requests and armed.search(path):
+            _settings.armed_requests -= 1
+            if not _settings.armed_requests:
+                _settings.armed_request_filter = None
+            return True
+    return False
+
+
+def start_profile():
+    return SamplingProfiler(threading.get_ident(), _settings.interval).start()
+
+
+def finish_profile(profiler, kind, label, started_at):
+    profiler.stop()
+    name = f"{kind}-{SAFE_LABEL.sub('_', label).strip('_')}-{started_at.strftime('%Y%m%dT%H%M%S.%f')}.collapsed"
+    path = os.path.join(_settings.directory, name)
+    try:
+        os.makedirs(_settings.directory, exist_ok=True)
+        profiler.write(path)
+        logger.info(f"Wrote profile {path} ({profiler.samples} samples)")
+    except OSError as e:
+        logger.error(f"Could not write profile {path}: {str(e)}")
+    return path
+
+
+@contextmanager
+def profile_job(job_id):
+    """Profile this run of job_id if it is enabled in config or armed."""
+    if not _take_job(job_id):
+        yield
+        return
+    started_at = datetime.now()
+    profiler = start_profile()
+    try:
+        yield
+    finally:
+        finish_profile(profiler, 'job', job_id, started_at)
+
+
+def init_profiler(app):
+    """Apply config and profile Flask requests matching PROFILE_REQUEST_FILTER or an armed filter."""
+    configure_profiler(app.config['PROFILE_DIR'], app.config['PROFILE_INTERVAL_MS'],
+                       app.config['PROFILE_JOBS'], app.config['PROFILE_REQUEST_FILTER'])
+
+    @app.before_request
+    def _start_request_profile():
+        if _take_request(request.path):
+            g._profile = (start_profile(), datetime.now())
+
+    @app.teardown_request
+    def _finish_request_profile(error=None):
+        profile = g.pop('_profile', None)
+        if profile:
+            profiler, started_at = profile
+            finish_profile(profiler, 'request', f"{request.method}{request.path}", started_at)
@@ -0,0 +1,222 @@
+import time
+import logging
+import threading
+from email.utils import parsedate_to_datetime
+import psycopg2
+from flask import current_app
+from .metrics import RATE_LIMIT_WAIT_SECONDS, RATE_LIMIT_THROTTLED
+from .tracing import span
+
+logger = logging.getLogger('INSTWAVE')
+
+# Additive increase per successful call (as a fraction of the configured rate) and
+# multiplicative decrease on a 429, so each bucket settles just under the provider limit.
+INCREASE_FRACTION = 0.02
+DECREASE_FACTOR = 0.5
+MIN_RATE_FRACTION = 0.05
+
+
+class RateLimited(Exception):
+    """The provider answered 429 (or its equivalent); retry_after is in seconds if known."""
+
+    def __init__(self, provider, retry_after=None, message=None):
+        super().__init__(message or f"{provider} rate limit exceeded")
+        self.provider = provider
+        self.retry_after = retry_after
+
+
+def parse_retry_after(value):
+    if value is None or value == '':
+        return None
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """In-process adaptive token bucket shared by all threads of a worker."""
+
+    def __init__(self, provider, rate, burst):
+        self.provider = provider
+        self.max_rate = float(rate)
+        self.min_rate = self.max_rate * MIN_RATE_FRACTION
+        self.rate = self.max_rate
+        self.burst = float(burst)
+        self.tokens = self.burst
+        self.updated_at = time.monotonic()
+        self.blocked_until = 0.0
+        self.lock = threading.Lock()
+
+    def _try_take(self):
+        """Take a token if possible; otherwise return how long to wait."""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+            self.updated_at = now
+            if now < self.blocked_until:
+                return self.blocked_until - now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0.0
+            return (1 - self.tokens) / self.rate
+
+    def acquire(self, max_wait):
+        start = time.monotonic()
+        while True:
+            wait = self._try_take()
+            if wait == 0.0:
+                RATE_LIMIT_WAIT_SECONDS.labels(self.provider).observe(time.monotonic() - start)
+                return
+            if time.monotonic() - start + wait > max_wait:
+                raise RateLimited(self.provider, wait, f"{self.provider} limiter wait exceeded {max_wait}s")
+            time.sleep(wait)
+
+    def on_success(self):
+        with self.lock:
+            self.rate = min(self.max_rate, self.rate + self.max_rate * INCREASE_FRACTION)
+
+    def on_throttle(self, retry_after=None):
+        with self.lock:
+            self.rate = max(self.min_rate, self.rate * DECREASE_FACTOR)
+            self.tokens = 0.0
+            pause = retry_after if retry_after is not None else 1.0 / self.rate
+            self.blocked_until = max(self.blocked_until, time.monotonic() + pause)
+
+
+class PostgresTokenBucket(TokenBucket):
+    """Token bucket whose state lives in the rate_limits table, shared by every process.
+
+    Each acquire is one short row-locked transaction. Successes are batched into the
+    next acquire so the happy path costs a single round trip.
+    """
+
+    def __init__(self, provider, rate, burst, db_params):
+        super().__init__(provider, rate, burst)
+        self.db_params = db_params
+        self.conn = None
+        self.pending_successes = 0
+
+    def _connection(self):
+        if self.conn is None or self.conn.closed:
+            self.conn = psycopg2.connect(**self.db_params)
+            cur = self.conn.cursor()
+            cur.execute("""
+                INSERT INTO rate_limits (provider, tokens, rate, updated_at, blocked_until)
+                VALUES (%s, %s, %s, EXTRACT(EPOCH FROM NOW()), 0)
+                ON CONFLICT (provider) DO NOTHING
+            """, (self.provider, self.burst, self.max_rate))
+            self.conn.commit()
+            cur.close()
+        return self.conn
+
+    def _try_take(self):
+        with self.lock:
+            try:
+                conn = self._connection()
+                cur = conn.cursor()
+                cur.execute("""
+                    SELECT tokens, rate, updated_at, blocked_until, EXTRACT(EPOCH FROM NOW())
+                    FROM rate_limits WHERE provider = %s FOR UPDATE
+                """, (self.provider,))
+                tokens, rate, updated_at, blocked_until, now = cur.fetchone()
+                rate = min(self.max_rate, rate + self.pending_successes * self.max_rate * INCREASE_FRACTION)
+                self.pending_successes = 0
+                tokens = min(self.burst, tokens + (float(now) - updated_at) * rate)
+                if float(now) < blocked_until:
+                    wait = blocked_until - float(now)
+                elif tokens >= 1:
+                    tokens -= 1
+                    wait = 0.0
+                else:
+                    wait = (1 - tokens) / rate
+                cur.execute("""
+                    UPDATE rate_limits SET tokens = %s, rate = %s, updated_at = %s
+                    WHERE provider = %s
+                """, (tokens, rate, float(now), self.provider))
+                conn.commit()
+                cur.close()
+                self.rate = rate
+                return wait
+            except psycopg2.Error as e:
+                logger.warning(f"Shared rate limiter for {self.provider} unavailable, using local bucket: {e}")
+                if self.conn is not None:
+                    self.conn.close()
+                    self.conn = None
+        return super()._try_take()
+
+    def on_success(self):
+        with self.lock:
+            self.pending_successes += 1
+
+    def on_throttle(self, retry_after=None):
+        super().on_throttle(retry_after)
+        with self.lock:
+            try:
+                conn = self._connection()
+                cur = conn.cursor()
+                cur.execute("""
+                    UPDATE rate_limits
+                    SET rate = GREATEST(%s, rate * %s),
+                        tokens = 0,
+                        blocked_until = GREATEST(blocked_until, EXTRACT(EPOCH FROM NOW()) + %s)
+                    WHERE provider = %s
+                """, (self.min_rate, DECREASE_FACTOR,
+                      retry_after if retry_after is not None else 1.0 / self.rate, self.provider))
+                conn.commit()
+                cur.close()
+            except psycopg2.Error as e:
+                logger.warning(f"Could not record throttle for {self.provider}: {e}")
+                if self.conn is not None:
+                    self.conn.close()
+                    self.conn = None
+
+
+_buckets = {}
+_buckets_lock = threading.Lock()
+
+
+def get_limiter(provider):
+    with _buckets_lock:
+        bucket = _buckets.get(provider)
+        if bucket is None:
+            config = current_app.config
+            rate, burst = config['RATE_LIMITS'][provider]
+            if config['RATE_LIMIT_BACKEND'] == 'postgres':
+                bucket = PostgresTokenBucket(provider, rate, burst, {
+                    'host': config['DB_HOST'],
+                    'database': config['DB_NAME'],
+                    'user': config['DB_USER'],
+                    'password': config['DB_PASSWORD'],
+                })
+            else:
+                bucket = TokenBucket(provider, rate, burst)
+            _buckets[provider] = bucket
+        return bucket
+
+
+def rate_limited_call(provider, func):
+    """Call func() once the provider's bucket allows it, backing off and retrying on RateLimited."""
+    limiter = get_limiter(provider)
+    max_wait = current_app.config['RATE_LIMIT_MAX_WAIT_SECONDS']
+    retries = current_app.config['RATE_LIMIT_MAX_RETRIES']
+    for attempt in range(retries + 1):
+        with span(f"rate_limit {provider}"):
+            limiter.acquire(max_wait)
+        try:
+            with span(f"{provider} request", attempt=attempt + 1):
+                result = func()
+        except RateLimited as e:
+            RATE_LIMIT_THROTTLED.labels(provider).inc()
+            limiter.on_throttle(e.retry_after)
+            logger.warning(f"{provider} throttled (attempt {attempt + 1}/{retries + 1}), "
+                           f"retry after {e.retry_after}s")
+            if attempt == retries:
+                raise
+            continue
+        limiter.on_success()
+        return result
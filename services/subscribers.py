@@ -0,0 +1,375 @@
+import re
+import io
+import csv
+import codecs
+import queue
+import logging
+import threading
+import psycopg2
+from flask import current_app
+from i18n import LANGUAGE_NAMES, TIME_ZONES
+from .database import get_db_connection, get_read_connection
+from .invalidation import publish, USER
+from .metrics import track_db
+
+logger = logging.getLogger('INSTWAVE')
+
+# Bulk subscriber import and export, for onboarding a whole institution at once. An
+# import streams the CSV through a per-row check into a temporary staging table with
+# COPY, validates topic ids and duplicate emails set-wise, and merges the valid rows
+# into users and user_topics in a few statements of one transaction. Rows that fail
+# are reported by line and skipped; the rest are imported. Blank cells keep an
+# existing user's value. Passwords are not imported in plain text, only as Werkzeug
+# hashes, because hashing 100k passwords would take hours.
+
+EMAIL_REGEX = r'^[a-zA-Z0-9_.+-]+@[a-zA-Z0-9-]+\.[a-zA-Z0-9-.]+$'
+IMPORT_COLUMNS = ('email', 'name', 'language', 'notification_method', 'topics', 'active', 'timezone',
+                  'preferred_hour', 'password_hash')
+REQUIRED_COLUMNS = ('email', 'topics')
+NOTIFICATION_METHODS = ('email', 'kakao', 'both')
+TRUE_VALUES = ('true', 't', 'yes', 'y', '1')
+FALSE_VALUES = ('false', 'f', 'no', 'n', '0')
+# users.email, users.name and users.password_hash are VARCHAR(255); topic ids are INTEGER.
+MAX_TEXT_LENGTH = 255
+MAX_TOPIC_ID = 2 ** 31 - 1
+
+
+def _parse_row(values):
+    """Staging values (IMPORT_COLUMNS order, None for blank) of one row; raises ValueError."""
+    row = {column: (values.get(column) or '').strip() or None for column in IMPORT_COLUMNS}
+    if row['email'] is None or not re.match(EMAIL_REGEX, row['email']):
+        raise ValueError('invalid email')
+    for column in ('email', 'name', 'password_hash'):
+        if row[column] is not None and len(row[column]) > MAX_TEXT_LENGTH:
+            raise ValueError(f"{column} is longer than {MAX_TEXT_LENGTH} characters")
+    if row['language'] is not None and row['language'] not in LANGUAGE_NAMES:
+        raise ValueError(f"unsupported language {row['language']!r}")
+    if row['notification_method'] is not None and row['notification_method'] not in NOTIFICATION_METHODS:
+        raise ValueError(f"notification_method must be one of {', '.join(NOTIFICATION_METHODS)}")
+    if not re.fullmatch(r'[\d;\s]+', row['topics'] or '') or not re.search(r'\d', row['topics']):
+        raise ValueError("topics must list topic ids separated by ';'")
+    topics = sorted({int(topic) for topic in re.split(r'[;\s]+', row['topics']) if topic})
+    if not 1 <= topics[0] <= topics[-1] <= MAX_TOPIC_ID:
+        raise ValueError(f"topic ids must be between 1 and {MAX_TOPIC_ID}")
+    row['topics'] = '{' + ','.join(map(str, topics)) + '}'
+    if row['active'] is not None:
+        if row['active'].lower() not in TRUE_VALUES + FALSE_VALUES:
+            raise ValueError('active must be true or false')
+        row['active'] = 't' if row['active'].lower() in TRUE_VALUES else 'f'
+    if row['timezone'] is not None and row['timezone'] not in TIME_ZONES:
+        raise ValueError(f"unsupported timezone {row['timezone']!r}")
+    if row['preferred_hour'] is not None:
+        if not row['preferred_hour'].isdigit() or int(row['preferred_hour']) > 23:
+            raise ValueError('preferred_hour must be 0-23')
+    if row['password_hash'] is not None and row['password_hash'].count('$') != 2:
+        raise ValueError('password_hash must be a Werkzeug password hash')
+    return [row[column] for column in IMPORT_COLUMNS]
+
+
+def decode_lines(stream):
+    """Text lines of a binary UTF-8 stream, decoded line by line so a bad byte is reported on its own line."""
+    return codecs.iterdecode(stream, 'utf-8-sig')
+
+
+def _next_row(reader):
+    try:
+        return next(reader, None)
+    except csv.Error as e:
+        raise ValueError(f"line {reader.line_num}: {e}")
+    except UnicodeDecodeError as e:
+        # The line failed to decode, so the reader has not counted it yet.
+        raise ValueError(f"line {reader.line_num + 1}: not valid UTF-8 ({e.reason})")
+
+
+def _read_header(reader):
+    header = [column.strip().lower() for column in _next_row(reader) or []]
+    unknown = [column for column in header if column not in IMPORT_COLUMNS]
+    if unknown:
+        raise ValueError(f"Unknown columns: {', '.join(unknown)}")
+    missing = [column for column in REQUIRED_COLUMNS if column not in header]
+    if missing:
+        raise ValueError(f"Missing columns: {', '.join(missing)}")
+    if len(set(header)) != len(header):
+        raise ValueError("Duplicate columns")
+    return header
+
+
+def _staging_lines(reader, header):
+    """CSV lines of the staging table: line number, IMPORT_COLUMNS, error."""
+    out = io.StringIO()
+    writer = csv.writer(out)
+    email_at = header.index('email')
+    while (values := _next_row(reader)) is not None:
+        if not any(value.strip() for value in values):
+            continue
+        line = reader.line_num
+        try:
+            if len(values) != len(header):
+                raise ValueError(f"expected {len(header)} fields, got {len(values)}")
+            row, error = _parse_row(dict(zip(header, values))), None
+        except ValueError as e:
+            # Only the email is kept, to identify the row in the report.
+            row, error = [None] * len(IMPORT_COLUMNS), str(e)
+            if email_at < len(values):
+                row[0] = values[email_at]
+        writer.writerow([line] + ['\\N' if value is None else value for value in row]
+                        + ['\\N' if error is None else error])
+        yield out.getvalue()
+        out.seek(0)
+        out.truncate()
+
+
+class _CopySource:
+    """Read-only file over the staging lines, produced as COPY asks for them."""
+
+    def __init__(self, lines):
+        self.lines = lines
+        self.buffer = ''
+        self.error = None
+
+    def read(self, size=-1):
+        while size < 0 or len(self.buffer) < size:
+            try:
+                line = next(self.lines, None)
+            except ValueError as e:
+                self.error = e
+                raise
+            if line is None:
+                break
+            self.buffer += line
+        if size < 0:
+            size = len(self.buffer)
+        chunk, self.buffer = self.buffer[:size], self.buffer[size:]
+        return chunk
+
+
+_MERGE_STATEMENTS = (
+    ('subscribers_import.duplicates', """
+        UPDATE subscriber_import s
+        SET error = 'duplicate email, also on line ' || d.last_line
+        FROM (
+            SELECT line, max(line) OVER (PARTITION BY email) AS last_line
+            FROM subscriber_import WHERE error IS NULL
+        ) d
+        WHERE s.line = d.line AND d.line < d.last_line
+    """),
+    ('subscribers_import.validate_topics', """
+        UPDATE subscriber_import s
+        SET error = 'unknown topic ids: ' || bad.ids
+        FROM (
+            SELECT s.line, string_agg(t.topic_id::text, ', ' ORDER BY t.topic_id) AS ids
+            FROM subscriber_import s
+            CROSS JOIN LATERAL unnest(s.topics) AS t(topic_id)
+            LEFT JOIN topics ON topics.id = t.topic_id
+            WHERE s.error IS NULL AND topics.id IS NULL
+            GROUP BY s.line
+        ) bad
+        WHERE s.line = bad.line
+    """),
+    ('subscribers_import.match_users', """
+        UPDATE subscriber_import s SET user_id = u.id
+        FROM users u
+        WHERE s.error IS NULL AND u.email = s.email
+    """),
+    ('subscribers_import.update_users', """
+        UPDATE users u
+        SET name = COALESCE(s.name, u.name),
+            language = COALESCE(s.language, u.language),
+            notification_method = COALESCE(s.notification_method, u.notification_method),
+            active = COALESCE(s.active, u.active),
+            -- As on the dashboard, the scheduler's own zone is stored as no preference.
+            timezone = CASE WHEN s.timezone IS NULL THEN u.timezone ELSE NULLIF(s.timezone, 'Asia/Seoul') END,
+            preferred_hour = COALESCE(s.preferred_hour, u.preferred_hour),
+            password_hash = COALESCE(s.password_hash, u.password_hash),
+            preferences_updated_at = NOW()
+        FROM subscriber_import s
+        WHERE s.error IS NULL AND s.user_id = u.id
+    """),
+    ('subscribers_import.insert_users', """
+        INSERT INTO users (email, name, language, notification_method, active, timezone, preferred_hour,
+                           password_hash)
+        SELECT email, COALESCE(name, split_part(email, '@', 1)), COALESCE(language, 'en'),
+               COALESCE(notification_method, 'email'), COALESCE(active, TRUE), NULLIF(timezone, 'Asia/Seoul'),
+               preferred_hour, password_hash
+        FROM subscriber_import
+        WHERE error IS NULL AND user_id IS NULL
+        ORDER BY line
+        ON CONFLICT (email) DO NOTHING
+    """),
+    ('subscribers_import.match_users', """
+        UPDATE subscriber_import s SET user_id = u.id
+        FROM users u
+        WHERE s.error IS NULL AND s.user_id IS NULL AND u.email = s.email
+    """),
+    ('subscribers_import.replace_topics', """
+        DELETE FROM user_topics ut
+        USING subscriber_import s
+        WHERE s.error IS NULL AND ut.user_id = s.user_id
+    """),
+    ('subscribers_import.replace_topics', """
+        INSERT INTO user_topics (user_id, topic_id)
+        SELECT s.user_id, t.topic_id
+        FROM subscriber_import s
+        CROSS JOIN LATERAL unnest(s.topics) AS t(topic_id)
+        WHERE s.error IS NULL
+        ORDER BY s.user_id, t.topic_id
+    """),
+)
+
+
+def import_subscribers(file, validate_only=False):
+    """Import subscribers from a CSV text file with a header row of IMPORT_COLUMNS.
+
+    Returns counts and every rejected row as {'line', 'email', 'error'}. Raises ValueError
+    for a header it cannot use or a line that is not valid CSV or UTF-8. With validate_only
+    nothing is written.
+    """
+    reader = csv.reader(file)
+    header = _read_header(reader)
+    conn = get_db_connection()
+    cur = conn.cursor()
+    try:
+        cur.execute("""
+            CREATE TEMP TABLE subscriber_import (
+                line INTEGER PRIMARY KEY,
+                email TEXT,
+                name TEXT,
+                language TEXT,
+                notification_method TEXT,
+                topics INTEGER[],
+                active BOOLEAN,
+                timezone TEXT,
+                preferred_hour SMALLINT,
+                password_hash TEXT,
+                error TEXT,
+                user_id INTEGER
+            ) ON COMMIT DROP
+        """)
+        source = _CopySource(_staging_lines(reader, header))
+        with track_db('subscribers_import.copy'):
+            try:
+                cur.copy_expert(
+                    f"COPY subscriber_import (line, {', '.join(IMPORT_COLUMNS)}, error) "
+                    f"FROM STDIN WITH (FORMAT csv, NULL '\\N')",
+                    source
+                )
+            except psycopg2.Error:
+                # psycopg2 reports a failed read() as an aborted COPY; raise the file's own error.
+                if source.error is not None:
+                    raise source.error from None
+                raise
+            cur.execute("ANALYZE subscriber_import")
+        counts = {}
+        for call_site, statement in _MERGE_STATEMENTS[:2 if validate_only else None]:
+            with track_db(call_site):
+                cur.execute(statement)
+            counts[call_site] = cur.rowcount
+        cur.execute("SELECT count(*) FROM subscriber_import")
+        rows = cur.fetchone()[0]
+        cur.execute("SELECT line, email, error FROM subscriber_import WHERE error IS NOT NULL ORDER BY line")
+        errors = [{'line': line, 'email': email, 'error': error} for line, email, error in cur.fetchall()]
+        if validate_only:
+            conn.rollback()
+        else:
+            # One event for the whole import: every process drops its cached users.
+            publish(cur, USER)
+            conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+        conn.close()
+    report = {
+        'rows': rows,
+        'valid': rows - len(errors),
+        'inserted': counts.get('subscribers_import.insert_users', 0),
+        'updated': counts.get('subscribers_import.update_users', 0),
+        'failed': len(errors),
+        'errors': errors,
+        'validate_only': validate_only
+    }
+    logger.info(f"Subscriber import: {report['rows']} rows, {report['inserted']} inserted, "
+                f"{report['updated']} updated, {report['failed']} rejected"
+                + (" (validated only)" if validate_only else ""))
+    return report
+
+
+_EXPORT_SQL = """
+    COPY (
+        SELECT u.email, u.name, u.language, u.notification_method, array_to_string(t.topics, ';') AS topics,
+               u.active, u.timezone, u.preferred_hour
+        FROM users u
+        LEFT JOIN (
+            SELECT user_id, array_agg(topic_id ORDER BY topic_id) AS topics
+            FROM user_topics GROUP BY user_id
+        ) t ON t.user_id = u.id
+        ORDER BY u.id
+    ) TO STDOUT WITH (FORMAT csv, HEADER, NULL '')
+"""
+
+
+def export_subscribers(file):
+    """Write every user as CSV in the import format (without password hashes) to file."""
+    conn = get_read_connection()
+    cur = conn.cursor()
+    try:
+        with track_db('subscribers_export'):
+            cur.copy_expert(_EXPORT_SQL, file)
+    finally:
+        cur.close()
+        conn.close()
+
+
+class _ExportAborted(Exception):
+    pass
+
+
+def stream_subscribers():
+    """The export as an iterator of byte chunks, for a streamed HTTP response.
+
+    COPY runs on its own thread and hands chunks over a bounded queue; closing the
+    iterator (the client went away) aborts it.
+    """
+    app = current_app._get_current_object()
+    chunks = queue.Queue(maxsize=64)
+    stop = threading.Event()
+
+    class Sink:
+        def write(self, data):
+            while not stop.is_set():
+                try:
+                    chunks.put(data, timeout=1)
+                    return
+                except queue.Full:
+                    continue
+            raise _ExportAborted()
+
+    def copy():
+        try:
+            with app.app_context():
+                export_subscribers(Sink())
+            result = None
+        except _ExportAborted:
+            return
+        except Exception as e:
+            logger.error(f"Subscriber export failed: {str(e)}")
+            result = e
+        while not stop.is_set():
+            try:
+                chunks.put(result, timeout=1)
+                return
+            except queue.Full:
+                continue
+
+    threading.Thread(target=copy, name='subscriber-export', daemon=True).start()
+    try:
+        while True:
+            chunk = chunks.get()
+            if chunk is None:
+                return
+            if isinstance(chunk, Exception):
+                raise chunk
+            yield chunk
+    finally:
+        stop.set()
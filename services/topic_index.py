@@ -0,0 +1,234 @@
+import sys
+import heapq
+import logging
+from datetime import datetime, timedelta
+from flask import current_app
+from .catalog import HydratedPapers
+from .database import get_db_connection
+from .invalidation import LocalCache, PAPERS, CATEGORY_MAPPING
+from .metrics import track_db
+
+logger = logging.getLogger('INSTWAVE')
+
+# Per-topic top-K lists of each digest week's papers, persisted in topic_top_papers. The
+# digest sent on Tuesday W covers papers created on W-7 .. W-1. Each list holds the
+# TOPIC_INDEX_SIZE most important near-duplicate clusters of a topic, a cluster being
+# represented by its most important paper of the week. generate_ai_summaries and the
+# near-duplicate index update the lists in the transaction that changes a paper, and a
+# week is rebuilt from thesis the first time it is read, so it rolls over on its own.
+# A user's papers are a k-way merge of their topics' lists: a paper in the user's top
+# `limit` is also in the top `limit` of its own topic, so the merge needs nothing else.
+
+RETAIN_WEEKS = 4
+
+
+def index_week(created_at):
+    """The Tuesday whose digest covers a paper created at created_at."""
+    day = created_at.date() if isinstance(created_at, datetime) else created_at
+    return day + timedelta(days=(7 - day.weekday()) % 7 + 1)
+
+
+def current_week(now=None):
+    """The Tuesday of the digest that is being, or was last, sent."""
+    today = (now or datetime.now()).date()
+    return today - timedelta(days=(today.weekday() - 1) % 7)
+
+
+def week_bounds(week):
+    end = datetime(week.year, week.month, week.day)
+    return end - timedelta(days=7), end
+
+
+# Fills the lists of one week from thesis; %(topics)s NULL means every topic.
+_FILL_SQL = """
+    INSERT INTO topic_top_papers (week, topic_id, cluster_id, paper_id, importance)
+    SELECT %(week)s, topic_id, cluster_id, id, importance
+    FROM (
+        SELECT r.cluster_id, r.id, r.importance, t.topic_id,
+               row_number() OVER (PARTITION BY t.topic_id ORDER BY r.importance DESC, r.id) AS rank
+        FROM (
+            SELECT DISTINCT ON (COALESCE(dup_of, id))
+                   COALESCE(dup_of, id) AS cluster_id, id,
+                   COALESCE(instwave_importance(ai_summary), 0) AS importance,
+                   instwave_category_topics(top_categories) AS topics
+            FROM thesis
+            WHERE created_at >= %(start)s AND created_at < %(end)s
+            AND ai_summary IS NOT NULL
+            ORDER BY COALESCE(dup_of, id), instwave_importance(ai_summary) DESC, id
+        ) r
+        CROSS JOIN LATERAL unnest(r.topics) AS t(topic_id)
+        WHERE %(topics)s::int[] IS NULL OR t.topic_id = ANY(%(topics)s::int[])
+    ) ranked
+    WHERE rank <= %(size)s
+    ON CONFLICT (week, topic_id, cluster_id) DO UPDATE
+    SET paper_id = EXCLUDED.paper_id, importance = EXCLUDED.importance
+"""
+
+
+def rebuild_week(cur, week, size):
+    """Recompute a week's lists from thesis; the caller commits."""
+    start, end = week_bounds(week)
+    cur.execute("""
+        INSERT INTO topic_index_weeks (week, built_at) VALUES (%s, NOW())
+        ON CONFLICT (week) DO UPDATE SET built_at = NOW()
+    """, (week,))
+    cur.execute("DELETE FROM topic_top_papers WHERE week = %s", (week,))
+    cur.execute(_FILL_SQL, {'week': week, 'start': start, 'end': end, 'topics': None, 'size': size})
+    entries = cur.rowcount
+    cur.execute("DELETE FROM topic_top_papers WHERE week < %s", (week - timedelta(weeks=RETAIN_WEEKS),))
+    cur.execute("DELETE FROM topic_index_weeks WHERE week < %s", (week - timedelta(weeks=RETAIN_WEEKS),))
+    return entries
+
+
+def update_topic_index(cur, thesis_id):
+    """Re-derive the entries of thesis_id's cluster in its week, inside the caller's
+    transaction. Returns whether a current or upcoming digest week was affected."""
+    size = current_app.config['TOPIC_INDEX_SIZE']
+    cur.execute("SELECT created_at, COALESCE(dup_of, id) FROM thesis WHERE id = %s", (thesis_id,))
+    row = cur.fetchone()
+    if row is None:
+        return False
+    created_at, cluster_id = row
+    week = index_week(created_at)
+    if week < current_week():
+        return False
+    start, end = week_bounds(week)
+    with track_db('topic_index.update'):
+        cur.execute("""
+            SELECT id, COALESCE(instwave_importance(ai_summary), 0), instwave_category_topics(top_categories)
+            FROM thesis
+            WHERE (id = %s OR dup_of = %s)
+            AND created_at >= %s AND created_at < %s
+            AND ai_summary IS NOT NULL
+            ORDER BY instwave_importance(ai_summary) DESC, id
+            LIMIT 1
+        """, (cluster_id, cluster_id, start, end))
+        representative = cur.fetchone()
+        cur.execute("""
+            DELETE FROM topic_top_papers
+            WHERE week = %s AND (cluster_id = %s OR paper_id = %s)
+            RETURNING topic_id
+        """, (week, cluster_id, thesis_id))
+        removed = {topic_id for (topic_id,) in cur.fetchall()}
+        topics = set()
+        if representative is not None:
+            paper_id, importance, topics = representative
+            topics = set(topics or ())
+            cur.execute("""
+                INSERT INTO topic_top_papers (week, topic_id, cluster_id, paper_id, importance)
+                SELECT %s, topic_id, %s, %s, %s FROM unnest(%s::int[]) AS t(topic_id)
+                ON CONFLICT (week, topic_id, cluster_id) DO UPDATE
+                SET paper_id = EXCLUDED.paper_id, importance = EXCLUDED.importance
+            """, (week, cluster_id, paper_id, importance, list(topics)))
+            cur.execute("""
+                DELETE FROM topic_top_papers d
+                USING (
+                    SELECT topic_id, cluster_id,
+                           row_number() OVER (PARTITION BY topic_id ORDER BY importance DESC, paper_id) AS rank
+                    FROM topic_top_papers
+                    WHERE week = %s AND topic_id = ANY(%s)
+                ) r
+                WHERE d.week = %s AND d.topic_id = r.topic_id AND d.cluster_id = r.cluster_id
+                AND r.rank > %s
+            """, (week, list(topics), week, size))
+        # A topic that lost its entry may have been full; refill it from thesis.
+        lost = sorted(removed - topics)
+        if lost:
+            cur.execute("DELETE FROM topic_top_papers WHERE week = %s AND topic_id = ANY(%s)", (week, lost))
+            cur.execute(_FILL_SQL, {'week': week, 'start': start, 'end': end, 'topics': lost, 'size': size})
+    return bool(removed or topics)
+
+
+def _load_rows(week, size):
+    conn = get_db_connection()
+    cur = conn.cursor()
+    try:
+        with track_db('topic_index.ensure_week'):
+            cur.execute("SELECT 1 FROM topic_index_weeks WHERE week = %s", (week,))
+            if cur.fetchone() is None:
+                entries = rebuild_week(cur, week, size)
+                conn.commit()
+                logger.info(f"Topic index for {week} built: {entries} entries")
+        with track_db('topic_index.load'):
+            cur.execute("SELECT topic_id, paper_id, importance FROM topic_top_papers WHERE week = %s", (week,))
+            return cur.fetchall()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+        conn.close()
+
+
+class TopicIndex(HydratedPapers):
+    def __init__(self, week, rows, size):
+        """rows: (topic_id, paper_id, importance) for each list entry of the week."""
+        super().__init__()
+        self.week = week
+        self.size = size
+        self.window = week_bounds(week)
+        lists = {}
+        for topic_id, paper_id, importance in rows:
+            lists.setdefault(topic_id, []).append((-importance, paper_id))
+        for entries in lists.values():
+            entries.sort()
+        self.lists = lists
+
+    @classmethod
+    def load(cls, week=None):
+        """A week's lists (this digest's by default), building them first if needed.
+        Raises on database errors rather than returning an empty index."""
+        week = week or current_week()
+        size = current_app.config['TOPIC_INDEX_SIZE']
+        return cls(week, _load_rows(week, size), size)
+
+    def __len__(self):
+        return len({paper_id for entries in self.lists.values() for _, paper_id in entries})
+
+    def top_ids(self, topics, limit=3):
+        """Ids of the `limit` most important papers sharing a topic with topics."""
+        if limit > self.size:
+            raise ValueError(f"limit {limit} exceeds TOPIC_INDEX_SIZE {self.size}")
+        topic_ids = frozenset(int(topic) for topic in topics or ())
+        key = (topic_ids, limit)
+        picked = self._picks.get(key)
+        if picked is None:
+            picked = []
+            for _, paper_id in heapq.merge(*(self.lists[topic] for topic in topic_ids if topic in self.lists)):
+                # A paper with several of the user's topics appears in each of their lists.
+                if paper_id not in picked:
+                    picked.append(paper_id)
+                    if len(picked) == limit:
+                        break
+            picked = self._picks[key] = tuple(picked)
+        return picked
+
+    def memory_report(self):
+        entries = sum(len(entries) for entries in self.lists.values())
+        list_bytes = sum(sys.getsizeof(entries) + sum(sys.getsizeof(entry) for entry in entries)
+                         for entries in self.lists.values())
+        return {
+            'week': str(self.week),
+            'topics': len(self.lists),
+            'entries': entries,
+            'papers': len(self),
+            'list_bytes': list_bytes,
+            'hydrated_papers': len(self.records),
+            'cached_selections': len(self._picks)
+        }
+
+
+_indexes = LocalCache('topic_index', [PAPERS, CATEGORY_MAPPING])
+
+
+def current_index():
+    """This digest week's TopicIndex, shared by the process until its papers change."""
+    week = current_week()
+    return _indexes.get(week, lambda: TopicIndex.load(week))
+
+
+def week_top_papers(topics, limit=3):
+    """A user's digest papers for this week; raises on database errors."""
+    index = current_index()
+    index.hydrate([topics], limit)
+    return index.papers_for(topics, limit)
@@ -0,0 +1,280 @@
+import os
+import json
+import time
+import queue
+import random
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+from functools import wraps
+import requests
+from flask import g, request
+
+logger = logging.getLogger('INSTWAVE')
+
+# Spans form trees through a context variable: whatever span is open in the current
+# thread (or asyncio task) becomes the parent of the next one. The sampling decision
+# is made once per root, or per subtree when span() is given a sample_rate, and an
+# unsampled subtree costs one ContextVar set/reset per span.
+
+_current = contextvars.ContextVar('instwave_span', default=None)
+_SUPPRESSED = object()
+
+
+class _Settings:
+    enabled = False
+    sample_rate = 1.0
+    max_spans_per_trace = 10000
+    exporter = None
+
+
+_settings = _Settings()
+
+
+class _Trace:
+    __slots__ = ('trace_id', 'span_count', 'dropped')
+
+    def __init__(self):
+        self.trace_id = os.urandom(16).hex()
+        self.span_count = 0
+        self.dropped = 0
+
+
+class Span:
+    __slots__ = ('trace', 'span_id', 'parent_id', 'name', 'start_ns', 'end_ns', 'attributes', 'error')
+
+    def __init__(self, trace, parent_id, name, attributes):
+        self.trace = trace
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.name = name
+        self.attributes = attributes
+        self.error = None
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def to_dict(self):
+        return {
+            'trace_id': self.trace.trace_id,
+            'span_id': self.span_id,
+            'parent_id': self.parent_id,
+            'name': self.name,
+            'start_ns': self.start_ns,
+            'end_ns': self.end_ns,
+            'duration_ms': round((self.end_ns - self.start_ns) / 1e6, 3),
+            'attributes': self.attributes,
+            'error': self.error
+        }
+
+
+def start_span(name, sample_rate=None, **attributes):
+    """Open a span under the current one and make it current.
+
+    Returns (span, token); span is None when tracing is off or the span was not
+    sampled. Always pass both to end_span().
+    """
+    parent = _current.get()
+    if not _settings.enabled or parent is _SUPPRESSED:
+        return None, None
+    if sample_rate is None and parent is None:
+        sample_rate = _settings.sample_rate
+    if sample_rate is not None and sample_rate < 1.0 and random.random() >= sample_rate:
+        return None, _current.set(_SUPPRESSED)
+    trace = parent.trace if parent is not None else _Trace()
+    if trace.span_count >= _settings.max_spans_per_trace:
+        trace.dropped += 1
+        return None, _current.set(_SUPPRESSED)
+    trace.span_count += 1
+    span = Span(trace, parent.span_id if parent is not None else None, name, attributes)
+    return span, _current.set(span)
+
+
+def end_span(span, token, error=None):
+    if token is not None:
+        try:
+            _current.reset(token)
+        except ValueError:
+            # Token from another context (e.g. a request torn down elsewhere); nothing to restore.
+            pass
+    if span is None:
+        return
+    span.end_ns = time.time_ns()
+    if error is not None:
+        span.error = f"{type(error).__name__}: {error}"
+    if span.parent_id is None and span.trace.dropped:
+        span.attributes['dropped_spans'] = span.trace.dropped
+    _settings.exporter.export(span)
+
+
+@contextmanager
+def span(name, sample_rate=None, **attributes):
+    current, token = start_span(name, sample_rate, **attributes)
+    try:
+        yield current
+    except BaseException as e:
+        end_span(current, token, e)
+        raise
+    end_span(current, token)
+
+
+def traced(name):
+    """Decorator form of span() for functions that are a stage of their own."""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class FileSink:
+    """Appends one JSON object per span to a local file."""
+
+    def __init__(self, path):
+        self.path = path
+
+    def write(self, spans):
+        with open(self.path, 'a', encoding='utf-8') as f:
+            for s in spans:
+                f.write(json.dumps(s.to_dict(), default=str) + '\n')
+
+
+class OTLPSink:
+    """Posts spans as OTLP/HTTP JSON to a collector's /v1/traces endpoint."""
+
+    def __init__(self, endpoint, service_name):
+        self.endpoint = endpoint
+        self.service_name = service_name
+        self.session = requests.Session()
+
+    @staticmethod
+    def _attributes(attributes):
+        result = []
+        for key, value in attributes.items():
+            if isinstance(value, bool):
+                encoded = {'boolValue': value}
+            elif isinstance(value, int):
+                encoded = {'intValue': str(value)}
+            elif isinstance(value, float):
+                encoded = {'doubleValue': value}
+            else:
+                encoded = {'stringValue': str(value)}
+            result.append({'key': key, 'value': encoded})
+        return result
+
+    def _encode(self, s):
+        encoded = {
+            'traceId': s.trace.trace_id,
+            'spanId': s.span_id,
+            'name': s.name,
+            'kind': 1,
+            'startTimeUnixNano': str(s.start_ns),
+            'endTimeUnixNano': str(s.end_ns),
+            'attributes': self._attributes(s.attributes),
+            'status': {'code': 2, 'message': s.error} if s.error else {'code': 1}
+        }
+        if s.parent_id:
+            encoded['parentSpanId'] = s.parent_id
+        return encoded
+
+    def write(self, spans):
+        payload = {'resourceSpans': [{
+            'resource': {'attributes': self._attributes({'service.name': self.service_name})},
+            'scopeSpans': [{'scope': {'name': 'instwave'}, 'spans': [self._encode(s) for s in spans]}]
+        }]}
+        response = self.session.post(self.endpoint, json=payload, timeout=5)
+        response.raise_for_status()
+
+
+class BatchExporter:
+    """Buffers finished spans and hands them to the sink from a background thread.
+
+    Spans are dropped rather than blocking the caller when the buffer is full.
+    """
+
+    def __init__(self, sink, max_queue=20000, batch_size=512, flush_seconds=2.0):
+        self.sink = sink
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.dropped = 0
+        self.thread = threading.Thread(target=self._run, name='trace-exporter', daemon=True)
+        self.thread.start()
+
+    def export(self, s):
+        try:
+            self.queue.put_nowait(s)
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self):
+        while True:
+            batch = []
+            deadline = time.monotonic() + self.flush_seconds
+            while len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self.queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            if not batch:
+                continue
+            try:
+                self.sink.write(batch)
+            except Exception as e:
+                logger.warning(f"Dropped {len(batch)} trace spans: {str(e)}")
+
+    def flush(self, timeout=10.0):
+        """Wait until the buffer has drained (used by short-lived scripts before exit)."""
+        deadline = time.monotonic() + timeout
+        while not self.queue.empty() and time.monotonic() < deadline:
+            time.sleep(0.05)
+        time.sleep(min(self.flush_seconds, max(0.0, deadline - time.monotonic())))
+
+
+def init_tracing(app):
+    """Configure the exporter from app.config and trace every Flask request."""
+    exporter = app.config['TRACING_EXPORTER']
+    if exporter == 'file':
+        sink = FileSink(app.config['TRACING_FILE'])
+    elif exporter == 'otlp':
+        sink = OTLPSink(app.config['TRACING_OTLP_ENDPOINT'], app.config['TRACING_SERVICE_NAME'])
+    else:
+        _settings.enabled = False
+        return
+    _settings.exporter = BatchExporter(sink)
+    _settings.sample_rate = app.config['TRACING_SAMPLE_RATE']
+    _settings.max_spans_per_trace = app.config['TRACING_MAX_SPANS_PER_TRACE']
+    _settings.enabled = True
+
+    @app.before_request
+    def _start_request_span():
+        rule = request.url_rule.rule if request.url_rule else request.path
+        g._trace_span = start_span(f"{request.method} {rule}", **{'http.method': request.method,
+                                                                   'http.route': rule})
+
+    @app.after_request
+    def _tag_request_span(response):
+        current, _ = g.get('_trace_span', (None, None))
+        if current is not None:
+            current.set_attribute('http.status_code', response.status_code)
+        return response
+
+    @app.teardown_request
+    def _end_request_span(error=None):
+        current, token = g.pop('_trace_span', (None, None))
+        end_span(current, token, error)
+
+    logger.info(f"Tracing enabled ({exporter}, sample rate {_settings.sample_rate})")
+
+
+def flush_traces(timeout=10.0):
+    if _settings.enabled:
+        _settings.exporter.flush(timeout)
@@ -0,0 +1,157 @@
+import json
+import time
+import random
+import logging
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from flask import current_app
+
+logger = logging.getLogger('INSTWAVE')
+
+# EmailService and KakaoService render a message and hand it to a transport. The live
+# transports call Resend and the Kakao memo API; the sinks below accept the same
+# messages without contacting anyone, so a whole dispatch can be rehearsed against real
+# users and papers. A sink is chosen per process with DELIVERY_TRANSPORT or for one
+# block of code with use_transport(), which is how dry runs stay out of real sends
+# running on other threads.
+
+LIVE = 'live'
+RECORD = 'record'
+SIMULATE = 'simulate'
+TRANSPORTS = (LIVE, RECORD, SIMULATE)
+SECRET_FIELDS = ('access_token',)
+
+_override = ContextVar('delivery_transport', default=None)
+
+
+class Transport:
+    """Delivers one rendered message; send() returns True when the provider accepted it."""
+    live = False
+
+    def send(self, provider, message):
+        raise NotImplementedError
+
+
+class RecordingTransport(Transport):
+    """Accepts every message, counting them per provider and keeping the first few.
+
+    With path, every message is also appended to that file as JSON lines.
+    """
+
+    def __init__(self, keep=20, path=None):
+        self.keep = keep
+        self.path = path
+        self.messages = []
+        self.counts = {}
+        self.failures = {}
+        self.bytes = {}
+        self.seconds = {}
+        self.lock = threading.Lock()
+        self._file = open(path, 'a', encoding='utf-8') if path else None
+
+    def send(self, provider, message):
+        started_at = time.perf_counter()
+        accepted = self._deliver(provider, message)
+        # Credentials never reach the recording.
+        message = {key: value for key, value in message.items() if key not in SECRET_FIELDS}
+        line = json.dumps({'provider': provider, 'accepted': accepted, 'message': message},
+                          ensure_ascii=False, default=str)
+        with self.lock:
+            self.counts[provider] = self.counts.get(provider, 0) + 1
+            if not accepted:
+                self.failures[provider] = self.failures.get(provider, 0) + 1
+            self.bytes[provider] = self.bytes.get(provider, 0) + len(line.encode('utf-8'))
+            self.seconds[provider] = self.seconds.get(provider, 0.0) + time.perf_counter() - started_at
+            if len(self.messages) < self.keep:
+                self.messages.append({'provider': provider, 'accepted': accepted, 'message': message})
+            if self._file:
+                self._file.write(line + '\n')
+        return accepted
+
+    def _deliver(self, provider, message):
+        return True
+
+    def close(self):
+        if self._file:
+            self._file.close()
+            self._file = None
+
+    def report(self):
+        with self.lock:
+            return {
+                provider: {
+                    'messages': count,
+                    'failures': self.failures.get(provider, 0),
+                    'avg_bytes': round(self.bytes[provider] / count),
+                    'seconds': round(self.seconds[provider], 3)
+                }
+                for provider, count in sorted(self.counts.items())
+            }
+
+
+class SimulatedTransport(RecordingTransport):
+    """A RecordingTransport that waits like a provider would and fails a seeded fraction."""
+
+    def __init__(self, latency_ms=None, jitter_ms=0, error_rate=0.0, seed=0, **kwargs):
+        super().__init__(**kwargs)
+        # {provider: milliseconds}, or one number for every provider.
+        self.latency_ms = latency_ms or {}
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+
+    def _deliver(self, provider, message):
+        latency = self.latency_ms if isinstance(self.latency_ms, (int, float)) else self.latency_ms.get(provider, 0)
+        with self.lock:
+            jitter = self.random.uniform(-self.jitter_ms, self.jitter_ms) if self.jitter_ms else 0
+            failed = self.random.random() < self.error_rate
+        if latency + jitter > 0:
+            time.sleep((latency + jitter) / 1000.0)
+        return not failed
+
+
+def build_transport(kind, latency_ms=None, jitter_ms=None, error_rate=None, path=None):
+    """A sink from config defaults; LIVE returns None, meaning each service's own transport."""
+    config = current_app.config
+    if kind == LIVE:
+        return None
+    if kind == RECORD:
+        return RecordingTransport(path=path)
+    if kind == SIMULATE:
+        return SimulatedTransport(
+            latency_ms=latency_ms if latency_ms is not None else config['SIMULATED_LATENCY_MS'],
+            jitter_ms=jitter_ms if jitter_ms is not None else config['SIMULATED_JITTER_MS'],
+            error_rate=error_rate if error_rate is not None else config['SIMULATED_ERROR_RATE'],
+            path=path
+        )
+    raise ValueError(f"Unknown delivery transport: {kind}")
+
+
+_configured = {}
+_configured_lock = threading.Lock()
+
+
+def get_transport(live):
+    """The transport a service should send through: use_transport()'s, else DELIVERY_TRANSPORT's, else live."""
+    override = _override.get()
+    if override is not None:
+        return override
+    kind = current_app.config['DELIVERY_TRANSPORT']
+    if kind == LIVE:
+        return live
+    with _configured_lock:
+        if kind not in _configured:
+            logger.warning(f"DELIVERY_TRANSPORT={kind}: digests are not sent to providers")
+            _configured[kind] = build_transport(kind)
+        return _configured[kind]
+
+
+@contextmanager
+def use_transport(transport):
+    """Send everything in this block (and this context only) through transport."""
+    token = _override.set(transport)
+    try:
+        yield transport
+    finally:
+        _override.reset(token)
@@ -0,0 +1,10 @@
+setTimeout(() => {
+    const messages = document.querySelectorAll('.flash-message');
+    messages.forEach(msg => {
+        msg.style.animation = 'fadeOut 0.3s forwards';
+        setTimeout(() => msg.remove(), 300);
+    });
+}, 5000);
+function changeLanguage(lang) {
+    window.location.href = `/change_language/${lang}`;
+}
@@ -0,0 +1,43 @@
+(function () {
+    const form = document.getElementById('send-now-form');
+    const button = document.getElementById('send-now-btn');
+    const status = document.getElementById('send-now-status');
+    function show(messages) {
+        status.innerHTML = '';
+        messages.forEach(m => {
+            const line = document.createElement('div');
+            line.className = 'flash-' + m.category;
+            line.textContent = m.message;
+            status.appendChild(line);
+        });
+    }
+    function poll(url) {
+        fetch(url, {headers: {'Accept': 'application/json'}})
+            .then(r => r.json())
+            .then(job => {
+                if (job.status === 'queued' || job.status === 'running') {
+                    setTimeout(() => poll(url), 2000);
+                    return;
+                }
+                button.disabled = false;
+                show(job.messages || []);
+            })
+            .catch(() => { button.disabled = false; });
+    }
+    form.addEventListener('submit', function (event) {
+        event.preventDefault();
+        button.disabled = true;
+        status.textContent = form.dataset.inProgress;
+        fetch(form.action, {method: 'POST', headers: {'Accept': 'application/json'}})
+            .then(r => r.json())
+            .then(data => {
+                if (data.status_url) {
+                    poll(data.status_url);
+                } else {
+                    button.disabled = false;
+                    show([{category: 'info', message: data.message || data.error}]);
+                }
+            })
+            .catch(() => { button.disabled = false; });
+    });
+})();